@@ -0,0 +1,424 @@
+import contextlib
+import datetime
+import threading
+import time
+from collections import OrderedDict
+import flask
+import numpy as np
+import pandas as pd
+from . import lookup_utilities, materialization, synapse_cache, synapse_utilities
+
+# table holding cell type tags keyed by root id #
+CELL_TYPE_TABLE = "neuron_information_v2"
+
+# seconds after which an index is reloaded in full instead of rolled forward, #
+# so annotations removed from the table also drop out #
+FULL_RELOAD_SECONDS = 24 * 3600
+
+# root ids per query when re-reading annotations on edited roots #
+DELTA_BATCH_SIZE = 10000
+
+# seconds to wait after a failed build before trying again #
+BUILD_RETRY_SECONDS = 300
+
+# most indexes kept at once, the least recently used dropped first #
+MAX_INDEXES = 32
+
+# label of roots without a cell type tag #
+UNTYPED = "untyped"
+
+# label of roots whose types can't be read until the first index is built #
+PENDING = "pending"
+
+# indexes keyed by (datastack, server_address, token scope), so each user #
+# only sees annotations read with their own token #
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+# running build threads and times of failed builds, keyed like _indexes #
+_builds = {}
+_build_failures = {}
+
+
+class IndexPendingError(LookupError):
+    """Raised when cell types are read before the first index is built."""
+
+
+class CellTypeIndex:
+    """Cell type tags of every annotated root at one materialization version.
+
+    Supports bulk lookups by root id and reverse lookups by tag, and can be
+    rolled forward to a newer version using only the annotations that changed.
+    """
+
+    def __init__(self, type_df, version, timestamp, loaded=None):
+        """Index a cell type table.
+
+        Keyword Arguments:
+        type_df -- rows of the cell type table with "id", "pt_root_id", and "tag" (dataframe)
+        version -- materialization version of the rows (int)
+        timestamp -- utc timestamp of that version (datetime object)
+        loaded -- time.monotonic() of the last full load, now if None (float, default None)
+        """
+        type_df = type_df[["id", "pt_root_id", "tag"]].drop_duplicates(
+            subset="id", keep="last"
+        )
+        self.type_df = type_df.astype({"id": np.int64, "pt_root_id": np.int64})
+        self.type_df = self.type_df.sort_values("id").reset_index(drop=True)
+        self.version = version
+        self.timestamp = timestamp
+        self.loaded = time.monotonic() if loaded is None else loaded
+        self._roots_by_tag = None
+
+    def __len__(self):
+        return len(self.type_df)
+
+    def _rows(self, root_ids):
+        """Get the rows tagging any of a list of root ids.
+
+        Keyword Arguments:
+        root_ids -- root ids (list of ints)
+        """
+        root_ids = np.asarray([int(x) for x in root_ids], dtype=np.int64)
+        return self.type_df[self.type_df["pt_root_id"].isin(root_ids)]
+
+    def mainTypes(self, root_ids):
+        """Get each root's most common tag, alphabetical on ties, UNTYPED if it has none.
+
+        Keyword Arguments:
+        root_ids -- root ids (list of ints)
+        """
+        top = (
+            self._rows(root_ids)
+            .groupby(["pt_root_id", "tag"])
+            .size()
+            .reset_index(name="count")
+            .sort_values(["pt_root_id", "count", "tag"], ascending=[True, False, True])
+            .drop_duplicates(subset="pt_root_id")
+        )
+        top = dict(zip(top["pt_root_id"].tolist(), top["tag"]))
+        return {int(x): top.get(int(x), UNTYPED) for x in root_ids}
+
+    def rootsOfType(self, tag):
+        """Get the roots carrying a tag, in ascending order.
+
+        Keyword Arguments:
+        tag -- cell type tag (str)
+        """
+        if self._roots_by_tag is None:
+            self._roots_by_tag = {
+                x: np.unique(y.to_numpy()).tolist()
+                for x, y in self.type_df.groupby("tag")["pt_root_id"]
+            }
+        return list(self._roots_by_tag.get(tag, []))
+
+    def tags(self, root_ids):
+        """Get each root's unique tags in the order they were added, [] if it has none.
+
+        Keyword Arguments:
+        root_ids -- root ids (list of ints)
+        """
+        rows = self._rows(root_ids).drop_duplicates(subset=["pt_root_id", "tag"])
+        found = rows.groupby("pt_root_id", sort=False)["tag"].agg(list).to_dict()
+        return {int(x): found.get(int(x), []) for x in root_ids}
+
+    def withChanges(self, retired_roots, changed_df, version, timestamp):
+        """Get a new index rolled forward with the annotations that changed since this one.
+
+        Keyword Arguments:
+        retired_roots -- roots that stopped being current since this version (list of ints)
+        changed_df -- new rows and rows on new roots at the newer version (dataframe)
+        version -- newer materialization version (int)
+        timestamp -- utc timestamp of the newer version (datetime object)
+        """
+        kept_df = self.type_df[
+            ~self.type_df["pt_root_id"].isin(np.asarray(retired_roots, dtype=np.int64))
+        ]
+        return CellTypeIndex(
+            pd.concat([kept_df, changed_df], ignore_index=True),
+            version,
+            timestamp,
+            loaded=self.loaded,
+        )
+
+
+def _awareUtc(stamp):
+    """Mark a naive utc timestamp as utc for services that read naive times as local.
+
+    Keyword Arguments:
+    stamp -- naive utc timestamp (datetime object)
+    """
+    return stamp.replace(tzinfo=datetime.timezone.utc)
+
+
+def _buildIndex(key, index, config, version, app, auth_token):
+    """Build the index of a version in the background and publish it when done.
+
+    Rolls the previous index forward when possible, and otherwise reloads it
+    in full. Runs inside an app context carrying the auth token of the
+    request that started it, like a request would.
+
+    Keyword Arguments:
+    key -- (datastack, server_address, token scope) of the index (tuple)
+    index -- previous index, or None (CellTypeIndex)
+    config -- config settings (dict)
+    version -- materialization version to build (int)
+    app -- flask app the build was started from, or None outside of a request
+    auth_token -- auth token of the request that started the build (str)
+    """
+    new_index = None
+    context = app.app_context() if app is not None else contextlib.nullcontext()
+    with context:
+        if app is not None:
+            flask.g.auth_token = auth_token
+        try:
+            if index is None or time.monotonic() - index.loaded > FULL_RELOAD_SECONDS:
+                new_index = _loadIndex(config, version)
+            else:
+                try:
+                    new_index = _updateIndex(index, config, version)
+                except Exception:
+                    new_index = _loadIndex(config, version)
+        except Exception:
+            pass
+        finally:
+            with _indexes_lock:
+                if new_index is not None:
+                    _indexes[key] = new_index
+                    _indexes.move_to_end(key)
+                    while len(_indexes) > MAX_INDEXES:
+                        _indexes.popitem(last=False)
+                else:
+                    _build_failures[key] = time.monotonic()
+                _builds.pop(key, None)
+
+
+def _loadIndex(config, version):
+    """Read the whole cell type table at a version into a new index.
+
+    Raises LookupError if the version has no cell type table.
+
+    Keyword Arguments:
+    config -- config settings (dict)
+    version -- materialization version (int)
+    """
+    if CELL_TYPE_TABLE not in materialization.getTables(config, version):
+        raise LookupError(
+            "Version " + str(version) + " has no " + CELL_TYPE_TABLE + " table."
+        )
+
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+    type_df = synapse_utilities.queryAllPages(
+        client, CELL_TYPE_TABLE, max_pages=None, materialization_version=version
+    )
+    return CellTypeIndex(
+        type_df, version, materialization.getTimestamp(config, version)
+    )
+
+
+def _naiveUtc(stamp):
+    """Convert a timestamp to naive utc without microseconds, like materialization timestamps.
+
+    Keyword Arguments:
+    stamp -- timestamp (datetime object)
+    """
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return stamp.replace(microsecond=0)
+
+
+def _readyIndex(config):
+    """Get the newest built index, raising IndexPendingError if none is built yet.
+
+    Keyword Arguments:
+    config -- config settings (dict)
+    """
+    index = getIndex(config)
+    if index is None:
+        raise IndexPendingError("The cell type index is still being built.")
+    return index
+
+
+def _updateIndex(index, config, version):
+    """Roll an index forward to a newer version, reading only what changed.
+
+    Re-reads annotations added since the index and annotations on roots
+    created by edits since the index, and drops those on retired roots.
+
+    Keyword Arguments:
+    index -- index at an older version (CellTypeIndex)
+    config -- config settings (dict)
+    version -- newer materialization version (int)
+    """
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+    timestamp = materialization.getTimestamp(config, version)
+
+    # finds roots retired and created by edits between the two versions #
+    retired_roots, new_roots = client.chunkedgraph.get_delta_roots(
+        _awareUtc(index.timestamp), timestamp_future=_awareUtc(timestamp)
+    )
+
+    # reads annotations added since the index #
+    max_id = int(index.type_df["id"].max()) if len(index) > 0 else -1
+    changed_list = [
+        synapse_utilities.queryAllPages(
+            client,
+            CELL_TYPE_TABLE,
+            max_pages=None,
+            filter_greater_dict={"id": max_id},
+            materialization_version=version,
+        )
+    ]
+
+    # reads annotations now pointing at new roots #
+    new_roots = [int(x) for x in new_roots]
+    for start in range(0, len(new_roots), DELTA_BATCH_SIZE):
+        changed_list.append(
+            synapse_utilities.queryAllPages(
+                client,
+                CELL_TYPE_TABLE,
+                max_pages=None,
+                filter_in_dict={"pt_root_id": new_roots[start : start + DELTA_BATCH_SIZE]},
+                materialization_version=version,
+            )
+        )
+
+    changed_df = pd.concat(
+        [x for x in changed_list if len(x) > 0] or [changed_list[0]],
+        ignore_index=True,
+    )
+    return index.withChanges(
+        [int(x) for x in retired_roots], changed_df, version, timestamp
+    )
+
+
+def cellTypes(root_ids, config={}):
+    """Get each root's unique cell type tags at the latest materialization version.
+
+    Raises IndexPendingError while the first index is still being built.
+
+    Keyword Arguments:
+    root_ids -- root ids (list of ints)
+    config -- config settings (dict, default {})
+    """
+    return _readyIndex(config).tags(root_ids)
+
+
+def getIndex(config={}, wait=False):
+    """Get the newest built cell type index, or None if none is built yet.
+
+    Each auth token has its own index, read with that token. When a new
+    materialization version appears, the index is rebuilt in a background
+    thread while the previous one keeps being served, so requests never wait
+    on a table download. Builds roll the index forward, or reload it in full
+    after FULL_RELOAD_SECONDS or if rolling forward fails, and a failed build
+    is retried after BUILD_RETRY_SECONDS.
+
+    Keyword Arguments:
+    config -- config settings (dict, default {})
+    wait -- wait for a build started by this call to finish, e.g. in scripts (bool, default False)
+    """
+    key = (
+        config.get("datastack", None),
+        config.get("server_address", None),
+        synapse_cache.tokenScope(),
+    )
+    version = materialization.getLatestVersion(config)
+
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            if index.version == version:
+                return index
+
+        # starts a build unless one is running or one failed recently #
+        build = _builds.get(key)
+        failed = _build_failures.get(key, None)
+        if build is None and (
+            failed is None or time.monotonic() - failed > BUILD_RETRY_SECONDS
+        ):
+            # carries the request's app and auth token into the build thread #
+            try:
+                app = flask.current_app._get_current_object()
+                auth_token = flask.g.get("auth_token", None)
+            except RuntimeError:
+                app, auth_token = None, None
+            build = threading.Thread(
+                target=_buildIndex,
+                args=(key, index, config, version, app, auth_token),
+                daemon=True,
+            )
+            _builds[key] = build
+            build.start()
+
+    if wait == True and build is not None:
+        build.join()
+        with _indexes_lock:
+            return _indexes.get(key)
+    return index
+
+
+def mainCellTypes(root_ids, config={}, timestamp=None):
+    """Get each root's most common cell type tag, UNTYPED if it has none.
+
+    Roots that were current at the index's version are read from the index.
+    Roots created by later edits are looked up directly at the timestamp.
+    The check is skipped when the timestamp is the index version's own.
+    Raises IndexPendingError while the first index is still being built.
+
+    Keyword Arguments:
+    root_ids -- root ids (list of ints)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp of the query (datetime object, default None)
+    """
+    index = _readyIndex(config)
+    root_ids = [int(x) for x in root_ids]
+    types = index.mainTypes(root_ids)
+    if len(root_ids) == 0:
+        return types
+
+    # the index holds exactly the roots current at its own timestamp #
+    if timestamp is not None and _naiveUtc(timestamp) == index.timestamp:
+        return types
+
+    # finds roots the index doesn't cover #
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+    covered = np.asarray(
+        client.chunkedgraph.is_latest_roots(
+            root_ids, timestamp=_awareUtc(index.timestamp)
+        ),
+        dtype=bool,
+    )
+
+    # queries the rest directly, like a per-query lookup would #
+    uncovered = [x for x, y in zip(root_ids, covered) if y == False]
+    if len(uncovered) > 0:
+        type_df = client.materialize.query_table(
+            CELL_TYPE_TABLE,
+            filter_in_dict={"pt_root_id": uncovered},
+            timestamp=timestamp,
+        )
+        types.update(
+            CellTypeIndex(type_df, index.version, index.timestamp).mainTypes(uncovered)
+        )
+
+    return types
+
+
+def rootsOfType(tag, config={}):
+    """Get the roots tagged with a cell type at the latest materialization version.
+
+    Raises IndexPendingError while the first index is still being built.
+
+    Keyword Arguments:
+    tag -- cell type tag (str)
+    config -- config settings (dict, default {})
+    """
+    return _readyIndex(config).rootsOfType(tag)
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from . import concurrency, lookup_utilities, synapse_cache
+
+# roots per change log request, with requests run concurrently #
+CHANGE_LOG_BATCH_SIZE = 20
+
+# total size in bytes of cached edit summaries allowed per worker process #
+CHANGE_LOG_CACHE_BYTES = 64 * 1024 ** 2
+
+# edit summaries keyed by datastack, auth token scope, and root id #
+# a root's edit history never changes, so entries don't expire #
+change_log_cache = synapse_cache.SynapseCache(byte_budget=CHANGE_LOG_CACHE_BYTES)
+
+
+def _fetchLogs(root_ids, config={}):
+    """Get the change logs of root ids in concurrent batches, keyed by int root id.
+
+    Failed batches are retried one root at a time, and roots whose log still
+    can't be fetched are left out.
+
+    Keyword Arguments:
+    root_ids -- root ids (list of ints)
+    config -- config settings (dict, default {})
+    """
+    # sets client #
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+
+    # fetches every batch of change logs at once #
+    batches = [
+        root_ids[i : i + CHANGE_LOG_BATCH_SIZE]
+        for i in range(0, len(root_ids), CHANGE_LOG_BATCH_SIZE)
+    ]
+    tasks = {
+        n: (lambda batch=batch: client.chunkedgraph.get_tabular_change_log(batch))
+        for n, batch in enumerate(batches)
+    }
+    results = concurrency.runConcurrently(
+        tasks,
+        timeout=config.get("query_timeout", concurrency.DEFAULT_TIMEOUT),
+        return_exceptions=True,
+    )
+
+    # retries failed batches one root at a time #
+    logs = {}
+    for n, batch in enumerate(batches):
+        if isinstance(results[n], Exception) == False:
+            logs.update(results[n])
+            continue
+        for root_id in batch:
+            try:
+                logs.update(client.chunkedgraph.get_tabular_change_log(root_id))
+            except Exception:
+                pass
+
+    return {int(x): y for x, y in logs.items()}
+
+
+def _summarizeLogs(logs):
+    """Count splits, merges, and editors of each root's change log at once.
+
+    Keyword Arguments:
+    logs -- change log tables keyed by int root id (dict)
+    """
+    summaries = {
+        x: {
+            "splits": 0,
+            "merges": 0,
+            "total_edits": 0,
+            "editors": [],
+            "last_edit": None,
+        }
+        for x in logs
+    }
+
+    # stacks every non-empty log into one table so edits are counted per root together #
+    logs = {x: pd.DataFrame(y) for x, y in logs.items() if len(y) > 0}
+    if len(logs) == 0:
+        return summaries
+    log_df = pd.concat(list(logs.values()), ignore_index=True)
+    log_df["root_id"] = np.repeat(list(logs.keys()), [len(x) for x in logs.values()])
+
+    grouped = log_df.groupby("root_id")
+    merges = grouped["is_merge"].sum()
+    totals = grouped.size()
+    editors = grouped["user_id"].agg(lambda x: [str(i) for i in np.unique(x)])
+    if "timestamp" in log_df.columns:
+        last_edits = grouped["timestamp"].max()
+    else:
+        last_edits = pd.Series(dtype=object)
+
+    for root_id in logs:
+        summaries[root_id] = {
+            "splits": int(totals[root_id] - merges[root_id]),
+            "merges": int(merges[root_id]),
+            "total_edits": int(totals[root_id]),
+            "editors": editors[root_id],
+            "last_edit": last_edits.get(root_id, None),
+        }
+    return summaries
+
+
+def getEditSummaries(root_ids, config={}):
+    """Get the edit counts and editors of many roots, fetching only uncached change logs.
+
+    Each summary is a dict of "splits", "merges", "total_edits", "editors"
+    (sorted user ids as str), and "last_edit" (timestamp of the newest edit,
+    None if unedited). Roots whose change log can't be fetched map to None
+    and are tried again on the next call.
+
+    Keyword Arguments:
+    root_ids -- root ids (list of ints)
+    config -- config settings (dict, default {})
+    """
+    scope = (config.get("datastack", None), synapse_cache.tokenScope())
+    root_ids = list(dict.fromkeys(int(x) for x in root_ids))
+
+    # reads cached summaries #
+    summaries = {}
+    missing = []
+    for root_id in root_ids:
+        hit, summary = change_log_cache.get(("change_log",) + scope + (root_id,))
+        if hit == True:
+            summaries[root_id] = summary
+        else:
+            missing.append(root_id)
+
+    # fetches and summarizes the rest, caching them without expiry #
+    fetched = _summarizeLogs(_fetchLogs(missing, config)) if len(missing) > 0 else {}
+    for root_id in missing:
+        summary = fetched.get(root_id, None)
+        if summary is not None:
+            change_log_cache.put(("change_log",) + scope + (root_id,), summary)
+        summaries[root_id] = summary
+
+    return summaries
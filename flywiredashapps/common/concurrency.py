@@ -0,0 +1,117 @@
+import concurrent.futures
+import contextvars
+import time
+
+# default seconds to wait for each concurrent call before giving up on it #
+DEFAULT_TIMEOUT = 120
+
+# default maximum number of calls run at once per batch #
+DEFAULT_MAX_WORKERS = 8
+
+
+def runConcurrently(
+    tasks,
+    timeout=DEFAULT_TIMEOUT,
+    max_workers=DEFAULT_MAX_WORKERS,
+    return_exceptions=False,
+):
+    """Run independent calls in parallel threads and collect their results by name.
+
+    Each call runs in its own copy of the caller's context, so flask request
+    state such as the auth token is visible inside it. If any call is still
+    unfinished at its deadline, calls that have not started are cancelled and a
+    TimeoutError naming the late calls is raised. Calls that are already running
+    cannot be interrupted and are left to finish in the background.
+
+    Keyword Arguments:
+    tasks -- zero-argument functions to run, keyed by name (dict)
+    timeout -- seconds from the start of the batch to wait for each call, either
+        one value for all calls or a dict keyed by name, None waits forever
+        (float or dict, default DEFAULT_TIMEOUT)
+    max_workers -- maximum number of calls run at once (int, default DEFAULT_MAX_WORKERS)
+    return_exceptions -- return a call's exception as its result instead of
+        raising it (bool, default False)
+    """
+    if len(tasks) == 0:
+        return {}
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(max_workers, len(tasks))
+    )
+    start = time.monotonic()
+
+    # submits every call in a separate context copy, since a context cannot be entered twice at once #
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, func)
+        for name, func in tasks.items()
+    }
+
+    # sets deadline of each call from the shared start time #
+    deadlines = {}
+    for name in tasks:
+        limit = timeout.get(name, None) if isinstance(timeout, dict) else timeout
+        deadlines[name] = None if limit is None else start + limit
+
+    results = {}
+    late = []
+    try:
+        for name, future in futures.items():
+            if deadlines[name] is None:
+                remaining = None
+            else:
+                remaining = max(0.0, deadlines[name] - time.monotonic())
+            try:
+                results[name] = future.result(timeout=remaining)
+            except concurrent.futures.TimeoutError:
+                late.append(name)
+            except Exception as e:
+                if return_exceptions == True:
+                    results[name] = e
+                else:
+                    raise
+    finally:
+        # cancels anything still queued and returns without joining running threads #
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if late:
+        raise TimeoutError("Timed out waiting for " + ", ".join(late) + ".")
+
+    return results
+
+
+def iterConcurrently(tasks, timeout=DEFAULT_TIMEOUT, max_workers=DEFAULT_MAX_WORKERS):
+    """Run independent calls in parallel threads and yield (name, result) as each finishes.
+
+    Results are handed over in completion order so callers can consume them
+    incrementally instead of holding every result at once. Exceptions from a
+    call are raised when its result is reached. If the batch is not finished
+    within the timeout, or the caller stops iterating early, calls that have not
+    started are cancelled.
+
+    Keyword Arguments:
+    tasks -- zero-argument functions to run, keyed by name (dict)
+    timeout -- seconds to wait for the whole batch, None waits forever (float, default DEFAULT_TIMEOUT)
+    max_workers -- maximum number of calls run at once (int, default DEFAULT_MAX_WORKERS)
+    """
+    if len(tasks) == 0:
+        return
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(max_workers, len(tasks))
+    )
+
+    # maps futures back to names, each running in its own context copy #
+    names = {
+        executor.submit(contextvars.copy_context().run, func): name
+        for name, func in tasks.items()
+    }
+
+    try:
+        for future in concurrent.futures.as_completed(names, timeout=timeout):
+            yield names.pop(future), future.result()
+    except concurrent.futures.TimeoutError:
+        raise TimeoutError(
+            "Timed out waiting for " + ", ".join(str(x) for x in names.values()) + "."
+        )
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,809 @@
+import datetime
+import os
+import threading
+import numpy as np
+import pandas as pd
+from caveclient import CAVEclient
+from . import synapse_store
+
+# cloud volume holding the segmentation, used for point lookups by live sources #
+DEFAULT_CLOUDVOLUME_PATH = (
+    "graphene://https://prod.flywire-daf.com/segmentation/1.0/fly_v31"
+)
+
+# volume resolution in nm/voxel reported by offline sources #
+DEFAULT_RESOLUTION = [16, 16, 40]
+
+# columns of the per-root tables returned by get_tabular_change_log #
+CHANGE_LOG_COLUMNS = [
+    "operation_id",
+    "timestamp",
+    "user_id",
+    "user_name",
+    "is_merge",
+    "before_root_ids",
+    "after_root_ids",
+]
+
+# neuropil labels assigned to synthetic synapses #
+SYNTHETIC_NEUROPILS = [
+    "AL_L",
+    "AL_R",
+    "LH_L",
+    "LH_R",
+    "MB_CA_L",
+    "MB_CA_R",
+    "SLP_L",
+    "SLP_R",
+    "SMP_L",
+    "SMP_R",
+    "FB",
+    "EB",
+    "PB",
+    "ME_L",
+    "ME_R",
+    "LO_L",
+    "LO_R",
+    "GNG",
+    "None",
+]
+
+# resolution in nm/voxel of synapse positions in the synapse table #
+SYNAPSE_POSITION_RESOLUTION = [4, 4, 40]
+
+# first root id handed out by the synthetic source, 18 digits like real root ids #
+SYNTHETIC_ROOT_BASE = 720575940600000000
+
+# materialization timestamp reported by the synthetic source #
+SYNTHETIC_TIMESTAMP = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+
+# offline sources registered by create_app, keyed by datastack name #
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+class CoordinateLookupError(LookupError):
+    """Raised when a source can't find the segment at a point."""
+
+
+class DataSource:
+    """Interface for every read and write the apps make against FlyWire's services.
+
+    Sources also expose materialize, chunkedgraph, state, and info attributes
+    so code written against a CAVEclient, e.g. client.materialize.query_table,
+    works with any source unchanged.
+    """
+
+    @property
+    def materialize(self):
+        return self
+
+    @property
+    def chunkedgraph(self):
+        return self
+
+    @property
+    def state(self):
+        return self
+
+    @property
+    def info(self):
+        return self
+
+    def query_table(self, table, **kwargs):
+        """Query a materialized table, taking the same arguments as CAVEclient."""
+        raise NotImplementedError
+
+    def get_versions(self):
+        """Get the available materialization versions."""
+        raise NotImplementedError
+
+    def get_timestamp(self, version=None):
+        """Get the utc timestamp of a materialization version, latest if None."""
+        raise NotImplementedError
+
+    def get_tables(self, version=None):
+        """Get the names of the tables in a materialization version, latest if None."""
+        raise NotImplementedError
+
+    def is_latest_roots(self, root_ids, timestamp=None):
+        """Check whether root ids are current at a timestamp, one bool per id."""
+        raise NotImplementedError
+
+    def get_root_id(self, supervoxel_id, timestamp=None):
+        """Get the root id containing a supervoxel at a timestamp."""
+        raise NotImplementedError
+
+    def get_delta_roots(self, timestamp_past, timestamp_future=None):
+        """Get the root ids retired and created between two timestamps, as [old, new] arrays."""
+        raise NotImplementedError
+
+    def get_tabular_change_log(self, root_ids, filtered=True):
+        """Get edit history tables for root ids, as a dict keyed by root id."""
+        raise NotImplementedError
+
+    def upload_state_json(self, state_json):
+        """Store a neuroglancer state and return its id."""
+        raise NotImplementedError
+
+    def build_neuroglancer_url(self, state_id, ngl_url=None):
+        """Build a neuroglancer link for a stored state id."""
+        raise NotImplementedError
+
+    def image_source(self):
+        """Get the neuroglancer source of the image layer."""
+        raise NotImplementedError
+
+    def segmentation_source(self):
+        """Get the neuroglancer source of the segmentation layer."""
+        raise NotImplementedError
+
+    def download_point(self, point, size=1):
+        """Get the supervoxel id at an x,y,z point in volume resolution."""
+        raise NotImplementedError
+
+    def get_resolution(self):
+        """Get the x,y,z resolution of the volume in nm/voxel."""
+        raise NotImplementedError
+
+
+class CaveDataSource(DataSource):
+    """Live source backed by a CAVEclient and the segmentation cloud volume.
+
+    The sub-API attributes return the client's own, so existing calls go
+    straight to CAVEclient.
+    """
+
+    def __init__(
+        self,
+        datastack,
+        server_address=None,
+        auth_token=None,
+        pool_maxsize=None,
+        cloudvolume_path=DEFAULT_CLOUDVOLUME_PATH,
+    ):
+        """Build a client for a datastack.
+
+        Keyword Arguments:
+        datastack -- datastack name (str)
+        server_address -- global server address (str, default None)
+        auth_token -- auth token of the user (str, default None)
+        pool_maxsize -- size of the http connection pool (int, default None)
+        cloudvolume_path -- segmentation path for point lookups (str, default DEFAULT_CLOUDVOLUME_PATH)
+        """
+        self.client = CAVEclient(
+            datastack,
+            server_address=server_address,
+            auth_token=auth_token,
+            pool_maxsize=pool_maxsize,
+        )
+        self.cloudvolume_path = cloudvolume_path
+        self._cv = None
+        self._cv_lock = threading.Lock()
+
+    @property
+    def materialize(self):
+        return self.client.materialize
+
+    @property
+    def chunkedgraph(self):
+        return self.client.chunkedgraph
+
+    @property
+    def state(self):
+        return self.client.state
+
+    @property
+    def info(self):
+        return self.client.info
+
+    def _cloudVolume(self):
+        """Open the segmentation cloud volume once, on first use."""
+        with self._cv_lock:
+            if self._cv is None:
+                # imported here since cloudvolume is slow to import #
+                import cloudvolume
+
+                self._cv = cloudvolume.CloudVolume(
+                    self.cloudvolume_path, use_https=True,
+                )
+            return self._cv
+
+    def query_table(self, table, **kwargs):
+        return self.client.materialize.query_table(table, **kwargs)
+
+    def get_versions(self):
+        return self.client.materialize.get_versions()
+
+    def get_timestamp(self, version=None):
+        return self.client.materialize.get_timestamp(version=version)
+
+    def get_tables(self, version=None):
+        return self.client.materialize.get_tables(version=version)
+
+    def is_latest_roots(self, root_ids, timestamp=None):
+        return self.client.chunkedgraph.is_latest_roots(root_ids, timestamp=timestamp)
+
+    def get_root_id(self, supervoxel_id, timestamp=None):
+        return self.client.chunkedgraph.get_root_id(
+            supervoxel_id=supervoxel_id, timestamp=timestamp
+        )
+
+    def get_delta_roots(self, timestamp_past, timestamp_future=None):
+        if timestamp_future is None:
+            timestamp_future = datetime.datetime.now(datetime.timezone.utc)
+        return self.client.chunkedgraph.get_delta_roots(
+            timestamp_past, timestamp_future=timestamp_future
+        )
+
+    def get_tabular_change_log(self, root_ids, filtered=True):
+        return self.client.chunkedgraph.get_tabular_change_log(
+            root_ids, filtered=filtered
+        )
+
+    def upload_state_json(self, state_json):
+        return self.client.state.upload_state_json(state_json)
+
+    def build_neuroglancer_url(self, state_id, ngl_url=None):
+        return self.client.state.build_neuroglancer_url(
+            state_id=state_id, ngl_url=ngl_url
+        )
+
+    def image_source(self):
+        return self.client.info.image_source()
+
+    def segmentation_source(self):
+        return self.client.info.segmentation_source()
+
+    def download_point(self, point, size=1):
+        return self._cloudVolume().download_point(point, size=size)
+
+    def get_resolution(self):
+        return list(self._cloudVolume().resolution)
+
+
+class TableDataSource(DataSource):
+    """Offline source answering queries from in-memory tables.
+
+    Every root is treated as current and unedited, and neuroglancer states are
+    kept in memory. Subclasses provide the tables.
+    """
+
+    def __init__(
+        self,
+        tables={},
+        materialization_version=1,
+        timestamp=SYNTHETIC_TIMESTAMP,
+        resolution=DEFAULT_RESOLUTION,
+    ):
+        """Set up a source over a dict of tables.
+
+        Keyword Arguments:
+        tables -- dataframes keyed by table name (dict, default {})
+        materialization_version -- version reported by the source (int, default 1)
+        timestamp -- utc timestamp of that version (datetime object, default SYNTHETIC_TIMESTAMP)
+        resolution -- x,y,z volume resolution in nm/voxel (list of ints, default DEFAULT_RESOLUTION)
+        """
+        self.tables = dict(tables)
+        self.materialization_version = materialization_version
+        self.timestamp = timestamp
+        self.resolution = resolution
+        self._states = []
+        self._states_lock = threading.Lock()
+        self._point_index = None
+        self._point_index_lock = threading.Lock()
+
+    def _getTable(self, table):
+        """Get a table by name.
+
+        Keyword Arguments:
+        table -- name of table (str)
+        """
+        if table not in self.tables:
+            raise ValueError("Table '" + str(table) + "' is not in this data source.")
+        return self.tables[table]
+
+    def _pointIndex(self):
+        """Index synapse endpoints by voxel, return as [voxel_roots, supervoxel_roots].
+
+        voxel_roots maps voxel codes from _voxelCodes to supervoxel ids, and
+        supervoxel_roots maps supervoxel ids to root ids. Built on first use.
+        """
+        with self._point_index_lock:
+            if self._point_index is not None:
+                return self._point_index
+
+            try:
+                syn_df = self._getTable("synapses_nt_v1")
+            except ValueError:
+                syn_df = pd.DataFrame()
+
+            # stacks the pre and post endpoints of every synapse #
+            codes, supervoxels, roots = [], [], []
+            for side in ["pre", "post"]:
+                columns = [side + "_pt_supervoxel_id", side + "_pt_root_id"]
+                positions = _positionArray(syn_df, side + "_pt_position")
+                if positions is None or not set(columns) <= set(syn_df.columns):
+                    continue
+                voxels = np.floor_divide(
+                    positions * np.array(SYNAPSE_POSITION_RESOLUTION),
+                    np.array(self.resolution),
+                )
+                codes.append(_voxelCodes(voxels))
+                supervoxels.append(syn_df[columns[0]].to_numpy(dtype=np.int64))
+                roots.append(syn_df[columns[1]].to_numpy(dtype=np.int64))
+
+            if len(codes) == 0:
+                codes, supervoxels, roots = [[np.array([], dtype=np.int64)]] * 3
+            voxel_roots = pd.Series(
+                np.concatenate(supervoxels), index=np.concatenate(codes)
+            )
+            supervoxel_roots = pd.Series(
+                np.concatenate(roots), index=np.concatenate(supervoxels)
+            )
+            self._point_index = [
+                voxel_roots[~voxel_roots.index.duplicated()],
+                supervoxel_roots[~supervoxel_roots.index.duplicated()],
+            ]
+            return self._point_index
+
+    def query_table(self, table, **kwargs):
+        """Filter a table like the materialization service would, see _filterTable."""
+        return _filterTable(self._getTable(table), **kwargs)
+
+    def get_versions(self):
+        return [self.materialization_version]
+
+    def get_timestamp(self, version=None):
+        return self.timestamp
+
+    def get_tables(self, version=None):
+        return list(self.tables)
+
+    def is_latest_roots(self, root_ids, timestamp=None):
+        return np.ones(len(np.atleast_1d(root_ids)), dtype=bool)
+
+    def get_root_id(self, supervoxel_id, timestamp=None):
+        # offline sources only know the supervoxels of stored synapses #
+        supervoxel_roots = self._pointIndex()[1]
+        if int(supervoxel_id) not in supervoxel_roots.index:
+            raise CoordinateLookupError(
+                "Supervoxel " + str(supervoxel_id) + " is not in this data source."
+            )
+        return int(supervoxel_roots[int(supervoxel_id)])
+
+    def get_delta_roots(self, timestamp_past, timestamp_future=None):
+        return [np.array([], dtype=np.int64), np.array([], dtype=np.int64)]
+
+    def get_tabular_change_log(self, root_ids, filtered=True):
+        return {
+            int(x): pd.DataFrame(columns=CHANGE_LOG_COLUMNS)
+            for x in np.atleast_1d(root_ids)
+        }
+
+    def upload_state_json(self, state_json):
+        with self._states_lock:
+            self._states.append(state_json)
+            return len(self._states)
+
+    def build_neuroglancer_url(self, state_id, ngl_url=None):
+        return str(ngl_url or "") + "?local_state_id=" + str(state_id)
+
+    def image_source(self):
+        return "precomputed://local/image"
+
+    def segmentation_source(self):
+        return "precomputed://local/segmentation"
+
+    def download_point(self, point, size=1):
+        # offline sources only know the segments at stored synapse endpoints #
+        voxel_roots = self._pointIndex()[0]
+        offsets = np.arange(size) - (size - 1) // 2
+        box = np.array(np.meshgrid(offsets, offsets, offsets)).reshape(3, -1).T
+        found = voxel_roots.reindex(_voxelCodes(np.array(point) + box)).dropna()
+        if len(found) == 0:
+            raise CoordinateLookupError(
+                "No segment found at these coordinates. Offline data sources "
+                + "can only look up coordinates at synapse locations."
+            )
+        return int(found.iloc[0])
+
+    def get_resolution(self):
+        return list(self.resolution)
+
+
+class SnapshotDataSource(TableDataSource):
+    """Offline source reading a local snapshot directory.
+
+    Synapses come from a synapse_store directory, which is registered as the
+    pinned synapse store so synapse queries use its sorted indexes. Any other
+    table is read from tables/<name>.parquet inside the same directory.
+    """
+
+    def __init__(self, path, datastack=None):
+        """Open a snapshot directory.
+
+        Keyword Arguments:
+        path -- directory written by synapse_store.ingestDataFrame (str)
+        datastack -- datastack name the snapshot is registered under (str, default None)
+        """
+        self.path = path
+        self.store = synapse_store.configure(
+            {
+                "datastack": datastack,
+                "synapse_store": path,
+                "synapse_store_pinned": True,
+            }
+        )
+        super().__init__(
+            materialization_version=self.store.materialization_version,
+            timestamp=self.store.timestamp,
+        )
+
+    def _getTable(self, table):
+        if table not in self.tables:
+            self.tables[table] = self._loadTable(table)
+        return self.tables[table]
+
+    def get_tables(self, version=None):
+        table_dir = os.path.join(self.path, "tables")
+        saved = []
+        if os.path.isdir(table_dir):
+            saved = [
+                x[: -len(".parquet")]
+                for x in sorted(os.listdir(table_dir))
+                if x.endswith(".parquet")
+            ]
+        return list(
+            dict.fromkeys(["synapses_nt_v1", "fly_synapses_neuropil"] + saved)
+        )
+
+    def _loadTable(self, table):
+        """Load a table from the snapshot, splitting synapses back into their tables.
+
+        Keyword Arguments:
+        table -- name of table (str)
+        """
+        if table in ["synapses_nt_v1", "fly_synapses_neuropil"]:
+            return _splitMergedSynapses(self.store.toPandas(), table)
+
+        table_path = os.path.join(self.path, "tables", table + ".parquet")
+        if not os.path.exists(table_path):
+            raise ValueError("Table '" + str(table) + "' is not in this snapshot.")
+        return pd.read_parquet(table_path, memory_map=True)
+
+    def query_table(self, table, filter_in_dict=None, **kwargs):
+        # answers root id synapse queries from the store's sorted indexes #
+        filter_in_dict = filter_in_dict or {}
+        root_filters = set(filter_in_dict) & {"pre_pt_root_id", "post_pt_root_id"}
+        if table == "synapses_nt_v1" and root_filters:
+            merged_df = self.store.query(
+                pre_roots=filter_in_dict.get("pre_pt_root_id", None),
+                post_roots=filter_in_dict.get("post_pt_root_id", None),
+            )
+            other_filters = {
+                x: y for x, y in filter_in_dict.items() if x not in root_filters
+            }
+            return _filterTable(
+                _splitMergedSynapses(merged_df, table),
+                filter_in_dict=other_filters,
+                **kwargs
+            )
+
+        return super().query_table(table, filter_in_dict=filter_in_dict, **kwargs)
+
+
+class SyntheticDataSource(TableDataSource):
+    """Offline source generating a reproducible random connectome.
+
+    Neurons get a dominant neurotransmitter, a heavy-tailed number of
+    partners, a nucleus for most cells, cell type tags for some, and a random
+    edit history, so every app has realistic data to render. The same seed
+    always gives the same data.
+    """
+
+    def __init__(self, seed=0, num_neurons=1000, num_synapses=200000):
+        """Generate the tables.
+
+        Keyword Arguments:
+        seed -- random seed (int, default 0)
+        num_neurons -- number of root ids (int, default 1000)
+        num_synapses -- number of synapses (int, default 200000)
+        """
+        rng = np.random.default_rng(seed)
+        self.root_ids = SYNTHETIC_ROOT_BASE + np.arange(num_neurons, dtype=np.int64)
+
+        # places neuron centers inside the volume in nm #
+        centers = np.column_stack(
+            [
+                rng.uniform(100000, 900000, num_neurons),
+                rng.uniform(50000, 400000, num_neurons),
+                rng.uniform(2000, 250000, num_neurons),
+            ]
+        ).astype(np.int64)
+
+        # picks partners with heavy-tailed weights so a few neurons are hubs #
+        pre_idx = rng.choice(
+            num_neurons, size=num_synapses, p=_normalize(rng.lognormal(0, 1.2, num_neurons))
+        )
+        post_idx = rng.choice(
+            num_neurons, size=num_synapses, p=_normalize(rng.lognormal(0, 1.2, num_neurons))
+        )
+
+        # scores each synapse's neurotransmitters around its neuron's dominant one #
+        dominant_nt = rng.integers(0, 6, num_neurons)
+        alpha = np.full((num_synapses, 6), 0.4)
+        alpha[np.arange(num_synapses), dominant_nt[pre_idx]] = 6.0
+        nt_scores = rng.gamma(alpha)
+        nt_scores = nt_scores / nt_scores.sum(axis=1, keepdims=True)
+
+        pre_positions = centers[pre_idx] + rng.integers(-20000, 20000, (num_synapses, 3))
+        post_positions = pre_positions + rng.integers(-200, 200, (num_synapses, 3))
+        syn_ids = np.arange(1, num_synapses + 1, dtype=np.int64)
+
+        synapse_df = pd.DataFrame(
+            {
+                "id": syn_ids,
+                "valid": True,
+                "pre_pt_supervoxel_id": self.root_ids[pre_idx] - SYNTHETIC_ROOT_BASE,
+                "pre_pt_root_id": self.root_ids[pre_idx],
+                "post_pt_supervoxel_id": self.root_ids[post_idx] - SYNTHETIC_ROOT_BASE,
+                "post_pt_root_id": self.root_ids[post_idx],
+                "pre_pt_position": list(pre_positions),
+                "post_pt_position": list(post_positions),
+                "cleft_score": rng.integers(0, 250, num_synapses),
+                "gaba": nt_scores[:, 0],
+                "ach": nt_scores[:, 1],
+                "glut": nt_scores[:, 2],
+                "oct": nt_scores[:, 3],
+                "ser": nt_scores[:, 4],
+                "da": nt_scores[:, 5],
+            }
+        )
+
+        # gives each neuron a home neuropil that most of its input synapses fall in #
+        home_neuropil = rng.integers(0, len(SYNTHETIC_NEUROPILS), num_neurons)
+        stray = rng.random(num_synapses) < 0.3
+        neuropil_idx = np.where(
+            stray,
+            rng.integers(0, len(SYNTHETIC_NEUROPILS), num_synapses),
+            home_neuropil[post_idx],
+        )
+
+        # the neuropil table is a reference table sharing its synapses' ids #
+        neuropil_df = pd.DataFrame(
+            {
+                "id": syn_ids,
+                "valid": True,
+                "target_id": syn_ids,
+                "neuropil": np.array(SYNTHETIC_NEUROPILS)[neuropil_idx],
+            }
+        )
+
+        # gives most neurons a nucleus at their center #
+        has_nucleus = np.flatnonzero(rng.random(num_neurons) < 0.8)
+        nucleus_df = pd.DataFrame(
+            {
+                "id": 1000000 + has_nucleus,
+                "valid": True,
+                "pt_supervoxel_id": self.root_ids[has_nucleus] - SYNTHETIC_ROOT_BASE,
+                "pt_root_id": self.root_ids[has_nucleus],
+                "pt_position": list(centers[has_nucleus]),
+                "volume": rng.uniform(20, 200, len(has_nucleus)),
+            }
+        )
+
+        # tags some neurons with one or two cell types #
+        tagged = np.flatnonzero(rng.random(num_neurons) < 0.3)
+        tag_count = rng.integers(1, 3, len(tagged))
+        tag_roots = np.repeat(tagged, tag_count)
+        type_df = pd.DataFrame(
+            {
+                "id": np.arange(1, len(tag_roots) + 1),
+                "valid": True,
+                "pt_root_id": self.root_ids[tag_roots],
+                "pt_position": list(centers[tag_roots]),
+                "tag": ["type_" + str(x) for x in rng.integers(0, 200, len(tag_roots))],
+                "user_id": rng.integers(1, 50, len(tag_roots)),
+            }
+        )
+
+        # generates a random edit history for each neuron #
+        edit_count = rng.poisson(3, num_neurons)
+        edit_roots = np.repeat(self.root_ids, edit_count)
+        num_edits = len(edit_roots)
+        user_ids = rng.integers(1, 50, num_edits)
+        self.change_log_df = pd.DataFrame(
+            {
+                "root_id": edit_roots,
+                "operation_id": np.arange(1, num_edits + 1),
+                "timestamp": SYNTHETIC_TIMESTAMP
+                - pd.to_timedelta(rng.integers(0, 10 ** 7, num_edits), unit="s"),
+                "user_id": user_ids,
+                "user_name": ["user_" + str(x) for x in user_ids],
+                "is_merge": rng.random(num_edits) < 0.6,
+                "before_root_ids": [[] for x in range(num_edits)],
+                "after_root_ids": [[] for x in range(num_edits)],
+            }
+        )
+
+        super().__init__(
+            tables={
+                "synapses_nt_v1": synapse_df,
+                "fly_synapses_neuropil": neuropil_df,
+                "nuclei_v1": nucleus_df,
+                "neuron_information_v2": type_df,
+            },
+            materialization_version=1,
+            timestamp=SYNTHETIC_TIMESTAMP,
+        )
+
+    def get_tabular_change_log(self, root_ids, filtered=True):
+        grouped = self.change_log_df.groupby("root_id")
+        out_dict = {}
+        for root_id in np.atleast_1d(root_ids):
+            root_id = int(root_id)
+            if root_id in grouped.groups:
+                out_dict[root_id] = (
+                    grouped.get_group(root_id)[CHANGE_LOG_COLUMNS]
+                    .reset_index(drop=True)
+                )
+            else:
+                out_dict[root_id] = pd.DataFrame(columns=CHANGE_LOG_COLUMNS)
+        return out_dict
+
+    def get_root_id(self, supervoxel_id, timestamp=None):
+        return self.root_ids[int(supervoxel_id) % len(self.root_ids)]
+
+    def download_point(self, point, size=1):
+        # maps each point to a fixed supervoxel so coordinate lookups are repeatable #
+        x, y, z = [int(i) for i in point]
+        return (x * 73856093 ^ y * 19349663 ^ z * 83492791) % len(self.root_ids)
+
+
+def _filterTable(
+    table_df,
+    filter_in_dict=None,
+    filter_out_dict=None,
+    filter_equal_dict=None,
+    filter_greater_dict=None,
+    filter_less_dict=None,
+    select_columns=None,
+    offset=None,
+    limit=None,
+    **kwargs
+):
+    """Filter a table like the materialization service would.
+
+    Timestamps, versions, and other service options are accepted and ignored,
+    since offline tables hold a single version.
+
+    Keyword Arguments:
+    table_df -- full table (dataframe)
+    filter_*_dict -- column filters as in CAVEclient query_table (dicts, default None)
+    select_columns -- columns to keep (list of str, default None)
+    offset -- rows to skip (int, default None)
+    limit -- maximum rows returned (int, default None)
+    """
+    mask = np.ones(len(table_df), dtype=bool)
+
+    # applies each kind of filter as a vectorized mask #
+    for column, values in (filter_in_dict or {}).items():
+        mask &= table_df[column].isin(np.asarray(values)).to_numpy()
+    for column, values in (filter_out_dict or {}).items():
+        mask &= ~table_df[column].isin(np.asarray(values)).to_numpy()
+    for column, value in (filter_equal_dict or {}).items():
+        mask &= (table_df[column] == value).to_numpy()
+    for column, value in (filter_greater_dict or {}).items():
+        mask &= (table_df[column] > value).to_numpy()
+    for column, value in (filter_less_dict or {}).items():
+        mask &= (table_df[column] < value).to_numpy()
+
+    out_df = table_df[mask]
+
+    # pages results like the service does #
+    start = offset or 0
+    end = None if limit is None else start + limit
+    out_df = out_df.iloc[start:end]
+
+    if select_columns is not None:
+        out_df = out_df[list(select_columns)]
+
+    return out_df.reset_index(drop=True)
+
+
+def _normalize(weights):
+    """Scale weights to sum to one for use as probabilities."""
+    return weights / weights.sum()
+
+
+def _positionArray(table_df, column):
+    """Get a position column as an n x 3 int array, or None if the table lacks it.
+
+    Accepts positions stored as one column of x,y,z lists or split into
+    column_x, column_y, and column_z.
+
+    Keyword Arguments:
+    table_df -- table holding the positions (dataframe)
+    column -- name of the position column (str)
+    """
+    if column in table_df.columns:
+        if len(table_df) == 0:
+            return np.zeros((0, 3), dtype=np.int64)
+        return np.stack(table_df[column].to_numpy()).astype(np.int64)
+    split_columns = [column + "_" + x for x in "xyz"]
+    if set(split_columns) <= set(table_df.columns):
+        return table_df[split_columns].to_numpy(dtype=np.int64)
+    return None
+
+
+def _splitMergedSynapses(merged_df, table):
+    """Recover one of the two source tables from merged synapse and neuropil rows.
+
+    Keyword Arguments:
+    merged_df -- rows as stored by synapse_store (dataframe)
+    table -- "synapses_nt_v1" or "fly_synapses_neuropil" (str)
+    """
+    neuropil_columns = ["idnp", "validnp", "target_id", "neuropil"]
+    if table == "fly_synapses_neuropil":
+        out_df = merged_df[[x for x in neuropil_columns if x in merged_df.columns]]
+        return out_df.rename(columns={"idnp": "id", "validnp": "valid"})
+    out_df = merged_df.drop(
+        columns=[x for x in neuropil_columns if x in merged_df.columns]
+    )
+    return out_df.rename(columns={"idsyn": "id", "validsyn": "valid"})
+
+
+def _voxelCodes(voxels):
+    """Pack x,y,z voxel coordinates below 2**21 into one int64 each.
+
+    Keyword Arguments:
+    voxels -- voxel coordinates (n x 3 array of ints)
+    """
+    voxels = np.asarray(voxels, dtype=np.int64).reshape(-1, 3)
+    return (voxels[:, 0] << 42) | (voxels[:, 1] << 21) | voxels[:, 2]
+
+
+def configure(config={}):
+    """Build the data source named in config and register it for its datastack.
+
+    config["data_source"] picks the source: "cave" (default) for the live
+    services, "snapshot" for a local snapshot directory given by
+    config["data_source_path"], or "synthetic" for generated data sized by
+    config["synthetic_neurons"] and config["synthetic_synapses"] and seeded by
+    config["synthetic_seed"]. Live sources are built per user by make_client,
+    so only offline sources are registered.
+
+    Keyword Arguments:
+    config -- config settings (dict, default {})
+    """
+    kind = config.get("data_source", "cave")
+    datastack = config.get("datastack", None)
+
+    if kind == "cave":
+        with _sources_lock:
+            _sources.pop(datastack, None)
+        return None
+    elif kind == "snapshot":
+        source = SnapshotDataSource(config["data_source_path"], datastack=datastack)
+    elif kind == "synthetic":
+        source = SyntheticDataSource(
+            seed=config.get("synthetic_seed", 0),
+            num_neurons=config.get("synthetic_neurons", 1000),
+            num_synapses=config.get("synthetic_synapses", 200000),
+        )
+    else:
+        raise ValueError("Unknown data source '" + str(kind) + "'.")
+
+    with _sources_lock:
+        _sources[datastack] = source
+    return source
+
+
+def getSource(datastack):
+    """Get the offline source registered for a datastack, or None for live data.
+
+    Keyword Arguments:
+    datastack -- datastack name (str)
+    """
+    return _sources.get(datastack)
@@ -0,0 +1,169 @@
+import numpy as np
+from . import lookup_utilities
+
+
+def checkFreshnessBulk(root_ids, config={}, timestamp=None):
+    """Check whether root ids are current in one call, falling back to one call per id.
+
+    Returns a dict keyed by int root id with True if current, False if
+    outdated, or None if the id could not be checked. A batch fails as a whole
+    if any id in it is invalid, so on error each id is checked on its own.
+
+    Keyword arguments:
+    root_ids -- 18-digit root ids (list of ints or strs)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    """
+    root_ids = list(dict.fromkeys(int(x) for x in root_ids))
+    if len(root_ids) == 0:
+        return {}
+
+    # sets client #
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+
+    # checks every id at once #
+    try:
+        answers = np.atleast_1d(
+            client.chunkedgraph.is_latest_roots(root_ids, timestamp=timestamp)
+        )
+        return {x: bool(y) for x, y in zip(root_ids, answers)}
+
+    # checks each id separately so one bad id doesn't remove the rest #
+    except:
+        freshness = {}
+        for root_id in root_ids:
+            try:
+                answer = client.chunkedgraph.is_latest_roots(
+                    [root_id], timestamp=timestamp
+                )
+                freshness[root_id] = bool(np.atleast_1d(answer)[0])
+            except:
+                freshness[root_id] = None
+        return freshness
+
+
+def nucsToRoots(nuc_ids, config={}, timestamp=None, materialization_version=None):
+    """Convert nucleus ids to root ids in one query, falling back to one query per id.
+
+    Returns a dict keyed by int nucleus id with the int root id, or None if the
+    nucleus isn't found or isn't in a segment.
+
+    Keyword arguments:
+    nuc_ids -- 7-digit nucleus ids (list of ints or strs)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    materialization_version -- version to query instead of timestamp (int, default None)
+    """
+    nuc_ids = list(dict.fromkeys(int(x) for x in nuc_ids))
+    if len(nuc_ids) == 0:
+        return {}
+
+    # sets client #
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+
+    # sets version or timestamp of nucleus queries #
+    if materialization_version is not None:
+        query_kwargs = {"materialization_version": materialization_version}
+    else:
+        query_kwargs = {"timestamp": timestamp}
+
+    def _lookup(ids):
+        """Query the nucleus table for some ids and map them to their roots."""
+        nuc_df = client.materialize.query_table(
+            "nuclei_v1", filter_in_dict={"id": ids}, **query_kwargs
+        )
+        return dict(
+            zip(
+                nuc_df["id"].astype(np.int64).tolist(),
+                nuc_df["pt_root_id"].astype(np.int64).tolist(),
+            )
+        )
+
+    # queries every id at once #
+    try:
+        found = _lookup(nuc_ids)
+
+    # queries each id separately so one bad id doesn't remove the rest #
+    except:
+        found = {}
+        for nuc_id in nuc_ids:
+            try:
+                found.update(_lookup([nuc_id]))
+            except:
+                pass
+
+    # treats nuclei outside any segment (root 0) as not found #
+    return {x: found[x] if found.get(x, 0) != 0 else None for x in nuc_ids}
+
+
+def resolveIds(input_list, config={}, timestamp=None, materialization_version=None):
+    """Sort input ids into fresh, removed, and outdated str root id lists.
+
+    18-digit entries are read as root ids and 7-digit entries as nucleus ids,
+    which are converted to root ids. All nucleus ids are looked up in one query
+    and all root ids are checked in one freshness call. Each output list keeps
+    the input order, and entries that can't be resolved are removed.
+
+    Keyword arguments:
+    input_list -- root or nucleus ids (list of strs)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    materialization_version -- version for nucleus lookups instead of timestamp (int, default None)
+    """
+    input_list = [str(x) for x in input_list]
+
+    # converts every nucleus id at once #
+    nuc_roots = nucsToRoots(
+        [x for x in input_list if len(x) == 7 and x.isnumeric()],
+        config,
+        timestamp=timestamp,
+        materialization_version=materialization_version,
+    )
+
+    # pairs each entry with its root id, or None if it isn't one #
+    entries = []
+    for i in input_list:
+        if len(i) == 18 and i.isnumeric():
+            entries.append((i, int(i)))
+        elif len(i) == 7 and i.isnumeric():
+            entries.append((i, nuc_roots[int(i)]))
+        else:
+            entries.append((i, None))
+
+    # checks every root id at once #
+    freshness = checkFreshnessBulk(
+        [x[1] for x in entries if x[1] is not None], config, timestamp=timestamp
+    )
+
+    # splits entries by status #
+    fresh_entries = []
+    removed_entries = []
+    outdated_entries = []
+    for i, root_id in entries:
+        status = None if root_id is None else freshness[root_id]
+        if status == True:
+            fresh_entries.append(str(root_id))
+        elif status == False:
+            outdated_entries.append(str(root_id))
+        else:
+            removed_entries.append(i)
+
+    return [fresh_entries, removed_entries, outdated_entries]
+
+
+def splitInput(input_str):
+    """Split a comma-separated input string into a list of stripped str entries.
+
+    Keyword arguments:
+    input_str -- entries separated by commas, optionally bracketed or quoted (str)
+    """
+    input_list = [x.strip() for x in str(input_str).split(",")]
+    input_list = [x.strip("[") for x in input_list]
+    input_list = [x.strip("]") for x in input_list]
+    input_list = [x.strip("'") for x in input_list]
+    input_list = [x.strip('"') for x in input_list]
+    return input_list
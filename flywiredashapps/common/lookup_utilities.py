@@ -1,14 +1,84 @@
+import threading
+import time
 import flask
-from caveclient import CAVEclient
+from . import data_sources
+
+# seconds a client is kept in the pool before being rebuilt #
+CLIENT_TTL = 3600
+
+# maximum number of clients (datastack, server, token combinations) kept at once #
+CLIENT_POOL_SIZE = 64
+
+# size of each client's keep-alive http connection pool #
+CONNECTION_POOL_MAXSIZE = 16
+
+# pool of built clients keyed by (datastack, server_address, auth_token) #
+# each value is [client, time built, time last used] #
+_client_pool = {}
+_client_pool_lock = threading.Lock()
+
+
+def _evictClients(now):
+    """Remove expired clients and trim the pool to its maximum size.
+
+    Keyword Arguments:
+    now -- current time from time.monotonic() (float)
+    """
+
+    # drops clients that were built longer ago than the ttl #
+    expired = [
+        key for key, entry in _client_pool.items() if now - entry[1] > CLIENT_TTL
+    ]
+    for key in expired:
+        del _client_pool[key]
+
+    # drops least recently used clients if the pool is still too large #
+    if len(_client_pool) > CLIENT_POOL_SIZE:
+        by_age = sorted(_client_pool, key=lambda key: _client_pool[key][2])
+        for key in by_age[: len(_client_pool) - CLIENT_POOL_SIZE]:
+            del _client_pool[key]
 
 
 def make_client(datastack, server_address):
-    """Build a framework client with appropriate auth token.
-    
+    """Get a pooled framework client with appropriate auth token.
+
+    Clients are reused across calls and requests for the same datastack, server,
+    and auth token, so their http sessions and info-service lookups are shared.
+    If create_app registered an offline data source for the datastack, that
+    source is returned instead.
+
     Keyword Arguments:
     datastack -- Datastack name for client (str)
     server_address -- Global server address for the client (str)
     """
+    # offline sources are shared by every user #
+    source = data_sources.getSource(datastack)
+    if source is not None:
+        return source
+
     auth_token = flask.g.get("auth_token", None)
-    client = CAVEclient(datastack, server_address=server_address, auth_token=auth_token)
-    return client
+
+    # tokens are part of the key so users never share a client #
+    key = (datastack, server_address, auth_token)
+    now = time.monotonic()
+
+    with _client_pool_lock:
+        _evictClients(now)
+        entry = _client_pool.get(key)
+        if entry is not None:
+            entry[2] = now
+            return entry[0]
+
+    # builds new client outside the lock since it makes network calls #
+    client = data_sources.CaveDataSource(
+        datastack,
+        server_address=server_address,
+        auth_token=auth_token,
+        pool_maxsize=CONNECTION_POOL_MAXSIZE,
+    )
+
+    # keeps whichever client was pooled first if another thread raced us #
+    with _client_pool_lock:
+        entry = _client_pool.setdefault(key, [client, now, now])
+        entry[2] = now
+        return entry[0]
@@ -0,0 +1,129 @@
+import datetime
+import threading
+import time
+from . import lookup_utilities
+
+# default seconds the list of versions is reused before being looked up again, #
+# overridable with config["materialization_ttl"] #
+MATERIALIZATION_TTL = 60
+
+# metadata keyed by (datastack, server_address) #
+# each value is a dict of "versions", "timestamps" and "tables" keyed by version, and "looked_up" #
+_metadata = {}
+_metadata_lock = threading.Lock()
+
+
+def _entry(config={}):
+    """Get the metadata entry of a datastack, looking up its versions if they are stale.
+
+    Timestamps and tables of a version never change, so they are kept across
+    refreshes of the version list.
+
+    Keyword Arguments:
+    config -- config settings (dict, default {})
+    """
+    key = (config.get("datastack", None), config.get("server_address", None))
+    ttl = config.get("materialization_ttl", MATERIALIZATION_TTL)
+    now = time.monotonic()
+
+    with _metadata_lock:
+        entry = _metadata.get(key)
+        if entry is not None and now - entry["looked_up"] < ttl:
+            return entry
+
+    # looks up versions outside the lock since it makes a network call #
+    client = lookup_utilities.make_client(*key)
+    versions = sorted(int(x) for x in client.materialize.get_versions())
+
+    with _metadata_lock:
+        entry = _metadata.setdefault(
+            key, {"versions": [], "timestamps": {}, "tables": {}, "looked_up": now}
+        )
+        entry["versions"] = versions
+        entry["looked_up"] = now
+        return entry
+
+
+def _naiveUtc(stamp):
+    """Convert a timestamp to naive utc without microseconds, like time_utilities.getTime.
+
+    Keyword Arguments:
+    stamp -- timestamp (datetime object)
+    """
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return stamp.replace(microsecond=0)
+
+
+def clearMetadata():
+    """Drop all cached metadata so the next lookup asks the services again."""
+    with _metadata_lock:
+        _metadata.clear()
+
+
+def getLatestVersion(config={}):
+    """Get the latest materialization version of the configured datastack.
+
+    Keyword Arguments:
+    config -- config settings (dict, default {})
+    """
+    return getVersions(config)[-1]
+
+
+def getTables(config={}, version=None):
+    """Get the names of the tables in a materialization version.
+
+    Keyword Arguments:
+    config -- config settings (dict, default {})
+    version -- materialization version, latest if None (int, default None)
+    """
+    entry = _entry(config)
+    if version is None:
+        version = entry["versions"][-1]
+
+    with _metadata_lock:
+        if version in entry["tables"]:
+            return entry["tables"][version]
+
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+    tables = list(client.materialize.get_tables(version=version))
+
+    with _metadata_lock:
+        entry["tables"][version] = tables
+    return tables
+
+
+def getTimestamp(config={}, version=None):
+    """Get the timestamp of a materialization version as naive utc.
+
+    Keyword Arguments:
+    config -- config settings (dict, default {})
+    version -- materialization version, latest if None (int, default None)
+    """
+    entry = _entry(config)
+    if version is None:
+        version = entry["versions"][-1]
+
+    with _metadata_lock:
+        if version in entry["timestamps"]:
+            return entry["timestamps"][version]
+
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+    stamp = _naiveUtc(client.materialize.get_timestamp(version=version))
+
+    with _metadata_lock:
+        entry["timestamps"][version] = stamp
+    return stamp
+
+
+def getVersions(config={}):
+    """Get the available materialization versions, oldest first.
+
+    Keyword Arguments:
+    config -- config settings (dict, default {})
+    """
+    return list(_entry(config)["versions"])
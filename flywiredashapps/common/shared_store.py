@@ -0,0 +1,161 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+
+# directory shared by every worker process, overridable with config["shared_store_dir"] #
+# multi-host deployments need it on a filesystem every host can reach #
+SHARED_STORE_DIR = os.path.join(tempfile.gettempdir(), "flywiredashapps")
+
+# seconds between sweeps for expired entries #
+SWEEP_INTERVAL = 60
+
+# directory in use, set by configure #
+_root = {"path": SHARED_STORE_DIR}
+
+
+def _remove(path):
+    """Delete a file, ignoring one that another process already removed.
+
+    Keyword Arguments:
+    path -- file to delete (str)
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class SharedStore:
+    """Values shared by every worker process through pickled files in one directory.
+
+    Worker processes each keep their own memory, so state that a later
+    request may read, such as a stored graph or a background job, lives here
+    instead of in a module-level dict. Entries expire after ttl seconds
+    without being read or written, and the least recently used entries are
+    dropped once the directory grows past byte_budget.
+    """
+
+    def __init__(self, namespace, ttl, byte_budget):
+        """Create a store for one kind of value.
+
+        Keyword Arguments:
+        namespace -- subdirectory holding this store's entries (str)
+        ttl -- seconds an unused entry is kept (float)
+        byte_budget -- maximum total size of the entries on disk in bytes (int)
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self.byte_budget = byte_budget
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def _dir(self):
+        """Get this store's directory, creating it if needed."""
+        path = os.path.join(_root["path"], self.namespace)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _file(self, key):
+        """Get the file holding a key.
+
+        Keyword Arguments:
+        key -- key made of strings, numbers, and tuples (tuple)
+        """
+        name = hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+        return os.path.join(self._dir(), name + ".pkl")
+
+    def _sweep(self):
+        """Remove expired entries, then the least recently used ones over the byte budget."""
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+
+        entries = []
+        for entry in os.scandir(self._dir()):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                _remove(entry.path)
+            elif entry.name.endswith(".pkl"):
+                entries.append([stat.st_mtime, stat.st_size, entry.path])
+
+        total = sum(x[1] for x in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.byte_budget:
+                break
+            _remove(path)
+            total -= size
+
+    def delete(self, key):
+        """Remove a key if it is stored.
+
+        Keyword Arguments:
+        key -- key made of strings, numbers, and tuples (tuple)
+        """
+        _remove(self._file(key))
+
+    def get(self, key):
+        """Look up a key, returning (True, value) on a hit or (False, None) on a miss.
+
+        A hit counts as a use, so the entry's ttl starts over.
+
+        Keyword Arguments:
+        key -- key made of strings, numbers, and tuples (tuple)
+        """
+        path = self._file(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                _remove(path)
+                return False, None
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return False, None
+        return True, value
+
+    def has(self, key):
+        """Check whether a key is stored and unexpired, without counting it as a use.
+
+        Keyword Arguments:
+        key -- key made of strings, numbers, and tuples (tuple)
+        """
+        try:
+            return time.time() - os.path.getmtime(self._file(key)) <= self.ttl
+        except FileNotFoundError:
+            return False
+
+    def put(self, key, value):
+        """Store a value under a key, replacing any previous value.
+
+        Keyword Arguments:
+        key -- key made of strings, numbers, and tuples (tuple)
+        value -- picklable value
+        """
+        path = self._file(key)
+
+        # writes to a temporary file first so readers never see a partial entry #
+        temp_path = path + "." + uuid.uuid4().hex + ".tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+        self._sweep()
+
+
+def configure(config={}):
+    """Set the directory shared by worker processes from config["shared_store_dir"].
+
+    Keyword Arguments:
+    config -- config settings (dict, default {})
+    """
+    _root["path"] = config.get("shared_store_dir", SHARED_STORE_DIR)
+    return _root["path"]
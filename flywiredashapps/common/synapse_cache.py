@@ -0,0 +1,234 @@
+import datetime
+import functools
+import hashlib
+import inspect
+import sys
+import threading
+import time
+from collections import OrderedDict
+import flask
+import pandas as pd
+
+# total size in bytes of cached results allowed per worker process #
+CACHE_BYTE_BUDGET = 1024 ** 3
+
+# seconds that results queried at the current time stay valid #
+NOW_TTL = 300
+
+# timestamps within this many seconds of the current time are treated as "now" #
+NOW_WINDOW = 3600
+
+
+def tokenScope():
+    """Get a short, non-reversible identifier for the current request's auth token."""
+    try:
+        auth_token = flask.g.get("auth_token", None)
+    except RuntimeError:
+        # outside of a request (e.g. scripts) every call shares one scope #
+        auth_token = None
+
+    if auth_token is None:
+        return "anonymous"
+
+    return hashlib.sha256(str(auth_token).encode()).hexdigest()[:16]
+
+
+def _sizeOf(value):
+    """Estimate the memory footprint of a cached value in bytes.
+
+    Keyword Arguments:
+    value -- cached result, usually a list of [dataframe, message] or a dict
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_sizeOf(x) for x in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            _sizeOf(x) + _sizeOf(y) for x, y in value.items()
+        )
+    return sys.getsizeof(value)
+
+
+def _isNow(timestamp):
+    """Check whether a query timestamp refers to the current state of the data.
+
+    Keyword Arguments:
+    timestamp -- utc timestamp (datetime object or None)
+    """
+    if timestamp is None:
+        return True
+    if not isinstance(timestamp, datetime.datetime):
+        return False
+
+    # compares in naive utc to match getTime() #
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    age = (datetime.datetime.utcnow() - timestamp).total_seconds()
+    return age < NOW_WINDOW
+
+
+class SynapseCache:
+    """Thread-safe LRU cache of query results with a byte budget and optional TTLs."""
+
+    def __init__(self, byte_budget=CACHE_BYTE_BUDGET):
+        """Create an empty cache.
+
+        Keyword Arguments:
+        byte_budget -- maximum total size of cached values in bytes (int)
+        """
+        self.byte_budget = byte_budget
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key):
+        """Drop an entry and release its bytes. Caller must hold the lock."""
+        size = self._entries.pop(key)[1]
+        self._bytes -= size
+
+    def get(self, key):
+        """Look up a key, returning (True, value) on a hit or (False, None) on a miss.
+
+        Keyword Arguments:
+        key -- hashable cache key
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            expired = (
+                entry is not None
+                and entry[2] is not None
+                and entry[2] < time.monotonic()
+            )
+            if expired:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value, ttl=None):
+        """Store a value, evicting least recently used entries to stay in budget.
+
+        Keyword Arguments:
+        key -- hashable cache key
+        value -- value to store
+        ttl -- seconds until the entry expires, or None to keep until evicted
+        """
+        size = _sizeOf(value)
+
+        # values larger than the whole budget are never cached #
+        if size > self.byte_budget:
+            return
+
+        expires = None if ttl is None else time.monotonic() + ttl
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and self._bytes + size > self.byte_budget:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = (value, size, expires)
+            self._bytes += size
+
+    def getOrCompute(self, key, compute, ttl=None):
+        """Return the cached value for key, computing it once if it is missing.
+
+        Concurrent callers asking for the same missing key wait for the first
+        caller's result instead of repeating the query.
+
+        Keyword Arguments:
+        key -- hashable cache key
+        compute -- zero-argument function that produces the value
+        ttl -- seconds until a newly computed entry expires (default None)
+        """
+        while True:
+            hit, value = self.get(key)
+            if hit:
+                return value
+            with self._lock:
+                event = self._in_flight.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._in_flight[key] = event
+                    break
+            # another thread is computing this key, waits and then rechecks #
+            event.wait()
+
+        try:
+            value = compute()
+            self.put(key, value, ttl=ttl)
+            return value
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            event.set()
+
+    def clear(self):
+        """Remove all entries and reset counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+
+    def stats(self):
+        """Get hit, miss, eviction, and size counters as a dict."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "byte_budget": self.byte_budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# process-wide cache shared by every app #
+shared_cache = SynapseCache()
+
+
+def cached(func):
+    """Cache a synapse query function in the shared synapse cache.
+
+    Arguments are normalized against the function signature so positional and
+    keyword calls share entries. The key includes the caller's token scope, and
+    results queried at the current time expire after NOW_TTL seconds.
+
+    Keyword Arguments:
+    func -- function to wrap, whose arguments must be hashable
+    """
+    signature = inspect.signature(func)
+    name = func.__module__ + "." + func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (name, tokenScope(), tuple(bound.arguments.items()))
+
+        # results at "now" can go stale as segments are edited #
+        timestamp = bound.arguments.get("timestamp", None)
+        ttl = NOW_TTL if _isNow(timestamp) else None
+
+        return shared_cache.getOrCompute(
+            key, lambda: func(*args, **kwargs), ttl=ttl
+        )
+
+    wrapper.cache = shared_cache
+    return wrapper
@@ -0,0 +1,309 @@
+import datetime
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc
+from . import lookup_utilities
+
+# file names inside a store directory #
+METADATA_FILE = "metadata.json"
+INDEX_FILES = {
+    "pre_pt_root_id": "synapses_by_pre.arrow",
+    "post_pt_root_id": "synapses_by_post.arrow",
+}
+
+# other tables saved alongside the synapses by ingestSnapshot, for offline data sources #
+SNAPSHOT_TABLES = ["nuclei_v1", "neuron_information_v2"]
+
+# rows per record batch written to the index files #
+STORE_BATCH_SIZE = 1000000
+
+# opened stores keyed by datastack name #
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _naiveUtc(stamp):
+    """Convert a timestamp to naive utc like getTime, or None if missing.
+
+    Keyword Arguments:
+    stamp -- timestamp (datetime object, iso str, or None)
+    """
+    if stamp is None:
+        return None
+    if isinstance(stamp, str):
+        stamp = datetime.datetime.fromisoformat(stamp)
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return stamp.replace(microsecond=0)
+
+
+class SynapseStore:
+    """Read-only local snapshot of the synapse table with sorted root id indexes.
+
+    The snapshot is kept twice, sorted by pre_pt_root_id and by
+    post_pt_root_id, as uncompressed Arrow IPC files that are memory-mapped
+    rather than loaded. A lookup binary-searches the sorted root column and
+    slices the matching rows, so only those rows are ever read from disk. Rows
+    carry neuropils with the same columns as synapse_utilities.joinNeuropils.
+    """
+
+    def __init__(self, path, pinned=False):
+        """Open a store written by ingestDataFrame.
+
+        Keyword Arguments:
+        path -- directory of the store (str)
+        pinned -- serve every query from the snapshot regardless of timestamp,
+            e.g. for offline use or testing (bool, default False)
+        """
+        self.path = path
+        self.pinned = pinned
+
+        with open(os.path.join(path, METADATA_FILE), "r") as f:
+            self.metadata = json.load(f)
+        self.materialization_version = self.metadata.get(
+            "materialization_version", None
+        )
+        self.timestamp = _naiveUtc(self.metadata.get("timestamp", None))
+
+        # memory-maps each index and keeps zero-copy views of its sorted root column #
+        # each record batch is a partition, and partition bounds narrow every search #
+        self._tables = {}
+        self._partitions = {}
+        for column, file_name in INDEX_FILES.items():
+            source = pa.memory_map(os.path.join(path, file_name), "r")
+            table = pa.ipc.open_file(source).read_all()
+            keys = [
+                chunk.to_numpy(zero_copy_only=True)
+                for chunk in table.column(column).chunks
+                if len(chunk) > 0
+            ]
+            self._tables[column] = table
+            self._partitions[column] = {
+                "keys": keys,
+                "offsets": np.cumsum([0] + [len(x) for x in keys]),
+                "firsts": np.array([x[0] for x in keys], dtype=np.int64),
+                "lasts": np.array([x[-1] for x in keys], dtype=np.int64),
+            }
+
+    def covers(self, timestamp=None, materialization_version=None):
+        """Check whether a query can be answered from this snapshot.
+
+        Keyword Arguments:
+        timestamp -- utc timestamp of the query (datetime object, default None)
+        materialization_version -- version of the query (int, default None)
+        """
+        if self.pinned == True:
+            return True
+        if materialization_version is not None:
+            return materialization_version == self.materialization_version
+        if timestamp is not None and self.timestamp is not None:
+            return _naiveUtc(timestamp) == self.timestamp
+        return False
+
+    def _rows(self, column, root_ids):
+        """Get row positions in one index whose sorted column matches any root id.
+
+        Keyword Arguments:
+        column -- indexed root column to search (str)
+        root_ids -- root ids to find (list of ints)
+        """
+        partitions = self._partitions[column]
+        root_ids = np.unique(np.asarray(root_ids, dtype=np.int64))
+
+        rows = []
+        for root_id in root_ids:
+            # finds the partitions whose key range can hold this root #
+            first = np.searchsorted(partitions["lasts"], root_id, side="left")
+            last = np.searchsorted(partitions["firsts"], root_id, side="right")
+            for n in range(first, last):
+                keys = partitions["keys"][n]
+                start = np.searchsorted(keys, root_id, side="left")
+                end = np.searchsorted(keys, root_id, side="right")
+                if end > start:
+                    offset = partitions["offsets"][n]
+                    rows.append(np.arange(offset + start, offset + end))
+
+        if len(rows) == 0:
+            return np.array([], dtype=np.int64)
+        return np.concatenate(rows)
+
+    def query(self, pre_roots=None, post_roots=None):
+        """Get synapses whose partners are in the given root id lists.
+
+        At least one list must be given. The shorter list is looked up in its
+        sorted index and the result is then filtered by the other list.
+
+        Keyword Arguments:
+        pre_roots -- upstream root ids to match (list of ints, default None)
+        post_roots -- downstream root ids to match (list of ints, default None)
+        """
+        if pre_roots is None and post_roots is None:
+            raise ValueError("Store queries need pre_roots, post_roots, or both.")
+
+        # searches the index of whichever side has fewer ids #
+        if post_roots is None or (
+            pre_roots is not None and len(pre_roots) <= len(post_roots)
+        ):
+            column, roots = "pre_pt_root_id", pre_roots
+            other_column, other_roots = "post_pt_root_id", post_roots
+        else:
+            column, roots = "post_pt_root_id", post_roots
+            other_column, other_roots = "pre_pt_root_id", pre_roots
+
+        table = self._tables[column]
+        rows = self._rows(column, roots)
+        out_table = table.take(pa.array(rows, type=pa.int64()))
+
+        # filters by the other side's ids if given #
+        if other_roots is not None:
+            mask = pc.is_in(
+                out_table.column(other_column),
+                value_set=pa.array(np.asarray(other_roots, dtype=np.int64)),
+            )
+            out_table = out_table.filter(mask)
+
+        return out_table.to_pandas()
+
+    def toPandas(self):
+        """Load the whole snapshot as one dataframe, sorted by pre_pt_root_id."""
+        return self._tables["pre_pt_root_id"].to_pandas()
+
+
+def ingestDataFrame(syn_df, path, materialization_version=None, timestamp=None):
+    """Write a merged synapse and neuropil table to a new store directory.
+
+    Keyword Arguments:
+    syn_df -- synapses with neuropils, columns as from joinNeuropils (dataframe)
+    path -- directory to write, created if missing (str)
+    materialization_version -- version the table was taken from (int, default None)
+    timestamp -- utc timestamp of that version (datetime object, default None)
+    """
+    os.makedirs(path, exist_ok=True)
+    table = pa.Table.from_pandas(syn_df, preserve_index=False)
+
+    # writes one copy of the table sorted by each indexed root column #
+    for column, file_name in INDEX_FILES.items():
+        order = pc.sort_indices(table, sort_keys=[(column, "ascending")])
+        sorted_table = table.take(order)
+        with pa.OSFile(os.path.join(path, file_name), "wb") as sink:
+            with pa.ipc.new_file(sink, sorted_table.schema) as writer:
+                writer.write_table(sorted_table, max_chunksize=STORE_BATCH_SIZE)
+
+    # writes metadata last so partially written stores fail to open #
+    timestamp = _naiveUtc(timestamp)
+    metadata = {
+        "materialization_version": materialization_version,
+        "timestamp": None if timestamp is None else timestamp.isoformat(),
+        "num_synapses": len(syn_df),
+        "columns": list(syn_df.columns),
+    }
+    with open(os.path.join(path, METADATA_FILE), "w") as f:
+        json.dump(metadata, f)
+
+
+def ingestSnapshot(
+    path, config={}, materialization_version=None, tables=SNAPSHOT_TABLES
+):
+    """Download a materialization version of the synapse tables into a new store.
+
+    The whole table is paged into memory before being sorted, so this is meant
+    for offline preparation rather than from inside a running app. Each of the
+    other tables is saved as tables/<name>.parquet for offline data sources.
+
+    Keyword Arguments:
+    path -- directory to write (str)
+    config -- config settings (dict, default {})
+    materialization_version -- version to download, None for latest (int, default None)
+    tables -- other tables to save (list of str, default SNAPSHOT_TABLES)
+    """
+    from . import synapse_utilities
+
+    # sets client #
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+
+    if materialization_version is None:
+        materialization_version = max(client.materialize.get_versions())
+    timestamp = client.materialize.get_timestamp(version=materialization_version)
+
+    # pages through every synapse, joining neuropils page by page #
+    pages = synapse_utilities.PagedQuery(
+        client,
+        "synapses_nt_v1",
+        max_pages=None,
+        materialization_version=materialization_version,
+    )
+    syn_df = pd.concat(
+        [
+            synapse_utilities.joinNeuropils(
+                client, page, materialization_version=materialization_version
+            )
+            for page in pages
+        ],
+        ignore_index=True,
+    )
+
+    # saves the other tables first, since metadata written last marks the store complete #
+    os.makedirs(os.path.join(path, "tables"), exist_ok=True)
+    for table in tables:
+        table_df = synapse_utilities.queryAllPages(
+            client,
+            table,
+            max_pages=None,
+            materialization_version=materialization_version,
+        )
+        table_df.to_parquet(
+            os.path.join(path, "tables", table + ".parquet"), index=False
+        )
+
+    ingestDataFrame(
+        syn_df,
+        path,
+        materialization_version=materialization_version,
+        timestamp=timestamp,
+    )
+
+
+def configure(config={}):
+    """Open the store named in config, if any, and register it for its datastack.
+
+    Set config["synapse_store"] to a store directory to enable the local
+    backend, and config["synapse_store_pinned"] to True to serve every query
+    from it regardless of timestamp.
+
+    Keyword Arguments:
+    config -- config settings (dict, default {})
+    """
+    path = config.get("synapse_store", None)
+    if path is None:
+        return None
+
+    datastack = config.get("datastack", None)
+    pinned = config.get("synapse_store_pinned", False)
+
+    with _stores_lock:
+        store = _stores.get(datastack)
+        if store is None or store.path != path or store.pinned != pinned:
+            store = SynapseStore(path, pinned=pinned)
+            _stores[datastack] = store
+    return store
+
+
+def getStore(datastack_name, timestamp=None, materialization_version=None):
+    """Get the registered store for a datastack if it can answer a query, else None.
+
+    Keyword Arguments:
+    datastack_name -- name of datastack (str)
+    timestamp -- utc timestamp of the query (datetime object, default None)
+    materialization_version -- version of the query (int, default None)
+    """
+    store = _stores.get(datastack_name)
+    if store is not None and store.covers(timestamp, materialization_version):
+        return store
+    return None
@@ -0,0 +1,452 @@
+import numpy as np
+import pandas as pd
+from . import concurrency, lookup_utilities, synapse_cache, synapse_store
+
+# maximum number of synapse ids sent in one neuropil query #
+NEUROPIL_CHUNK_SIZE = 10000
+
+# maximum number of neuropil chunk queries run at once per join #
+NEUROPIL_JOIN_WORKERS = 4
+
+# rows requested per synapse page, matching the server's per-query cap #
+SYNAPSE_PAGE_SIZE = 200000
+
+# maximum number of page queries run for one query before the result is marked truncated #
+MAX_SYNAPSE_PAGES = 25
+
+# columns of the raw synapse tables that callers read, kept from each page as it arrives #
+RAW_SYN_COLUMNS = [
+    "idsyn",
+    "pre_pt_root_id",
+    "post_pt_root_id",
+    "pre_pt_position",
+    "post_pt_position",
+    "cleft_score",
+    "gaba",
+    "ach",
+    "glut",
+    "oct",
+    "ser",
+    "da",
+    "neuropil",
+]
+
+
+def _rawColumns(syn_df):
+    """Keep only the RAW_SYN_COLUMNS of a synapse table with neuropils.
+
+    Keyword arguments:
+    syn_df -- synapses with neuropils, as from joinNeuropils (dataframe)
+    """
+    return syn_df[[x for x in RAW_SYN_COLUMNS if x in syn_df.columns]]
+
+
+def cullSyn(raw_syn_df, cleft_thresh=0.0):
+    """Drop low-cleft, autapse, and zero-root synapses from a raw synapse table.
+
+    All three filters are applied as one vectorized mask, so this is cheap
+    enough to run on every read of a cached raw table.
+
+    Keyword arguments:
+    raw_syn_df -- unfiltered merged synapse table from getRawSyn (dataframe)
+    cleft_thresh -- cleft score threshold to drop synapses (float, default 0.0)
+    """
+
+    pre = raw_syn_df["pre_pt_root_id"].to_numpy()
+    post = raw_syn_df["post_pt_root_id"].to_numpy()
+
+    # builds masks for each filter step #
+    cleft_mask = raw_syn_df["cleft_score"].to_numpy() >= float(cleft_thresh)
+    aut_mask = cleft_mask & (pre != post)
+    keep_mask = aut_mask & (pre != 0) & (post != 0)
+
+    # counts synapses remaining after each filter step #
+    raw_num = len(raw_syn_df)
+    cleft_num = int(cleft_mask.sum())
+    aut_num = int(aut_mask.sum())
+    zeroot_num = int(keep_mask.sum())
+
+    syn_df = raw_syn_df[keep_mask].reset_index(drop=True)
+
+    # constructs feedback message using previous counts #
+    output_message = (
+        str(raw_num - cleft_num)
+        + " synapses below threshold, "
+        + str(cleft_num - aut_num)
+        + " autapses, and "
+        + str(aut_num - zeroot_num)
+        + " synapses on segments with ID '0' were removed for a total of "
+        + str(raw_num - zeroot_num)
+        + " bad synapses culled. \n"
+    )
+
+    # adds message if the query stopped before every page was pulled #
+    if raw_syn_df.attrs.get("truncated", False) == True:
+        output_message = (
+            "!Query capped at " + str(raw_num) + " entries!\n" + output_message
+        )
+
+    return [syn_df, output_message]
+
+
+def getRawSyn(
+    pre_root=0,
+    post_root=0,
+    datastack_name=None,
+    server_address=None,
+    timestamp=None,
+    filter_list=None,
+    cached=True,
+):
+    """Get an unfiltered table of synapses with neuropils for a root id.
+
+    Reads from the local synapse store when one is configured for the datastack
+    and covers the timestamp, and otherwise from the live query, cached unless
+    cached is False. Only RAW_SYN_COLUMNS are kept. Entries are keyed by root,
+    direction, and timestamp only, so changing the cleft threshold reuses the
+    same query. Callers should
+    filter the result with cullSyn and must not modify it in place.
+
+    Keyword arguments:
+    pre_root -- root id of upstream neuron, 0 for upstream queries (int, default 0)
+    post_root -- root id of downstream neuron, 0 for downstream queries (int, default 0)
+    datastack_name -- name of datastack (str, default None)
+    server_address -- address of hosting server (str, default None)
+    timestamp -- utc timestamp (datetime object, default None)
+    filter_list -- partner root ids to filter results by (tuple of ints, default None)
+    cached -- read and fill the synapse cache for live queries (bool, default True)
+    """
+
+    # local lookups are fast enough that they skip the cache #
+    store = synapse_store.getStore(datastack_name, timestamp=timestamp)
+    if store is not None:
+        return queryStoreSyn(store, pre_root, post_root, filter_list)
+
+    query = _getCachedRawSyn if cached == True else queryRawSyn
+    return query(
+        pre_root=pre_root,
+        post_root=post_root,
+        datastack_name=datastack_name,
+        server_address=server_address,
+        timestamp=timestamp,
+        filter_list=filter_list,
+    )
+
+
+@synapse_cache.cached
+def _getCachedRawSyn(
+    pre_root=0,
+    post_root=0,
+    datastack_name=None,
+    server_address=None,
+    timestamp=None,
+    filter_list=None,
+):
+    """Get a cached live query of synapses with neuropils, see getRawSyn."""
+    return queryRawSyn(
+        pre_root=pre_root,
+        post_root=post_root,
+        datastack_name=datastack_name,
+        server_address=server_address,
+        timestamp=timestamp,
+        filter_list=filter_list,
+    )
+
+
+def queryStoreSyn(store, pre_root=0, post_root=0, filter_list=None):
+    """Look up synapses with neuropils for a root id in a local synapse store.
+
+    Keyword arguments:
+    store -- opened local snapshot (synapse_store.SynapseStore)
+    pre_root -- root id of upstream neuron, 0 for upstream queries (int, default 0)
+    post_root -- root id of downstream neuron, 0 for downstream queries (int, default 0)
+    filter_list -- partner root ids to filter results by (tuple of ints, default None)
+    """
+
+    # handles downstream queries, optionally filtering partners by filter_list #
+    if post_root == 0:
+        syn_df = store.query(pre_roots=[int(pre_root)], post_roots=filter_list)
+    # handles upstream queries, optionally filtering partners by filter_list #
+    elif pre_root == 0:
+        syn_df = store.query(pre_roots=filter_list, post_roots=[int(post_root)])
+    # handles id pair queries #
+    else:
+        syn_df = store.query(pre_roots=[int(pre_root)], post_roots=[int(post_root)])
+
+    # the snapshot is complete, so results are never capped #
+    syn_df = _rawColumns(syn_df)
+    syn_df.attrs["truncated"] = False
+
+    return syn_df
+
+
+def queryRawSyn(
+    pre_root=0,
+    post_root=0,
+    datastack_name=None,
+    server_address=None,
+    timestamp=None,
+    filter_list=None,
+):
+    """Query an uncached, unfiltered table of synapses with neuropils for a root id.
+
+    Always queries the live service, see getRawSyn for reads from the local
+    synapse store.
+
+    Keyword arguments:
+    pre_root -- root id of upstream neuron, 0 for upstream queries (int, default 0)
+    post_root -- root id of downstream neuron, 0 for downstream queries (int, default 0)
+    datastack_name -- name of datastack (str, default None)
+    server_address -- address of hosting server (str, default None)
+    timestamp -- utc timestamp (datetime object, default None)
+    filter_list -- partner root ids to filter results by (tuple of ints, default None)
+    """
+
+    # sets client #
+    client = lookup_utilities.make_client(datastack_name, server_address)
+
+    # builds synapse table filter based on query direction #
+    # handles downstream queries, optionally filtering partners by filter_list #
+    if post_root == 0:
+        filter_in_dict = {"pre_pt_root_id": [int(pre_root)]}
+        if filter_list != None:
+            filter_in_dict["post_pt_root_id"] = list(filter_list)
+    # handles upstream queries, optionally filtering partners by filter_list #
+    elif pre_root == 0:
+        filter_in_dict = {"post_pt_root_id": [int(post_root)]}
+        if filter_list != None:
+            filter_in_dict["pre_pt_root_id"] = list(filter_list)
+    # handles id pair queries #
+    else:
+        filter_in_dict = {
+            "pre_pt_root_id": [int(pre_root)],
+            "post_pt_root_id": [int(post_root)],
+        }
+
+    # pages through synapses, joining neuropil info onto each page as it arrives #
+    # and dropping unread columns so only the narrowed rows are kept #
+    pages = PagedQuery(
+        client, "synapses_nt_v1", filter_in_dict=filter_in_dict, timestamp=timestamp,
+    )
+    syn_pages = [
+        _rawColumns(joinNeuropils(client, page, timestamp=timestamp)) for page in pages
+    ]
+
+    syn_df = pd.concat(syn_pages, ignore_index=True)
+    syn_df.attrs["truncated"] = pages.truncated
+
+    return syn_df
+
+
+def joinNeuropils(
+    client,
+    raw_syn_df,
+    timestamp=None,
+    materialization_version=None,
+    chunk_size=NEUROPIL_CHUNK_SIZE,
+):
+    """Inner-join neuropil info onto a synapse table by querying id chunks concurrently.
+
+    Chunks are merged into preallocated columns as they arrive, so only the
+    chunks in flight are held in memory alongside the result. Columns and
+    suffixes match pd.merge(raw_syn_df, np_df, left_on="id", right_on="target_id",
+    how="inner", suffixes=["syn", "np"]).
+
+    Keyword arguments:
+    client -- framework client used for the queries (CAVEclient)
+    raw_syn_df -- synapse table with an "id" column (dataframe)
+    timestamp -- utc timestamp (datetime object, default None)
+    materialization_version -- version to query instead of a timestamp (int, default None)
+    chunk_size -- maximum number of ids per query (int, default NEUROPIL_CHUNK_SIZE)
+    """
+    syn_ids = raw_syn_df["id"].to_numpy()
+
+    # splits ids into bounded chunks, each fetched by its own query #
+    chunks = [syn_ids[i : i + chunk_size] for i in range(0, len(syn_ids), chunk_size)]
+    tasks = {
+        n: (
+            lambda chunk=chunk: client.materialize.query_table(
+                "fly_synapses_neuropil",
+                filter_in_dict={"id": chunk},
+                timestamp=timestamp,
+                materialization_version=materialization_version,
+                merge_reference=False,
+            )
+        )
+        for n, chunk in enumerate(chunks)
+    }
+
+    # maps synapse ids to their row positions for placing each chunk #
+    positions = pd.Index(syn_ids)
+    matched = np.zeros(len(syn_ids), dtype=bool)
+    np_columns = {}
+
+    for _, np_chunk in concurrency.iterConcurrently(
+        tasks, timeout=None, max_workers=NEUROPIL_JOIN_WORKERS
+    ):
+        rows = positions.get_indexer(np_chunk["target_id"].to_numpy())
+        found = rows >= 0
+        rows = rows[found]
+        matched[rows] = True
+
+        # allocates each column on first sight and fills in this chunk's rows #
+        for column in np_chunk.columns:
+            values = np_chunk[column].to_numpy()[found]
+            if column not in np_columns:
+                np_columns[column] = np.empty(len(syn_ids), dtype=values.dtype)
+            np_columns[column][rows] = values
+
+    # handles empty neuropil results with the merge's column layout #
+    if len(np_columns) == 0:
+        np_columns = {
+            "id": np.empty(len(syn_ids), dtype=np.int64),
+            "valid": np.empty(len(syn_ids), dtype=bool),
+            "target_id": np.empty(len(syn_ids), dtype=np.int64),
+            "neuropil": np.empty(len(syn_ids), dtype=object),
+        }
+
+    # keeps matched rows only and suffixes overlapping column names like the merge #
+    syn_df = raw_syn_df[matched].reset_index(drop=True)
+    overlap = [x for x in np_columns if x in syn_df.columns]
+    syn_df = syn_df.rename(columns={x: x + "syn" for x in overlap})
+    np_df = pd.DataFrame(
+        {
+            (x + "np" if x in overlap else x): values[matched]
+            for x, values in np_columns.items()
+        }
+    )
+
+    return pd.concat([syn_df, np_df], axis=1)
+
+
+class PagedQuery:
+    """Iterate over every page of a table query past the server's per-query cap.
+
+    The service returns rows in no guaranteed order, so a full page can't
+    show which rows it left out. Pages are therefore read over explicit id
+    ranges: a range that comes back short holds every row in it and is
+    yielded, while a range that comes back full is split at the median id
+    of the page and both halves are queried again. Ranges are yielded in
+    ascending id order as they complete, so callers can fold each page into
+    their results without holding every page at once. At least one
+    (possibly empty) page is always yielded. If max_pages queries run with
+    ranges still unread, the rows already seen in those ranges are yielded
+    instead and truncated is set to True.
+
+    Keyword arguments:
+    client -- framework client used for the queries (CAVEclient)
+    table -- name of table to query (str)
+    page_size -- rows requested per query, at least 2 (int, default SYNAPSE_PAGE_SIZE)
+    max_pages -- maximum number of queries run, None for no limit (int, default MAX_SYNAPSE_PAGES)
+    **kwargs -- passed on to client.materialize.query_table
+    """
+
+    def __init__(
+        self,
+        client,
+        table,
+        page_size=SYNAPSE_PAGE_SIZE,
+        max_pages=MAX_SYNAPSE_PAGES,
+        **kwargs
+    ):
+        self.client = client
+        self.table = table
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.kwargs = kwargs
+        self.truncated = False
+
+    def _queryRange(self, low_id, high_id):
+        """Query up to page_size rows with low_id < id < high_id, sorted by id.
+
+        Keyword arguments:
+        low_id -- exclusive lower id bound, None for no bound (int)
+        high_id -- exclusive upper id bound, None for no bound (int)
+        """
+        kwargs = dict(self.kwargs)
+        greater = dict(kwargs.pop("filter_greater_dict", None) or {})
+        less = dict(kwargs.pop("filter_less_dict", None) or {})
+        if low_id is not None:
+            greater["id"] = low_id
+        if high_id is not None:
+            less["id"] = high_id
+        if len(greater) > 0:
+            kwargs["filter_greater_dict"] = greater
+        if len(less) > 0:
+            kwargs["filter_less_dict"] = less
+
+        page = self.client.materialize.query_table(
+            self.table, limit=self.page_size, **kwargs
+        )
+        if len(page) > 1:
+            page = page.sort_values("id", kind="stable", ignore_index=True)
+        return page
+
+    def __iter__(self):
+        self.truncated = False
+
+        # starts from any id bounds the caller gave, read as a stack of ranges #
+        # each range carries the rows already seen in it, None for the first #
+        ranges = [
+            (
+                (self.kwargs.get("filter_greater_dict", None) or {}).get("id", None),
+                (self.kwargs.get("filter_less_dict", None) or {}).get("id", None),
+                None,
+            )
+        ]
+        empty_page = None
+        yielded = False
+        queries = 0
+
+        while len(ranges) > 0:
+            if self.max_pages is not None and queries >= self.max_pages:
+                self.truncated = True
+                break
+            low_id, high_id, _ = ranges.pop()
+            page = self._queryRange(low_id, high_id)
+            queries += 1
+            if empty_page is None:
+                empty_page = page.iloc[:0]
+
+            # a short page holds every row in its range #
+            if len(page) < self.page_size:
+                if len(page) > 0:
+                    yielded = True
+                    yield page
+                continue
+
+            # a full page may have skipped rows, so splits its range and reads both halves #
+            # the lower half is pushed last so ranges complete in ascending id order #
+            half = len(page) // 2
+            split_id = int(page["id"].iloc[half - 1])
+            ranges.append((split_id, high_id, page.iloc[half:]))
+            ranges.append((low_id, split_id + 1, page.iloc[:half]))
+
+        # falls back on the rows already seen in ranges left unread #
+        while len(ranges) > 0:
+            seen_page = ranges.pop()[2]
+            if seen_page is not None and len(seen_page) > 0:
+                yielded = True
+                yield seen_page.reset_index(drop=True)
+
+        # always yields a page so callers keep the table's columns #
+        if yielded == False and empty_page is not None:
+            yield empty_page
+
+
+def queryAllPages(client, table, **kwargs):
+    """Query every row of a table past the server's per-query cap as one dataframe.
+
+    Use PagedQuery directly to fold pages into a result one at a time. The
+    result's attrs["truncated"] is True if PagedQuery stopped at its page
+    limit.
+
+    Keyword arguments:
+    client -- framework client used for the queries (CAVEclient)
+    table -- name of table to query (str)
+    **kwargs -- passed on to PagedQuery and client.materialize.query_table
+    """
+    pages = PagedQuery(client, table, **kwargs)
+    out_df = pd.concat(list(pages), ignore_index=True)
+    out_df.attrs["truncated"] = pages.truncated
+    return out_df
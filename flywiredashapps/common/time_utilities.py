@@ -0,0 +1,83 @@
+import calendar
+import datetime
+import numpy as np
+from . import lookup_utilities, materialization
+
+# default policy for snapping "now" queries, one of "bucket", "materialization", or "none" #
+DEFAULT_SNAP_POLICY = "bucket"
+
+# default width in seconds of the time buckets used by the "bucket" policy #
+DEFAULT_BUCKET_SECONDS = 60
+
+
+def getTime():
+    """Get current time in datetime.datetime format.
+    """
+    return datetime.datetime.utcnow().replace(microsecond=0)
+
+
+def snapTime(config={}, now=None):
+    """Map the current time onto the shared timestamp given by the snapping policy.
+
+    The policy is set by config["timestamp_snap"]: "bucket" rounds down to a
+    multiple of config["timestamp_bucket_seconds"], "materialization" uses the
+    timestamp of the latest materialization version, and "none" leaves the time
+    unchanged.
+
+    Keyword Arguments:
+    config -- config settings (dict, default {})
+    now -- current utc time (datetime object, default None for getTime())
+    """
+    if now == None:
+        now = getTime()
+
+    policy = config.get("timestamp_snap", DEFAULT_SNAP_POLICY)
+
+    if policy == "bucket":
+        bucket = int(config.get("timestamp_bucket_seconds", DEFAULT_BUCKET_SECONDS))
+        unix = calendar.timegm(now.utctimetuple())
+        return datetime.datetime.utcfromtimestamp(unix - unix % bucket)
+    elif policy == "materialization":
+        return min(materialization.getTimestamp(config), now)
+    else:
+        return now
+
+
+def snapForRoots(root_ids, config={}, now=None):
+    """Snap "now" for queries on root ids without serving outdated results.
+
+    The snapped time is only used if every root id is the latest version of its
+    segment both now and at the snapped time, i.e. none were edited in between.
+    Otherwise the exact current time is returned.
+
+    Keyword Arguments:
+    root_ids -- root ids the query is about (list of ints)
+    config -- config settings (dict, default {})
+    now -- current utc time (datetime object, default None for getTime())
+    """
+    if now == None:
+        now = getTime()
+
+    snapped = snapTime(config, now)
+    if snapped == now or len(root_ids) == 0:
+        return now
+
+    # sets client #
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+
+    # checks that no root changed between the snapped time and now #
+    root_ids = [int(x) for x in root_ids]
+    try:
+        fresh_now = client.chunkedgraph.is_latest_roots(root_ids, timestamp=now)
+        fresh_snapped = client.chunkedgraph.is_latest_roots(
+            root_ids, timestamp=snapped
+        )
+    except Exception:
+        return now
+
+    if np.all(fresh_now) and np.all(fresh_snapped):
+        return snapped
+    else:
+        return now
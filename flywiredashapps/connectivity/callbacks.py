@@ -72,10 +72,13 @@ def register_callbacks(app, config=None):
             pass
 
         # sets timestamp to current time if no input or converts string input to datetime #
+        # current time is snapped to a shared timestamp once the root id is known #
         if timestamp == None or timestamp == "":
             timestamp = getTime()
+            snap_timestamp = True
         else:
             timestamp = strToDatetime(timestamp)
+            snap_timestamp = False
 
         # handles bad input (which results in a None output from strToDatetime) #
         if timestamp == None:
@@ -172,6 +175,8 @@ def register_callbacks(app, config=None):
             message = "Nucleus ID is invalid, please check it and try again."
         elif root_id == "invalid root id":
             message = "Root ID is invalid, please check it and try again."
+        elif root_id == "invalid coords":
+            message = "No segment found at these coordinates. Offline data sources can only look up coordinates at synapse locations."
 
         # returns specific error message if idConvert fails #
         if len(str(root_id)) != 18:
@@ -192,11 +197,39 @@ def register_callbacks(app, config=None):
                 "",
             ]
 
-        # FRESHNESS CHECKER TEMPORARILY DISABLED #
-        # handles bad return from freshness checker #
+        # handles 0 ids if they somehow make it through all previous filters #
+        if root_id == 0:
+            return [
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                "Entry must be 18-digit root id, 7-digit nucleus id, or x,y,z coordinates in 4x4x40nm resolution.",
+                1,
+                "",
+            ]
+        else:
+            pass
+
+        # queries freshness, nucleus, and synapses concurrently #
+        # default "now" queries are snapped to a shared timestamp if the root is unchanged #
         try:
-            fresh = checkFreshness(root_id, config=config, timestamp=timestamp)
-        except:
+            fetched = fetchNeuronData(
+                root_id,
+                cleft_thresh,
+                config=config,
+                timestamp=timestamp,
+                filter_list=filter_list,
+                snap_timestamp=snap_timestamp,
+            )
+        except TimeoutError:
             return [
                 no_update,
                 no_update,
@@ -209,13 +242,15 @@ def register_callbacks(app, config=None):
                 no_update,
                 no_update,
                 no_update,
-                "Entry must be 18-digit root id, 7-digit nucleus id, or x,y,z coordinates in 16x16x40nm resolution.",
+                "Query timed out, please try again or add a filter list to narrow the results.",
                 1,
                 "",
             ]
 
-        # handles outdated ids #
-        if fresh == False:
+        # FRESHNESS CHECKER TEMPORARILY DISABLED #
+        # handles bad return from freshness checker #
+        fresh = fetched["fresh"]
+        if isinstance(fresh, Exception):
             return [
                 no_update,
                 no_update,
@@ -228,15 +263,13 @@ def register_callbacks(app, config=None):
                 no_update,
                 no_update,
                 no_update,
-                "Root ID is outdated or not valid at the given timestamp, please refresh the segment or use x,y,z coordinates in 16x16x40nm resolution.",
+                "Entry must be 18-digit root id, 7-digit nucleus id, or x,y,z coordinates in 16x16x40nm resolution.",
                 1,
                 "",
             ]
-        else:
-            pass
 
-        # handles 0 ids if they somehow make it through all previous filters #
-        if root_id == 0:
+        # handles outdated ids #
+        if fresh == False:
             return [
                 no_update,
                 no_update,
@@ -249,21 +282,21 @@ def register_callbacks(app, config=None):
                 no_update,
                 no_update,
                 no_update,
-                "Entry must be 18-digit root id, 7-digit nucleus id, or x,y,z coordinates in 4x4x40nm resolution.",
+                "Root ID is outdated or not valid at the given timestamp, please refresh the segment or use x,y,z coordinates in 16x16x40nm resolution.",
                 1,
                 "",
             ]
         else:
             pass
 
+        # raises any failed data query as the sequential version would have #
+        if "error" in fetched:
+            raise fetched["error"]
+        timestamp = fetched["timestamp"]
+        bundle = fetched["bundle"]
+
         # builds dataframes and graphs #
-        sum_list = makeSummaryDataFrame(
-            root_id,
-            cleft_thresh,
-            config=config,
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )
+        sum_list = bundle.makeSummaryDataFrame(nuc_df=fetched["nuc_df"])
         sum_df = sum_list[0]
 
         # clunky but necessary handling for bad ids that make it through all previous filters #
@@ -289,54 +322,12 @@ def register_callbacks(app, config=None):
             pass
 
         # creates partner dataframes, violin plots, and pie charts #
-        up_df = makePartnerDataFrame(
-            root_id,
-            cleft_thresh,
-            upstream=True,
-            config=config,
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )
-        down_df = makePartnerDataFrame(
-            root_id,
-            cleft_thresh,
-            upstream=False,
-            config=config,
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )
-        up_violin = makeViolin(
-            root_id,
-            cleft_thresh,
-            incoming=True,
-            config=config,
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )
-        down_violin = makeViolin(
-            root_id,
-            cleft_thresh,
-            incoming=False,
-            config=config,
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )
-        up_pie = makePie(
-            root_id,
-            cleft_thresh,
-            incoming=True,
-            config=config,
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )
-        down_pie = makePie(
-            root_id,
-            cleft_thresh,
-            incoming=False,
-            config=config,
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )
+        up_df = bundle.makePartnerDataFrame(upstream=True)
+        down_df = bundle.makePartnerDataFrame(upstream=False)
+        up_violin = bundle.makeViolin(incoming=True)
+        down_violin = bundle.makeViolin(incoming=False)
+        up_pie = bundle.makePie(incoming=True)
+        down_pie = bundle.makePie(incoming=False)
 
         # assigns df values to 'cols' and 'data' for passing to dash table #
         sum_cols = [{"name": i, "id": i,} for i in sum_df.columns]
@@ -1,5 +1,3 @@
-import cloudvolume
-from functools import lru_cache
 import pandas as pd
 import numpy as np
 import plotly.express as px
@@ -10,7 +8,111 @@ import time
 import calendar
 import datetime
 from nglui.statebuilder import *
-from ..common import lookup_utilities
+from ..common import (
+    cell_types,
+    concurrency,
+    data_sources,
+    lookup_utilities,
+    synapse_utilities,
+    time_utilities,
+)
+
+# neurotransmitter score columns of the synapse table #
+NT_COLUMNS = ["gaba", "ach", "glut", "oct", "ser", "da"]
+
+# sets color coding for neuropil regions #
+NP_COLOR_DICT = {
+    # SNP, pink #
+    "SLP_L": "ff007f",
+    "SLP_R": "ff007f",
+    "SIP_L": "ff70b7",
+    "SIP_R": "ff70b7",
+    "SMP_L": "ff99cb",
+    "SMP_R": "ff99cb",
+    # LH, magenta #
+    "LH_L": "ff00ff",
+    "LH_R": "ff00ff",
+    # MB, blue-purple #
+    "MB_CA_L": "7f00ff",
+    "MB_CA_R": "7f00ff",
+    "MB_PED_L": "a852ff",
+    "MB_PED_R": "a852ff",
+    "MB_VL_L": "c48aff",
+    "MB_VL_R": "c48aff",
+    "MB_ML_L": "d9b3ff",
+    "MB_ML_R": "d9b3ff",
+    # AL, blue #
+    "AL_L": "0000ff",
+    "AL_R": "0000ff",
+    # INP, cyan-blue #
+    "CRE_L": "007fff",
+    "CRE_R": "007fff",
+    "SCL_L": "2e95ff",
+    "SCL_R": "2e95ff",
+    "ICL_L": "61afff",
+    "ICL_R": "61afff",
+    "IB_L": "80bfff",
+    "IB_R": "80bfff",
+    "ATL_L": "a8d3ff",
+    "ATL_R": "a8d3ff",
+    # VLNP, cyan #
+    "AOTU_L": "00cccc",
+    "AOTU_R": "00cccc",
+    "AVLP_L": "00ffff",
+    "AVLP_R": "00ffff",
+    "PVLP_L": "52ffff",
+    "PVLP_R": "52ffff",
+    "PLP_L": "269e9e",
+    "PLP_R": "269e9e",
+    "WED_L": "85ffff",
+    "WED_R": "85ffff",
+    # OL, blue-green #
+    "ME_L": "00f57a",
+    "ME_R": "00f57a",
+    "AME_L": "1fff8f",
+    "AME_R": "1fff8f",
+    "LO_L": "57ffab",
+    "LO_R": "57ffab",
+    "LOP_L": "85ffc2",
+    "LOP_R": "85ffc2",
+    # CX, yellow-green #
+    "FB": "5ebd00",
+    "EB": "7dfa00",
+    "PB": "a8fd53",
+    "NO": "ccff99",
+    # LX, yellow #
+    "BU_L": "ffff00",
+    "BU_R": "ffff00",
+    "GA": "a6a600",
+    "LAL_L": "ffff8f",
+    "LAL_R": "ffff8f",
+    # VMNP, orange-yellow #
+    "VES_L": "cc9600",
+    "VES_R": "cc9600",
+    "EPA_L": "ffbe05",
+    "EPA_R": "ffbe05",
+    "GOR_L": "ffcf47",
+    "GOR_R": "ffcf47",
+    "SPS_L": "ffdc7a",
+    "SPS_R": "ffdc7a",
+    "IPS_L": "ffe7a3",
+    "IPS_R": "ffe7a3",
+    # PENP, red-orange #
+    "AMMC_L": "e04400",
+    "AMMC_R": "e04400",
+    "FLA_L": "ff590f",
+    "FLA_R": "ff590f",
+    "CAN_L": "ff8752",
+    "CAN_R": "ff8752",
+    "PRW": "ffbc9e",
+    "SAD": "C1663E",
+    # GNG, red #
+    "GNG": "ff0000",
+    # Other & Unknown, <1% grey & black #
+    "Other": "efefef",
+    "Unknown": "000000",
+}
+
 
 def buildAllsynLink(query_id, cleft_thresh, nucleus, config={}, timestamp=None, filter_list=None):
     """Generate neuroglancer link with all synapses associated with queried neuron.
@@ -391,14 +493,8 @@ def coordsToRoot(coords, config={}, timestamp=None):
         config.get("datastack", None), config.get("server_address", None)
     )
 
-    # sets cloud volume #
-    cv = cloudvolume.CloudVolume(
-        "graphene://https://prod.flywire-daf.com/segmentation/1.0/fly_v31",
-        use_https=True,
-    )
-
-    # determines resolution of volume #
-    res = cv.resolution
+    # determines resolution of volume from the data source's segmentation #
+    res = client.get_resolution()
 
     # converts coordinates using volume resolution #
     cv_xyz = [
@@ -408,7 +504,7 @@ def coordsToRoot(coords, config={}, timestamp=None):
     ]
 
     # sets point by passing converted coords to 'download_point' method #
-    point = int(cv.download_point(cv_xyz, size=1,))
+    point = int(client.download_point(cv_xyz, size=1,))
 
     # looks up sv's associated root id, converts to string #
     root_result = str(
@@ -427,6 +523,111 @@ def datetimeToUnix(stamp):
     return calendar.timegm(stamp.utctimetuple())
 
 
+def fetchNeuronData(
+    root_id,
+    cleft_thresh,
+    config={},
+    timestamp=None,
+    filter_list=None,
+    snap_timestamp=False,
+):
+    """Run the independent queries for one neuron concurrently.
+
+    Freshness, nucleus, and both synapse directions are queried in parallel,
+    and each synapse query joins its own neuropils as soon as its synapse ids
+    arrive. When snap_timestamp is set, the data is fetched speculatively at the
+    snapped time while the snap is validated, and refetched at the validated
+    time if they differ. Returns a dict with "fresh" (bool or the exception it
+    raised), "timestamp" (the time the data was queried at), and either
+    "bundle" and "nuc_df", or "error" if a data query failed. Raises
+    TimeoutError if a query exceeds config["query_timeout"] seconds.
+
+    Keyword arguments:
+    root_id -- 18-digit root id number (int)
+    cleft_thresh -- cleft score threshold to drop synapses (float)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp, the current time if snapping (datetime object, default None)
+    filter_list -- root ids for filtering results (tuple of ints, default None)
+    snap_timestamp -- whether to snap the current time to a shared timestamp (bool, default False)
+    """
+    timeout = config.get("query_timeout", concurrency.DEFAULT_TIMEOUT)
+
+    def dataTasks(query_time):
+        """Build nucleus and synapse query tasks at a given timestamp."""
+        return {
+            "nuc": lambda: getNuc(
+                root_id, getResolution(), config=config, timestamp=query_time
+            ),
+            "up": lambda: getSyn(
+                pre_root=0,
+                post_root=root_id,
+                cleft_thresh=cleft_thresh,
+                datastack_name=config.get("datastack", None),
+                server_address=config.get("server_address", None),
+                timestamp=query_time,
+                filter_list=filter_list,
+            ),
+            "down": lambda: getSyn(
+                pre_root=root_id,
+                post_root=0,
+                cleft_thresh=cleft_thresh,
+                datastack_name=config.get("datastack", None),
+                server_address=config.get("server_address", None),
+                timestamp=query_time,
+                filter_list=filter_list,
+            ),
+        }
+
+    # fetches at the snapped time while checking freshness and the snap itself #
+    if snap_timestamp == True:
+        query_time = time_utilities.snapTime(config, now=timestamp)
+    else:
+        query_time = timestamp
+    tasks = dataTasks(query_time)
+    tasks["fresh"] = lambda: checkFreshness(root_id, config=config, timestamp=timestamp)
+    if snap_timestamp == True:
+        tasks["snap"] = lambda: time_utilities.snapForRoots(
+            [root_id], config, now=timestamp
+        )
+    results = concurrency.runConcurrently(
+        tasks, timeout=timeout, return_exceptions=True
+    )
+
+    # refetches at the validated time if the root changed since the snapped time #
+    if snap_timestamp == True:
+        validated_time = results["snap"]
+        if isinstance(validated_time, Exception):
+            validated_time = timestamp
+        if validated_time != query_time and results["fresh"] == True:
+            query_time = validated_time
+            results.update(
+                concurrency.runConcurrently(
+                    dataTasks(query_time), timeout=timeout, return_exceptions=True
+                )
+            )
+
+    fetched = {"fresh": results["fresh"], "timestamp": query_time}
+
+    # passes on the first failed data query for the caller to report #
+    for name in ["nuc", "up", "down"]:
+        if isinstance(results[name], Exception):
+            fetched["error"] = results[name]
+            return fetched
+
+    fetched["nuc_df"] = results["nuc"]
+    fetched["bundle"] = NeuronSynapseBundle(
+        root_id,
+        cleft_thresh,
+        config=config,
+        timestamp=query_time,
+        filter_list=filter_list,
+        up_query=results["up"],
+        down_query=results["down"],
+    )
+
+    return fetched
+
+
 def getNuc(root_id, res, config={}, timestamp=None):
     """Build a dataframe of nucleus table data in string format.
 
@@ -491,7 +692,6 @@ def getResolution():
 
 
 
-@lru_cache(maxsize=None)
 def getSyn(
     pre_root=0,
     post_root=0,
@@ -501,7 +701,7 @@ def getSyn(
     timestamp=None,
     filter_list=None,
 ):
-    """Create a cached table of synapses for a given root id.
+    """Create a table of synapses for a given root id from the cached raw query.
 
     Keyword arguments:
     pre_root -- single int-format root id number for upstream neuron (default 0)
@@ -513,162 +713,18 @@ def getSyn(
     filter_list -- list of str-format ids to filter results (default None)
     """
 
-    # sets client #
-    client = lookup_utilities.make_client(datastack_name, server_address)
-
-    if post_root == 0:
-
-        # TEMPORARILY DISABLED JOIN QUERY #
-        # syn_df = client.materialize.join_query(
-        #     [["synapses_nt_v1", "id"], ["fly_synapses_neuropil", "id"],],
-        #     filter_in_dict={"synapses_nt_v1": {"pre_pt_root_id": [pre_root]}},
-        #     suffixes=["syn", "nuc"],
-        #     # materialization_version=mat_vers,
-        #     timestamp=timestamp,
-        # )
-
-        # creates df that includes neuropil regions using root id #
-        # optionally fiters query using filter_list #
-        # if no filter list, skips this step #
-        if filter_list == None:
-            raw_syn_df = client.materialize.query_table(
-                "synapses_nt_v1",
-                filter_in_dict={"pre_pt_root_id": [pre_root]},
-                timestamp=timestamp,
-            )
-        else:
-            # performs query with filter tuple #
-            raw_syn_df = client.materialize.query_table(
-                "synapses_nt_v1",
-                filter_in_dict={
-                    "pre_pt_root_id": [pre_root],
-                    "post_pt_root_id": filter_list,
-                },
-                timestamp=timestamp,
-            )
-        np_df = client.materialize.query_table(
-            "fly_synapses_neuropil",
-            # filters using array of syn ids from raw_syn_df #
-            filter_in_dict={"id": np.array(raw_syn_df["id"])},
-            timestamp=timestamp,
-            merge_reference=False,
-        )
-        syn_df = pd.merge(
-            raw_syn_df,
-            np_df,
-            left_on="id",
-            right_on="target_id",
-            how="inner",
-            suffixes=["syn", "np"],
-        )
-
-    elif pre_root == 0:
-        # creates df that includes neuropil regions using root id #
-        # TEMPORARILY UNUSED JOIN QUERY #
-        # syn_df = client.materialize.join_query(
-        #     [["synapses_nt_v1", "id"], ["fly_synapses_neuropil", "id"],],
-        #     filter_in_dict={"synapses_nt_v1": {"post_pt_root_id": [post_root]}},
-        #     suffixes=["syn", "nuc"],
-        #     # materialization_version=mat_vers,
-        #     timestamp=timestamp,
-        # )
-        # optionally fiters query using filter_list #
-        if filter_list == None:
-            raw_syn_df = client.materialize.query_table(
-                "synapses_nt_v1",
-                filter_in_dict={"post_pt_root_id": [post_root]},
-                timestamp=timestamp,
-            )
-        else:
-            raw_syn_df = client.materialize.query_table(
-                "synapses_nt_v1",
-                filter_in_dict={
-                    "post_pt_root_id": [post_root],
-                    "pre_pt_root_id": filter_list,
-                },
-                timestamp=timestamp,
-            )
-        np_df = client.materialize.query_table(
-            "fly_synapses_neuropil",
-            # filters using array of syn ids from raw_syn_df #
-            filter_in_dict={"id": np.array(raw_syn_df["id"])},
-            timestamp=timestamp,
-            merge_reference=False,
-        )
-        syn_df = pd.merge(
-            raw_syn_df,
-            np_df,
-            left_on="id",
-            right_on="target_id",
-            how="inner",
-            suffixes=["syn", "np"],
-        )
-    else:
-        raw_syn_df = client.materialize.query_table(
-            "synapses_nt_v1",
-            filter_in_dict={
-                "pre_pt_root_id": [int(pre_root)],
-                "post_pt_root_id": [int(post_root)],
-            },
-            timestamp=timestamp,
-        )
-        np_df = client.materialize.query_table(
-            "fly_synapses_neuropil",
-            # filters using array of syn ids from raw_syn_df #
-            filter_in_dict={"id": np.array(raw_syn_df["id"])},
-            timestamp=timestamp,
-            merge_reference=False,
-        )
-        syn_df = pd.merge(
-            raw_syn_df,
-            np_df,
-            left_on="id",
-            right_on="target_id",
-            how="inner",
-            suffixes=["syn", "np"],
-        )
-
-    # sets the raw number of synapses equal to the length of the df #
-    raw_num = len(syn_df)
-
-    # removes synapses below cleft threshold #
-    syn_df = syn_df[syn_df["cleft_score"] >= float(cleft_thresh)].reset_index(drop=True)
-
-    # sets the number of synapses after removing those that fail the cleft score filter #
-    cleft_num = len(syn_df)
-
-    # removes autapses #
-    syn_df = syn_df[syn_df["pre_pt_root_id"] != syn_df["post_pt_root_id"]].reset_index(
-        drop=True
-    )
-
-    # sets the number of synapses after removing autapses #
-    aut_num = len(syn_df)
-
-    # removes 0-roots #
-    syn_df = syn_df[syn_df["pre_pt_root_id"] != 0].reset_index(drop=True)
-    syn_df = syn_df[syn_df["post_pt_root_id"] != 0].reset_index(drop=True)
-
-    # sets the number of synapses after removing zero-roots #
-    zeroot_num = len(syn_df)
-
-    # constructs output message by calculating how many synapses were removed at each filter step #
-    output_message = (
-        str(raw_num - cleft_num)
-        + " synapses below threshold, "
-        + str(cleft_num - aut_num)
-        + " autapses, and "
-        + str(aut_num - zeroot_num)
-        + " synapses on segments with ID '0' were removed for a total of "
-        + str(raw_num - zeroot_num)
-        + " bad synapses culled. \n"
+    # gets unfiltered synapses, cached independently of cleft threshold #
+    raw_syn_df = synapse_utilities.getRawSyn(
+        pre_root=int(pre_root),
+        post_root=int(post_root),
+        datastack_name=datastack_name,
+        server_address=server_address,
+        timestamp=timestamp,
+        filter_list=filter_list,
     )
 
-    # adds message if query was capped by server #
-    if raw_num == 200000:
-        output_message = "!Query capped at 200K entires!\n" + output_message
-
-    return [syn_df, output_message]
+    # removes bad synapses and returns list with [df, message] #
+    return synapse_utilities.cullSyn(raw_syn_df, cleft_thresh)
 
 
 def getSynNoCache(
@@ -692,172 +748,19 @@ def getSynNoCache(
     filter_list -- list of str-format ids to filter results (default None)
     """
 
-    # sets client #
-    client = lookup_utilities.make_client(datastack_name, server_address)
-
-    if post_root == 0:
-        # creates df that includes neuropil regions using root id #
-        # CURRENTLY UNUSED JOIN QUERY #
-        # syn_df = client.materialize.join_query(
-        #     [["synapses_nt_v1", "id"], ["fly_synapses_neuropil", "id"],],
-        #     filter_in_dict={"synapses_nt_v1": {"pre_pt_root_id": [pre_root]}},
-        #     suffixes=["syn", "nuc"],
-        #     # materialization_version=mat_vers,
-        #     timestamp=timestamp,
-        # )
-        # optionally fiters query using filter_list #
-        if filter_list == None:
-            raw_syn_df = client.materialize.query_table(
-                "synapses_nt_v1",
-                filter_in_dict={"pre_pt_root_id": [pre_root]},
-                timestamp=timestamp,
-            )
-        else:
-            raw_syn_df = client.materialize.query_table(
-                "synapses_nt_v1",
-                filter_in_dict={
-                    "pre_pt_root_id": [pre_root],
-                    "post_pt_root_id": filter_list,
-                },
-                timestamp=timestamp,
-            )
-
-        np_df = client.materialize.query_table(
-            "fly_synapses_neuropil",
-            # filters using array of syn ids from raw_syn_df #
-            filter_in_dict={"id": np.array(raw_syn_df["id"])},
-            timestamp=timestamp,
-            merge_reference=False,
-        )
-        syn_df = pd.merge(
-            raw_syn_df,
-            np_df,
-            left_on="id",
-            right_on="target_id",
-            how="inner",
-            suffixes=["syn", "np"],
-        )
-    elif pre_root == 0:
-        # creates df that includes neuropil regions using root id #
-        # CURRENTLY UNUSED JOIN QUERY #
-        # syn_df = client.materialize.join_query(
-        #     [["synapses_nt_v1", "id"], ["fly_synapses_neuropil", "id"],],
-        #     filter_in_dict={"synapses_nt_v1": {"post_pt_root_id": [post_root]}},
-        #     suffixes=["syn", "nuc"],
-        #     # materialization_version=mat_vers,
-        #     timestamp=timestamp,
-        # )
-        if filter_list == None:
-            raw_syn_df = client.materialize.query_table(
-                "synapses_nt_v1",
-                filter_in_dict={"post_pt_root_id": [post_root]},
-                timestamp=timestamp,
-            )
-        else:
-            raw_syn_df = client.materialize.query_table(
-                "synapses_nt_v1",
-                filter_in_dict={
-                    "post_pt_root_id": [post_root],
-                    "pre_pt_root_id": filter_list,
-                },
-                timestamp=timestamp,
-            )
-
-        np_df = client.materialize.query_table(
-            "fly_synapses_neuropil",
-            # filters using array of syn ids from raw_syn_df #
-            filter_in_dict={"id": np.array(raw_syn_df["id"])},
-            timestamp=timestamp,
-            merge_reference=False,
-        )
-        syn_df = pd.merge(
-            raw_syn_df,
-            np_df,
-            left_on="id",
-            right_on="target_id",
-            how="inner",
-            suffixes=["syn", "np"],
-        )
-    else:
-        # creates df that includes neuropil regions using root id #
-        # CURRENTLY UNUSED JOIN QUERY #
-        # syn_df = client.materialize.join_query(
-        #     [["synapses_nt_v1", "id"], ["fly_synapses_neuropil", "id"],],
-        #     filter_in_dict={
-        #         "synapses_nt_v1": {
-        #             "pre_pt_root_id": [pre_root],
-        #             "post_pt_root_id": [post_root],
-        #         }
-        #     },
-        #     suffixes=["syn", "nuc"],
-        #     # materialization_version=mat_vers,
-        #     timestamp=timestamp,
-        # )
-        raw_syn_df = client.materialize.query_table(
-            "synapses_nt_v1",
-            filter_in_dict={
-                "pre_pt_root_id": [int(pre_root)],
-                "post_pt_root_id": [int(post_root)],
-            },
-            timestamp=timestamp,
-        )
-        np_df = client.materialize.query_table(
-            "fly_synapses_neuropil",
-            # filters using array of syn ids from raw_syn_df #
-            filter_in_dict={"id": np.array(raw_syn_df["id"])},
-            timestamp=timestamp,
-            merge_reference=False,
-        )
-        syn_df = pd.merge(
-            raw_syn_df,
-            np_df,
-            left_on="id",
-            right_on="target_id",
-            how="inner",
-            suffixes=["syn", "np"],
-        )
-
-    # sets raw number of synapses by counting length of df #
-    raw_num = len(syn_df)
-
-    # removes synapses below cleft threshold #
-    syn_df = syn_df[syn_df["cleft_score"] >= float(cleft_thresh)].reset_index(drop=True)
-
-    # sets number of synapses after removing those that fail the cleft score filter #
-    cleft_num = len(syn_df)
-
-    # removes autapses #
-    syn_df = syn_df[syn_df["pre_pt_root_id"] != syn_df["post_pt_root_id"]].reset_index(
-        drop=True
-    )
-
-    # sets number of synapses elft after removing autapses #
-    aut_num = len(syn_df)
-
-    # removes 0-roots #
-    syn_df = syn_df[syn_df["pre_pt_root_id"] != 0].reset_index(drop=True)
-    syn_df = syn_df[syn_df["post_pt_root_id"] != 0].reset_index(drop=True)
-
-    # sets number of synapses elft after removing zero-roots #
-    zeroot_num = len(syn_df)
-
-    # sets output message by calculating number of synapses removed at each step #
-    output_message = (
-        str(raw_num - cleft_num)
-        + " synapses below threshold, "
-        + str(cleft_num - aut_num)
-        + " autapses, and "
-        + str(aut_num - zeroot_num)
-        + " synapses on segments with ID '0' were removed for a total of "
-        + str(raw_num - zeroot_num)
-        + " bad synapses culled. \n"
+    # queries unfiltered synapses without touching the cache #
+    raw_syn_df = synapse_utilities.getRawSyn(
+        pre_root=int(pre_root),
+        post_root=int(post_root),
+        datastack_name=datastack_name,
+        server_address=server_address,
+        timestamp=timestamp,
+        filter_list=filter_list,
+        cached=False,
     )
 
-    # adds message warning user if query was capped by server #
-    if raw_num == 200000:
-        output_message = "!Query capped at 200K entires!\n" + output_message
-
-    return [syn_df, output_message]
+    # removes bad synapses and returns list with [df, message] #
+    return synapse_utilities.cullSyn(raw_syn_df, cleft_thresh)
 
 
 def getTime():
@@ -883,7 +786,10 @@ def idConvert(id_val, config, timestamp=None):
     # converts coordinates or list-format input into non-listed int
     if type(id_val) == list:
         if len(id_val) == 3:
-            id_val = coordsToRoot(id_val, config=config, timestamp=timestamp)
+            try:
+                id_val = coordsToRoot(id_val, config=config, timestamp=timestamp)
+            except data_sources.CoordinateLookupError:
+                return "invalid coords"
         else:
             id_val = int(id_val[0])
 
@@ -914,447 +820,309 @@ def idConvert(id_val, config, timestamp=None):
         return 0
 
 
-def makePartnerDataFrame(
-    root_id, cleft_thresh, upstream=False, config={}, timestamp=None, filter_list=None
-):
-    """Make dataframe with summary info.
-
-    Keyword arguments:
-    root_id -- 18-digit int-format root id number
-    cleft_thresh -- float-format cleft score threshold
-    upstream -- Boolean that determines whether df is upstream or downstream (default False)
-    config -- dictionary of config settings (default {})
-    timestamp -- datetime format utc timestamp
-    filter_list -- str list of root ids to filter results by (default None)
+def markdownToInt(root_list):
+    """Convert markdown synatx back into int root ids.
+    
+    Keyword Arguments:
+    root_list -- list of root ids, may be mixed markdown and non-markdown
     """
 
-    # makes df of queried neuron synapses #
-    if upstream == True:
-        query_df = getSyn(
-            pre_root=0,
-            post_root=root_id,
-            cleft_thresh=cleft_thresh,
-            datastack_name=config.get("datastack", None),
-            server_address=config.get("server_address", None),
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )[0]
-        column_name = "pre_pt_root_id"
-        title_name = "Upstream Partner ID"
-    else:
-        query_df = getSyn(
-            pre_root=root_id,
-            post_root=0,
-            cleft_thresh=cleft_thresh,
-            datastack_name=config.get("datastack", None),
-            server_address=config.get("server_address", None),
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )[0]
-        column_name = "post_pt_root_id"
-        title_name = "Downstream Partner ID"
-
-    # creates array with unique IDs and counts occurrences of each #
-    unique_array = np.unique(query_df[column_name], return_counts=True)
-
-    # creates df out of unique_array #
-    partner_df = pd.DataFrame(
-        {title_name: unique_array[0], "Synapses": unique_array[1]}
-    )
-
-    # creates grouped dataframe of each partner means #
-    raw_nt_df = query_df.groupby([column_name], as_index=False).mean()
-
-    # drops all nonessential columns #
-    nt_df = raw_nt_df.filter(
-        [column_name, "gaba", "ach", "glut", "oct", "ser", "da",], axis=1,
-    )
-
-    # renames columns #
-    nt_df = nt_df.rename(
-        {
-            column_name: title_name,
-            "gaba": "Gaba Avg",
-            "ach": "Ach Avg",
-            "glut": "Glut Avg",
-            "oct": "Oct Avg",
-            "ser": "Ser Avg",
-            "da": "Da Avg",
-        },
-        axis=1,
-    )
-
-    # rounds NT values to 3 decimal places #
-    nt_df = nt_df.round(3)
+    # converts markdown back into normal root id #
+    output_list = []
+    for x in root_list:
+        if len(str(x)) > 18:
+            output_list.append(int(x[1:19]))
+        else:
+            output_list.append(int(x))
 
-    # adds neurotransmitter averages for each partner to partner df #
-    partner_df = partner_df.join(nt_df.set_index(title_name), on=title_name,)
+    return output_list
 
-    # sorts by number of synapses and resets index #
-    partner_df = (
-        partner_df.astype({"Synapses": int})
-        .sort_values(by="Synapses", ascending=False,)
-        .reset_index(drop=True)
-    )
 
-    # converts root ids into markdown-readable refeeder links #
-    partner_df[title_name] = [
-        refeedLink(str(x), config) for x in partner_df[title_name]
-    ]
+class NeuronSynapseBundle:
+    """Up- and downstream synapses of one neuron with the tables and figures built from them.
 
-    # needs to be converted to strings or the dash table will round the IDs #
-    return partner_df.astype(str)
+    Both directions are fetched once when the bundle is created, and partner
+    counts, neurotransmitter averages, and neuropil counts are aggregated in a
+    single groupby per direction. Every table and figure method reads from
+    those shared results.
+    """
 
+    def __init__(
+        self,
+        root_id,
+        cleft_thresh,
+        config={},
+        timestamp=None,
+        filter_list=None,
+        up_query=None,
+        down_query=None,
+    ):
+        """Fetch and aggregate synapses for a root id.
+
+        Keyword arguments:
+        root_id -- 18-digit root id number (int)
+        cleft_thresh -- cleft score threshold to drop synapses (float)
+        config -- config settings (dict, default {})
+        timestamp -- utc timestamp (datetime object, default None)
+        filter_list -- root ids for filtering results (tuple of ints, default None)
+        up_query -- prefetched [df, message] from an upstream getSyn (list, default None)
+        down_query -- prefetched [df, message] from a downstream getSyn (list, default None)
+        """
+        self.root_id = root_id
+        self.config = config
+        self.timestamp = timestamp
+
+        # runs up and downstream queries unless prefetched, each returning [df, message] #
+        if up_query == None:
+            up_query = getSyn(
+                pre_root=0,
+                post_root=root_id,
+                cleft_thresh=cleft_thresh,
+                datastack_name=config.get("datastack", None),
+                server_address=config.get("server_address", None),
+                timestamp=timestamp,
+                filter_list=filter_list,
+            )
+        if down_query == None:
+            down_query = getSyn(
+                pre_root=root_id,
+                post_root=0,
+                cleft_thresh=cleft_thresh,
+                datastack_name=config.get("datastack", None),
+                server_address=config.get("server_address", None),
+                timestamp=timestamp,
+                filter_list=filter_list,
+            )
+        self.up_df, self.up_message = up_query
+        self.down_df, self.down_message = down_query
 
-def makePie(
-    root_id, cleft_thresh, incoming=False, config={}, timestamp=None, filter_list=None
-):
-    """Create pie chart of relative synapse neuropils.
+        # aggregates each direction once, keyed by upstream/incoming bool #
+        self._aggregates = {
+            True: self._aggregate(self.up_df, "pre_pt_root_id"),
+            False: self._aggregate(self.down_df, "post_pt_root_id"),
+        }
 
-    Keyword arguments:
-    root_id -- root id number (int)
-    cleft_thresh -- cleft score threshold to drop synapses (float)
-    incoming -- incoming or outgoing synapses (bool, default False)
-    config -- dictionary of config settings (default {})
-    timestamp -- utc timestamp (datetime object, default None)
-    filter_list -- list of root ids to filter results by (str, default None)
-    """
+    @staticmethod
+    def _aggregate(query_df, column_name):
+        """Count synapses and average NT scores per partner and count neuropils.
 
-    # sets variable for incoming or outgoing synapses
-    if incoming == True:
-        query_df = getSyn(
-            pre_root=0,
-            post_root=root_id,
-            cleft_thresh=cleft_thresh,
-            datastack_name=config.get("datastack", None),
-            server_address=config.get("server_address", None),
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )[0]
-        title_name = "Incoming Synapse Neuropils"
-    elif incoming == False:
-        query_df = getSyn(
-            pre_root=root_id,
-            post_root=0,
-            cleft_thresh=cleft_thresh,
-            datastack_name=config.get("datastack", None),
-            server_address=config.get("server_address", None),
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )[0]
-        title_name = "Outgoing Synapse Neuropils"
-
-    # counts number of synapses to use as denominator in ratios #
-    num_syn = len(query_df)
-
-    # make dataframe with counts of each category of neuropil #
-    ratios_df = query_df.groupby(["neuropil"], as_index=False).count()
-
-    # drops all nonessential columns and renames those that remain #
-    ratios_df = ratios_df.filter(["neuropil", "idsyn"], axis=1)
-    ratios_df = ratios_df.rename({"neuropil": "Neuropil", "idsyn": "Ratio"}, axis=1)
-
-    # divides all counts by total number of synapses to get ratios #
-    ratios_df["Ratio"] = ratios_df["Ratio"] / num_syn
-
-    # sorts df from highest to lowest and fixes index #
-    ratios_df = ratios_df.sort_values(by=["Ratio"], ascending=False)
-    ratios_df.reset_index(inplace=True)
-
-    # consolidates all regions less than 1% into 'Other' #
-    ratios_df.loc[ratios_df["Ratio"] < 0.01, "Neuropil"] = "Other"
-
-    # renames 'None' as 'Unknown' #
-    ratios_df.loc[ratios_df["Neuropil"] == "None", "Neuropil"] = "Unknown"
-
-    # sets color coding for neuropil regions #
-    np_color_dict = {
-        # SNP, pink #
-        "SLP_L": "ff007f",
-        "SLP_R": "ff007f",
-        "SIP_L": "ff70b7",
-        "SIP_R": "ff70b7",
-        "SMP_L": "ff99cb",
-        "SMP_R": "ff99cb",
-        # LH, magenta #
-        "LH_L": "ff00ff",
-        "LH_R": "ff00ff",
-        # MB, blue-purple #
-        "MB_CA_L": "7f00ff",
-        "MB_CA_R": "7f00ff",
-        "MB_PED_L": "a852ff",
-        "MB_PED_R": "a852ff",
-        "MB_VL_L": "c48aff",
-        "MB_VL_R": "c48aff",
-        "MB_ML_L": "d9b3ff",
-        "MB_ML_R": "d9b3ff",
-        # AL, blue #
-        "AL_L": "0000ff",
-        "AL_R": "0000ff",
-        # INP, cyan-blue #
-        "CRE_L": "007fff",
-        "CRE_R": "007fff",
-        "SCL_L": "2e95ff",
-        "SCL_R": "2e95ff",
-        "ICL_L": "61afff",
-        "ICL_R": "61afff",
-        "IB_L": "80bfff",
-        "IB_R": "80bfff",
-        "ATL_L": "a8d3ff",
-        "ATL_R": "a8d3ff",
-        # VLNP, cyan #
-        "AOTU_L": "00cccc",
-        "AOTU_R": "00cccc",
-        "AVLP_L": "00ffff",
-        "AVLP_R": "00ffff",
-        "PVLP_L": "52ffff",
-        "PVLP_R": "52ffff",
-        "PLP_L": "269e9e",
-        "PLP_R": "269e9e",
-        "WED_L": "85ffff",
-        "WED_R": "85ffff",
-        # OL, blue-green #
-        "ME_L": "00f57a",
-        "ME_R": "00f57a",
-        "AME_L": "1fff8f",
-        "AME_R": "1fff8f",
-        "LO_L": "57ffab",
-        "LO_R": "57ffab",
-        "LOP_L": "85ffc2",
-        "LOP_R": "85ffc2",
-        # CX, yellow-green #
-        "FB": "5ebd00",
-        "EB": "7dfa00",
-        "PB": "a8fd53",
-        "NO": "ccff99",
-        # LX, yellow #
-        "BU_L": "ffff00",
-        "BU_R": "ffff00",
-        "GA": "a6a600",
-        "LAL_L": "ffff8f",
-        "LAL_R": "ffff8f",
-        # VMNP, orange-yellow #
-        "VES_L": "cc9600",
-        "VES_R": "cc9600",
-        "EPA_L": "ffbe05",
-        "EPA_R": "ffbe05",
-        "GOR_L": "ffcf47",
-        "GOR_R": "ffcf47",
-        "SPS_L": "ffdc7a",
-        "SPS_R": "ffdc7a",
-        "IPS_L": "ffe7a3",
-        "IPS_R": "ffe7a3",
-        # PENP, red-orange #
-        "AMMC_L": "e04400",
-        "AMMC_R": "e04400",
-        "FLA_L": "ff590f",
-        "FLA_R": "ff590f",
-        "CAN_L": "ff8752",
-        "CAN_R": "ff8752",
-        "PRW": "ffbc9e",
-        "SAD": "C1663E",
-        # GNG, red #
-        "GNG": "ff0000",
-        # Other & Unknown, <1% grey & black #
-        "Other": "efefef",
-        "Unknown": "000000",
-    }
-
-    # makes pie chart #
-    region_pie = px.pie(
-        ratios_df,
-        values="Ratio",
-        names="Neuropil",
-        title=title_name,
-        color="Neuropil",
-        color_discrete_map=np_color_dict,
-    )
+        Keyword arguments:
+        query_df -- filtered synapses in one direction (dataframe)
+        column_name -- column holding partner root ids (str)
+        """
 
-    # adds text labels inside pie chart slices #
-    region_pie.update_traces(
-        textposition="inside", textinfo="label",
-    )
+        # groups once and reuses the grouping for counts and means #
+        grouped = query_df.groupby(column_name, sort=True)
+        counts = grouped.size()
+        nt_means = grouped[NT_COLUMNS].mean()
 
-    # formats size of chart to match NTs #
-    region_pie.update_layout(
-        margin={"l": 5, "r": 5, "t": 25, "b": 5,}, width=400, height=200,
-    )
+        # counts synapses in each neuropil region #
+        neuropils = query_df["neuropil"].value_counts()
 
-    return region_pie
+        return {"counts": counts, "nt_means": nt_means, "neuropils": neuropils}
 
+    def makePartnerDataFrame(self, upstream=False):
+        """Make dataframe of partners with cell types, synapse counts and NT averages.
 
-def makeSummaryDataFrame(
-    root_id, cleft_thresh, config={}, timestamp=None, filter_list=None
-):
-    """Make dataframe with summary info.
+        Keyword arguments:
+        upstream -- whether df is upstream or downstream (bool, default False)
+        """
+        if upstream == True:
+            title_name = "Upstream Partner ID"
+        else:
+            title_name = "Downstream Partner ID"
 
-    Keyword arguments:
-    root_id -- 18-digit root id number (int)
-    cleft_thresh -- cleft score threshold (float)
-    config -- config settings (dict, default {})
-    timestamp -- utc timestamp (datetime object, default None)
-    filter_list -- root ids for filtering results (list of str, default None)
-    """
+        aggregate = self._aggregates[upstream]
 
-    # runs up and downstream queries and returns list with [df,message] #
-    up_query = getSyn(
-        pre_root=0,
-        post_root=root_id,
-        cleft_thresh=cleft_thresh,
-        datastack_name=config.get("datastack", None),
-        server_address=config.get("server_address", None),
-        timestamp=timestamp,
-        filter_list=filter_list,
-    )
-    down_query = getSyn(
-        pre_root=root_id,
-        post_root=0,
-        cleft_thresh=cleft_thresh,
-        datastack_name=config.get("datastack", None),
-        server_address=config.get("server_address", None),
-        timestamp=timestamp,
-        filter_list=filter_list,
-    )
+        # builds partner df from precomputed counts and rounded NT averages #
+        nt_df = aggregate["nt_means"].round(3).rename(
+            {
+                "gaba": "Gaba Avg",
+                "ach": "Ach Avg",
+                "glut": "Glut Avg",
+                "oct": "Oct Avg",
+                "ser": "Ser Avg",
+                "da": "Da Avg",
+            },
+            axis=1,
+        )
+        partner_df = pd.DataFrame(
+            {
+                title_name: aggregate["counts"].index.to_numpy(),
+                "Synapses": aggregate["counts"].to_numpy(),
+            }
+        )
+        partner_df = partner_df.join(nt_df, on=title_name)
 
-    # sets volume resolution #
-    res = getResolution()
+        # sorts by number of synapses and resets index #
+        partner_df = (
+            partner_df.astype({"Synapses": int})
+            .sort_values(by="Synapses", ascending=False,)
+            .reset_index(drop=True)
+        )
 
-    # makes df of query nucleus, upstream and downstream synapses #
-    nuc_df = getNuc(root_id, res, config=config, timestamp=timestamp,)
-    up_df = up_query[0]
-    down_df = down_query[0]
+        # adds each partner's most common cell type, pending while the index is #
+        # first built and blank if types can't be looked up #
+        try:
+            types = cell_types.mainCellTypes(
+                partner_df[title_name].tolist(), self.config, self.timestamp
+            )
+            type_list = [types[int(x)] for x in partner_df[title_name]]
+        except cell_types.IndexPendingError:
+            type_list = [cell_types.PENDING] * len(partner_df)
+        except Exception:
+            type_list = [""] * len(partner_df)
+        partner_df.insert(1, "Cell Type", type_list)
+
+        # converts root ids into markdown-readable refeeder links #
+        partner_df[title_name] = [
+            refeedLink(str(x), self.config) for x in partner_df[title_name]
+        ]
+
+        # needs to be converted to strings or the dash table will round the IDs #
+        return partner_df.astype(str)
+
+    def makePie(self, incoming=False):
+        """Create pie chart of relative synapse neuropils.
+
+        Keyword arguments:
+        incoming -- incoming or outgoing synapses (bool, default False)
+        """
+        if incoming == True:
+            num_syn = len(self.up_df)
+            title_name = "Incoming Synapse Neuropils"
+        else:
+            num_syn = len(self.down_df)
+            title_name = "Outgoing Synapse Neuropils"
 
-    # exception handling for segments without nuclei #
-    if nuc_df.empty:
-        nuc_df = pd.DataFrame(
-            {"Root ID": root_id, "Nuc ID": "n/a", "Nucleus Coordinates": "n/a",},
-            index=[0],
-        ).astype(str)
+        # divides precomputed neuropil counts by total synapses to get ratios #
+        neuropils = self._aggregates[incoming]["neuropils"]
+        ratios_df = pd.DataFrame(
+            {
+                "Neuropil": neuropils.index.to_numpy(),
+                "Ratio": neuropils.to_numpy() / num_syn,
+            }
+        )
 
-    # sets output message from up- and downstream messages #
-    output_message = (
-        "Upstream query results: "
-        + up_query[1]
-        + "Downstream query results: "
-        + down_query[1]
-    )
+        # consolidates all regions less than 1% into 'Other' #
+        ratios_df.loc[ratios_df["Ratio"] < 0.01, "Neuropil"] = "Other"
 
-    # calculates total synapses #
-    in_count = len(up_df)
-    out_count = len(down_df)
+        # renames 'None' as 'Unknown' #
+        ratios_df.loc[ratios_df["Neuropil"] == "None", "Neuropil"] = "Unknown"
 
-    # gets lists of pre and post synaptic partners #
-    upstream_partners = list(
-        up_df.drop_duplicates(subset="pre_pt_root_id")["pre_pt_root_id"]
-    )
-    downstream_partners = list(
-        down_df.drop_duplicates(subset="post_pt_root_id")["post_pt_root_id"]
-    )
+        # makes pie chart #
+        region_pie = px.pie(
+            ratios_df,
+            values="Ratio",
+            names="Neuropil",
+            title=title_name,
+            color="Neuropil",
+            color_discrete_map=NP_COLOR_DICT,
+        )
 
-    # calculates number of upstream and downstream partners #
-    up_count = len(upstream_partners)
-    down_count = len(downstream_partners)
+        # adds text labels inside pie chart slices #
+        region_pie.update_traces(
+            textposition="inside", textinfo="label",
+        )
 
-    # builds synapse summary df and converts values to strings#
-    syn_sum_df = pd.DataFrame(
-        {
-            "Root ID": root_id,
-            "Incoming Synapses": in_count,
-            "Outgoing Synapses": out_count,
-            "Upstream Partners": up_count,
-            "Downstream Partners": down_count,
-        },
-        index=[0],
-    ).astype(str)
+        # formats size of chart to match NTs #
+        region_pie.update_layout(
+            margin={"l": 5, "r": 5, "t": 25, "b": 5,}, width=400, height=200,
+        )
 
-    # joins synapse summary df to nucleus df to create full summary df #
-    full_sum_df = nuc_df.join(syn_sum_df.set_index("Root ID"), on="Root ID")
+        return region_pie
 
-    return [full_sum_df, output_message]
+    def makeSummaryDataFrame(self, nuc_df=None):
+        """Make dataframe with summary info.
 
+        Keyword arguments:
+        nuc_df -- nucleus info from getNuc, queried if not given (dataframe, default None)
+        """
 
-def makeViolin(
-    root_id, cleft_thresh, incoming=False, config={}, timestamp=None, filter_list=None
-):
-    """Build violin plots of up- and downstream neurotransmitter values.
+        # makes df of query nucleus #
+        if nuc_df is None:
+            nuc_df = getNuc(
+                self.root_id,
+                getResolution(),
+                config=self.config,
+                timestamp=self.timestamp,
+            )
 
-    Keyword arguments:
-    root_id -- root id number (int)
-    cleft_thresh -- cleft score threshold to drop synapses (float)
-    incoming -- incoming or outgoing synapses (bool, default False)
-    config -- config settings (dict, default {})
-    timestamp -- utc timestamp (datetime object, default None)
-    filter_list -- list of root ids to filter results by (str, default None)
-    """
+        # exception handling for segments without nuclei #
+        if nuc_df.empty:
+            nuc_df = pd.DataFrame(
+                {
+                    "Root ID": self.root_id,
+                    "Nuc ID": "n/a",
+                    "Nucleus Coordinates": "n/a",
+                },
+                index=[0],
+            ).astype(str)
+
+        # sets output message from up- and downstream messages #
+        output_message = (
+            "Upstream query results: "
+            + self.up_message
+            + "Downstream query results: "
+            + self.down_message
+        )
 
-    # sets variable for incoming or outgoing synapses
-    if incoming == False:
-        query_df = getSyn(
-            pre_root=root_id,
-            post_root=0,
-            cleft_thresh=cleft_thresh,
-            datastack_name=config.get("datastack", None),
-            server_address=config.get("server_address", None),
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )[0]
-        title_name = "Outgoing Synapse NT Scores"
-    elif incoming == True:
-        query_df = getSyn(
-            pre_root=0,
-            post_root=root_id,
-            cleft_thresh=cleft_thresh,
-            datastack_name=config.get("datastack", None),
-            server_address=config.get("server_address", None),
-            timestamp=timestamp,
-            filter_list=filter_list,
-        )[0]
-        title_name = "Incoming Synapse NT Scores"
-
-    # rounds data to 2 decimal places #
-    query_df = query_df.round(2)
-
-    # creates blank figures #
-    fig = go.Figure()
-
-    # adds line data #
-    fig.add_trace(go.Violin(y=list(query_df["gaba"]), name="Gaba",))
-    fig.add_trace(go.Violin(y=list(query_df["ach"]), name="Ach",))
-    fig.add_trace(go.Violin(y=list(query_df["glut"]), name="Glut",))
-    fig.add_trace(go.Violin(y=list(query_df["oct"]), name="Oct",))
-    fig.add_trace(go.Violin(y=list(query_df["ser"]), name="Ser",))
-    fig.add_trace(go.Violin(y=list(query_df["da"]), name="Da",))
-
-    # hides points #
-    fig.update_traces(points=False)
-
-    # fixes layout to minimize padding and fit two on one line #
-    fig.update_layout(
-        title=title_name,
-        margin={"l": 5, "r": 5, "t": 25, "b": 5,},
-        width=400,
-        height=200,
-    )
+        # builds synapse summary df from precomputed counts and converts values to strings #
+        syn_sum_df = pd.DataFrame(
+            {
+                "Root ID": self.root_id,
+                "Incoming Synapses": len(self.up_df),
+                "Outgoing Synapses": len(self.down_df),
+                "Upstream Partners": len(self._aggregates[True]["counts"]),
+                "Downstream Partners": len(self._aggregates[False]["counts"]),
+            },
+            index=[0],
+        ).astype(str)
 
-    return fig
+        # joins synapse summary df to nucleus df to create full summary df #
+        full_sum_df = nuc_df.join(syn_sum_df.set_index("Root ID"), on="Root ID")
 
+        return [full_sum_df, output_message]
 
-def markdownToInt(root_list):
-    """Convert markdown synatx back into int root ids.
-    
-    Keyword Arguments:
-    root_list -- list of root ids, may be mixed markdown and non-markdown
-    """
+    def makeViolin(self, incoming=False):
+        """Build violin plots of up- or downstream neurotransmitter values.
 
-    # converts markdown back into normal root id #
-    output_list = []
-    for x in root_list:
-        if len(str(x)) > 18:
-            output_list.append(int(x[1:19]))
+        Keyword arguments:
+        incoming -- incoming or outgoing synapses (bool, default False)
+        """
+        if incoming == True:
+            query_df = self.up_df
+            title_name = "Incoming Synapse NT Scores"
         else:
-            output_list.append(int(x))
+            query_df = self.down_df
+            title_name = "Outgoing Synapse NT Scores"
+
+        # rounds data to 2 decimal places #
+        nt_df = query_df[NT_COLUMNS].round(2)
+
+        # creates blank figures #
+        fig = go.Figure()
+
+        # adds line data #
+        fig.add_trace(go.Violin(y=nt_df["gaba"].tolist(), name="Gaba",))
+        fig.add_trace(go.Violin(y=nt_df["ach"].tolist(), name="Ach",))
+        fig.add_trace(go.Violin(y=nt_df["glut"].tolist(), name="Glut",))
+        fig.add_trace(go.Violin(y=nt_df["oct"].tolist(), name="Oct",))
+        fig.add_trace(go.Violin(y=nt_df["ser"].tolist(), name="Ser",))
+        fig.add_trace(go.Violin(y=nt_df["da"].tolist(), name="Da",))
+
+        # hides points #
+        fig.update_traces(points=False)
+
+        # fixes layout to minimize padding and fit two on one line #
+        fig.update_layout(
+            title=title_name,
+            margin={"l": 5, "r": 5, "t": 25, "b": 5,},
+            width=400,
+            height=200,
+        )
 
-    return output_list
+        return fig
 
 
 def nmToNG(coords, res):
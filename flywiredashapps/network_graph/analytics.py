@@ -0,0 +1,248 @@
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+from . import clustering, graph_store
+from .connectivity_matrix import ConnectivityMatrix
+
+# analyses by name, with labels for the analysis dropdown #
+ANALYSIS_OPTIONS = {
+    "reciprocal": "Reciprocal pairs",
+    "feed_forward": "Feed-forward loops",
+    "components": "Strongly connected components",
+    "path": "Strongest path",
+}
+
+
+def _binary(conn_matrix):
+    """Get the matrix as 0/1 ints with no self-connections.
+
+    Keyword Arguments:
+    conn_matrix -- connectivity to analyze (ConnectivityMatrix)
+    """
+    binary = conn_matrix.matrix.copy().astype(np.int64)
+    binary.data[:] = 1
+    binary.setdiag(0)
+    binary.eliminate_zeros()
+    return binary.tocsr()
+
+
+def _edgeList(conn_matrix, mask):
+    """Get (pre, post) id pairs of the entries of a sparse mask.
+
+    Keyword Arguments:
+    conn_matrix -- connectivity the mask is over (ConnectivityMatrix)
+    mask -- nonzero where an edge is wanted (sparse matrix)
+    """
+    mask = mask.tocoo()
+    roots = np.array(conn_matrix.root_list, dtype=object)
+    return list(zip(roots[mask.row].tolist(), roots[mask.col].tolist()))
+
+
+def feedForwardLoops(conn_matrix):
+    """Count feed-forward loops (a to b, b to c, and a to c) and find their edges.
+
+    Loops are counted with matrix products, since (B @ B)[a, c] is the number
+    of two-step paths from a to c, so each edge a to c closes that many loops.
+
+    Keyword Arguments:
+    conn_matrix -- connectivity to analyze (ConnectivityMatrix)
+    """
+    binary = _binary(conn_matrix)
+
+    # counts loops closed by each direct edge #
+    closing = (binary @ binary).multiply(binary)
+
+    # finds first legs (a to b with a common target c) and second legs (b to c with a common source a) #
+    first_legs = (binary @ binary.T).multiply(binary)
+    second_legs = (binary.T @ binary).multiply(binary)
+
+    edges = _edgeList(conn_matrix, closing + first_legs + second_legs)
+    nodes = list(dict.fromkeys([x for edge in edges for x in edge]))
+    return {"count": int(closing.sum()), "edges": edges, "nodes": nodes}
+
+
+def graphAnalytics(graph, graph_id):
+    """Get motif and component results for a stored graph, computing them once per graph version.
+
+    Results are kept in the stored graph and reused until neurons are added
+    or the graph is resubmitted.
+
+    Keyword Arguments:
+    graph -- stored graph (dict)
+    graph_id -- id of the stored graph (str)
+    """
+    version = (len(graph["root_list"]), len(graph["edge_df"]), graph["conn_thresh"])
+    cached = graph.get("analytics", None)
+    if cached != None and cached["version"] == version:
+        return cached
+
+    conn_matrix = graphMatrix(graph)
+    analytics = {
+        "version": version,
+        "reciprocal": reciprocalPairs(conn_matrix),
+        "feed_forward": feedForwardLoops(conn_matrix),
+        "components": stronglyConnected(conn_matrix),
+        "paths": {},
+    }
+    graph_store.saveGraph({**graph, "analytics": analytics}, graph_id)
+    return analytics
+
+
+def graphMatrix(graph):
+    """Get the connectivity of every neuron in a stored graph at its connection threshold.
+
+    Keyword Arguments:
+    graph -- stored graph (dict)
+    """
+    return ConnectivityMatrix.fromEdges(graph["root_list"], graph["edge_df"]).threshold(
+        int(graph["conn_thresh"])
+    )
+
+
+def highlightElements(elements, result, graph):
+    """Mark the nodes and edges of an analysis result and fade everything else.
+
+    In clustered graphs a cluster node is marked if any of its members are,
+    and a super-edge if any of its member edges are.
+
+    Keyword Arguments:
+    elements -- cytoscape elements (list of dicts)
+    result -- analysis result with "nodes" and "edges", or None to clear marks (dict)
+    graph -- stored graph the elements show (dict)
+    """
+    if result == None:
+        for element in elements:
+            element["classes"] = ""
+        return elements
+
+    # maps ids to the nodes shown for them #
+    cluster_labels = graph.get("cluster_labels", None)
+    if cluster_labels == None:
+        shown = lambda x: x
+    else:
+        expanded = set(graph.get("expanded", []))
+        shown = lambda x: (
+            x
+            if cluster_labels.get(x, clustering.OTHER_CLUSTER) in expanded
+            else clustering.CLUSTER_PREFIX
+            + cluster_labels.get(x, clustering.OTHER_CLUSTER)
+        )
+    nodes = set(shown(x) for x in result["nodes"])
+    edges = set((shown(x), shown(y)) for x, y in result["edges"])
+
+    for element in elements:
+        data = element["data"]
+        if "source" in data:
+            key = (data["source"], data["target"])
+            element["classes"] = "highlight" if key in edges else "faded"
+        else:
+            element["classes"] = "highlight" if data["id"] in nodes else "faded"
+    return elements
+
+
+def pathAnalytics(graph, graph_id, source, target):
+    """Get the strongest path between two ids of a stored graph, caching it with the graph.
+
+    Keyword Arguments:
+    graph -- stored graph (dict)
+    graph_id -- id of the stored graph (str)
+    source -- id to start from (str)
+    target -- id to end at (str)
+    """
+    analytics = graphAnalytics(graph, graph_id)
+    if (source, target) in analytics["paths"]:
+        return analytics["paths"][(source, target)]
+
+    path = shortestPath(graphMatrix(graph), source, target)
+    analytics = {
+        **analytics,
+        "paths": {**analytics["paths"], (source, target): path},
+    }
+    graph_store.saveGraph({**graph, "analytics": analytics}, graph_id)
+    return path
+
+
+def reciprocalPairs(conn_matrix):
+    """Find pairs of ids connected in both directions.
+
+    Keyword Arguments:
+    conn_matrix -- connectivity to analyze (ConnectivityMatrix)
+    """
+    binary = _binary(conn_matrix)
+    both = binary.multiply(binary.T)
+    pairs = _edgeList(conn_matrix, scipy.sparse.triu(both))
+    edges = _edgeList(conn_matrix, both)
+    nodes = list(dict.fromkeys([x for pair in pairs for x in pair]))
+    return {"count": len(pairs), "edges": edges, "nodes": nodes}
+
+
+def shortestPath(conn_matrix, source, target):
+    """Find the strongest path between two ids with Dijkstra on the sparse matrix.
+
+    Each edge costs 1 / synapse count, so paths through strong connections are
+    shorter. Returns a dict with "nodes" and "edges" of the path and its
+    "cost", or None if there is no path.
+
+    Keyword Arguments:
+    conn_matrix -- connectivity to analyze (ConnectivityMatrix)
+    source -- id to start from (str)
+    target -- id to end at (str)
+    """
+    root_list = conn_matrix.root_list
+    if source not in root_list or target not in root_list:
+        return None
+    start = root_list.index(source)
+    end = root_list.index(target)
+
+    costs = conn_matrix.matrix.astype(float)
+    costs.data = 1.0 / costs.data
+    distances, predecessors = scipy.sparse.csgraph.dijkstra(
+        costs, directed=True, indices=start, return_predecessors=True
+    )
+    if not np.isfinite(distances[end]):
+        return None
+
+    # walks back from the target along predecessors #
+    path = [end]
+    while path[-1] != start:
+        path.append(predecessors[path[-1]])
+    nodes = [root_list[x] for x in reversed(path)]
+    return {
+        "nodes": nodes,
+        "edges": list(zip(nodes[:-1], nodes[1:])),
+        "cost": float(distances[end]),
+    }
+
+
+def stronglyConnected(conn_matrix):
+    """Find groups of ids that can all reach each other, largest first.
+
+    Keyword Arguments:
+    conn_matrix -- connectivity to analyze (ConnectivityMatrix)
+    """
+    num_groups, groups = scipy.sparse.csgraph.connected_components(
+        conn_matrix.matrix, directed=True, connection="strong"
+    )
+    sizes = np.bincount(groups, minlength=num_groups)
+    roots = np.array(conn_matrix.root_list, dtype=object)
+    components = [
+        roots[groups == x].tolist()
+        for x in np.argsort(-sizes, kind="stable")
+        if sizes[x] > 1
+    ]
+
+    # keeps edges inside each component #
+    binary = _binary(conn_matrix).tocoo()
+    inside = (groups[binary.row] == groups[binary.col]) & (
+        sizes[groups[binary.row]] > 1
+    )
+    edges = list(
+        zip(roots[binary.row[inside]].tolist(), roots[binary.col[inside]].tolist())
+    )
+    nodes = [x for component in components for x in component]
+    return {
+        "count": len(components),
+        "components": components,
+        "edges": edges,
+        "nodes": nodes,
+    }
@@ -1,10 +1,14 @@
-from dash import dcc, html, Input, Output, State, no_update
+from dash import dcc, html, Input, Output, State, Patch, no_update
 import dash_bootstrap_components as dbc
 import dash_cytoscape as cyto
 from dash.exceptions import PreventUpdate
 from nglui.statebuilder import *
 import time
 from .utils import *
+from . import analytics, export, graph_layouts, graph_store
+from .clustering import clusterLabels
+from .neighborhood import DEFAULT_TOP_K, expandNeighborhood
+from ..common import time_utilities
 
 cyto.load_extra_layouts()
 
@@ -17,6 +21,9 @@ def register_callbacks(app, config=None):
     config -- dictionary of config settings (dict, default None)
     """
 
+    # adds the route that streams exports of stored graphs #
+    export.registerExportRoute(app)
+
     # defines callback that generates main tables and violin plots #
     @app.callback(
         Output("post_submit_div", "children"),
@@ -29,8 +36,22 @@ def register_callbacks(app, config=None):
         State({"type": "url_helper", "id_inner": "cleft_thresh_field"}, "value"),
         State({"type": "url_helper", "id_inner": "conn_thresh_field"}, "value"),
         State({"type": "url_helper", "id_inner": "timestamp_field"}, "value"),
+        State({"type": "url_helper", "id_inner": "graph_layout_dropdown"}, "value"),
+        State({"type": "url_helper", "id_inner": "cluster_dropdown"}, "value"),
+        State({"type": "url_helper", "id_inner": "hops_field"}, "value"),
+        State({"type": "url_helper", "id_inner": "top_k_field"}, "value"),
     )
-    def update_output(n_clicks, id_list, cleft_thresh, conn_thresh, timestamp):
+    def update_output(
+        n_clicks,
+        id_list,
+        cleft_thresh,
+        conn_thresh,
+        timestamp,
+        layout_name,
+        cluster_mode,
+        hops,
+        top_k,
+    ):
         """Create network graph for queried ids.
 
         Keyword arguments:
@@ -39,6 +60,10 @@ def register_callbacks(app, config=None):
         cleft_thresh -- value of cleft score threshold (float)
         conn_thresh -- minimum synapses to show connection (float)
         timestamp -- utc timestamp as datetime or unix (str)
+        layout_name -- name of graph layout computed on the server (str)
+        cluster_mode -- how nodes are grouped into clusters (str)
+        hops -- hops to take from the input ids to their strongest partners (int)
+        top_k -- partners added per id per direction per hop (int)
         """
 
         # prevents firing if no ids are submitted #
@@ -49,23 +74,69 @@ def register_callbacks(app, config=None):
         start_time = time.time()
 
         # converts string timestamp to datetime object if present, otherwise sets to current time #
-        if timestamp == None:
-            timestamp == datetime.datetime.utcnow()
+        # current time is snapped to a shared timestamp once the root ids are known #
+        if timestamp == None or timestamp == "":
+            timestamp = time_utilities.getTime()
+            snap_timestamp = True
         else:
             timestamp = strToDatetime(timestamp)
+            snap_timestamp = False
 
         # converts string input to list of string ids, removes bad ids into separate list #
         id_list, removed_list, outdated_list = inputToRootList(
             id_list, config, timestamp
         )
 
-        # gets connectivity data for id list and info about removed synapses #
-        raw_connectivity_dict, filter_message = getSynDoD(
+        # lets default "now" queries share results if the roots are unchanged #
+        if snap_timestamp == True:
+            timestamp = time_utilities.snapForRoots(id_list, config, now=timestamp)
+
+        # adds the strongest partners of the input ids, hop by hop, within size caps #
+        hop_message = ""
+        if hops != None and int(hops) > 0:
+            id_list, hop_message = expandNeighborhood(
+                id_list,
+                hops,
+                cleft_thresh,
+                config,
+                timestamp,
+                top_k=int(top_k or DEFAULT_TOP_K),
+            )
+
+        # gets sparse connectivity matrix for id list and info about removed synapses #
+        conn_matrix, filter_message = getSynMatrix(
             id_list, cleft_thresh, config, timestamp
         )
 
-        # converts raw dict-of-dicts format into list of graph elements that can be read by cytoscape #
-        graph_readable_elements = dictToElements(raw_connectivity_dict, conn_thresh)
+        # groups nodes into clusters if chosen, or automatically for large graphs #
+        cluster_labels = clusterLabels(
+            cluster_mode or "auto",
+            conn_matrix.threshold(int(conn_thresh)),
+            config,
+            timestamp,
+        )
+
+        # keeps every edge so neurons added later are checked against the whole graph #
+        graph = {
+            "root_list": conn_matrix.root_list,
+            "edge_df": conn_matrix.toEdges(),
+            "cleft_thresh": cleft_thresh,
+            "conn_thresh": conn_thresh,
+            "timestamp": timestamp,
+            "layout_name": layout_name or "circle",
+            "cluster_labels": cluster_labels,
+            "expanded": [],
+            "cell_types": graph_store.lookupCellTypes(
+                conn_matrix.root_list, config, timestamp
+            ),
+        }
+
+        # drops weak connections, places nodes on the server so the browser only draws them, #
+        # and converts the graph into elements that can be read by cytoscape #
+        graph_readable_elements, graph["positions"] = graph_store.buildElements(graph)
+
+        # stores the graph so neurons can be added without requerying it #
+        graph_id = graph_store.saveGraph(graph)
 
         # generates url for summary app link #
         summary_link = genSumLink(id_list, config=config, timestamp=timestamp)
@@ -75,9 +146,8 @@ def register_callbacks(app, config=None):
             cyto.Cytoscape(
                 # sets the plot id #
                 id="cytoscape",
-                # sets initial positions of nodes using templates #
-                layout={"name": "circle"},
-                # layout={"name": "dagre"}, MAYBE?
+                # uses node positions computed on the server #
+                layout={"name": "preset"},
                 # styles plot width and height #
                 style={"width": "750px", "height": "500px",},
                 # sets elements using input data #
@@ -85,7 +155,20 @@ def register_callbacks(app, config=None):
                 # styles graph #
                 stylesheet=[
                     # styles nodes #
-                    {"selector": "node", "style": {"label": "data(label)"}},
+                    {
+                        "selector": "node",
+                        "style": {"label": "data(label)", "text-wrap": "wrap"},
+                    },
+                    # styles cluster nodes, sized by number of members #
+                    {
+                        "selector": "node[cluster]",
+                        "style": {
+                            "width": "data(node_size)",
+                            "height": "data(node_size)",
+                            "background-color": "#888888",
+                            "shape": "round-rectangle",
+                        },
+                    },
                     # styles edges #
                     {
                         "selector": "edge",
@@ -139,6 +222,13 @@ def register_callbacks(app, config=None):
                             "target-arrow-color": "#19d3f3",
                         },
                     },
+                    # overlays analysis results on the graph #
+                    {
+                        "selector": "node.highlight",
+                        "style": {"border-width": 4, "border-color": "#ffd700"},
+                    },
+                    {"selector": "edge.highlight", "style": {"z-index": 10}},
+                    {"selector": ".faded", "style": {"opacity": 0.15}},
                 ],
             ),
             # defines Summary App link button #
@@ -157,6 +247,110 @@ def register_callbacks(app, config=None):
                 },
                 href=summary_link,
             ),
+            # defines id of the stored graph #
+            dcc.Store(id="graph_id", data=graph_id),
+            # defines input and button for adding neurons to the graph #
+            html.Div(
+                children=[
+                    dcc.Input(
+                        id="expand_field",
+                        type="text",
+                        placeholder="Root/Nuc IDs to add",
+                        style={
+                            "width": "275px",
+                            "display": "inline-block",
+                            "vertical-align": "top",
+                        },
+                    ),
+                    dbc.Button(
+                        "Add to Graph",
+                        id="expand_button",
+                        style={
+                            "width": "140px",
+                            "margin-left": "5px",
+                            "display": "inline-block",
+                            "vertical-align": "top",
+                        },
+                    ),
+                ],
+                style={"margin-left": "5px", "margin-top": "5px",},
+            ),
+            # defines dropdown, path ids, and button for highlighting analysis results #
+            html.Div(
+                children=[
+                    html.Div(
+                        dcc.Dropdown(
+                            id="analysis_dropdown",
+                            options=[{"label": "No highlight", "value": "none"}]
+                            + [
+                                {"label": y, "value": x}
+                                for x, y in analytics.ANALYSIS_OPTIONS.items()
+                            ],
+                            value="none",
+                            clearable=False,
+                        ),
+                        style={
+                            "width": "275px",
+                            "display": "inline-block",
+                            "vertical-align": "top",
+                        },
+                    ),
+                    dbc.Button(
+                        "Highlight",
+                        id="analysis_button",
+                        style={
+                            "width": "140px",
+                            "margin-left": "5px",
+                            "display": "inline-block",
+                            "vertical-align": "top",
+                        },
+                    ),
+                    html.Br(),
+                    dcc.Input(
+                        id="path_source_field",
+                        type="text",
+                        placeholder="Path from Root ID",
+                        style={
+                            "width": "210px",
+                            "margin-top": "5px",
+                            "display": "inline-block",
+                            "vertical-align": "top",
+                        },
+                    ),
+                    dcc.Input(
+                        id="path_target_field",
+                        type="text",
+                        placeholder="Path to Root ID",
+                        style={
+                            "width": "210px",
+                            "margin-top": "5px",
+                            "margin-left": "5px",
+                            "display": "inline-block",
+                            "vertical-align": "top",
+                        },
+                    ),
+                ],
+                style={"margin-left": "5px", "margin-top": "5px",},
+            ),
+            # defines edge table and adjacency matrix export buttons #
+            html.Div(
+                children=[
+                    dbc.Button(
+                        "Export Edges as " + y["label"],
+                        id={"type": "export_button", "format": x},
+                        color="success",
+                        href=export.exportUrl(app, graph_id, x),
+                        external_link=True,
+                        style={
+                            "margin-right": "5px",
+                            "width": "200px",
+                            "vertical-align": "top",
+                        },
+                    )
+                    for x, y in export.EXPORT_FORMATS.items()
+                ],
+                style={"margin-left": "5px", "margin-top": "5px",},
+            ),
         ]
 
         # calculates total time #
@@ -164,7 +358,11 @@ def register_callbacks(app, config=None):
 
         # sets return message text #
         message = (
-            "Graph generated in " + str(int(total_time)) + " seconds. " + filter_message
+            "Graph generated in "
+            + str(int(total_time))
+            + " seconds. "
+            + hop_message
+            + filter_message
         )
         message_rows = 1
         # adds message if bad IDs are removed #
@@ -183,5 +381,265 @@ def register_callbacks(app, config=None):
 
         return [post_submit, key_image, message, message_rows, ""]
 
-        
+    # defines callback that re-lays out the current graph when a new layout is chosen #
+    @app.callback(
+        Output("cytoscape", "elements"),
+        Input({"type": "url_helper", "id_inner": "graph_layout_dropdown"}, "value"),
+        State("cytoscape", "elements"),
+        State("graph_id", "data"),
+        prevent_initial_call=True,
+    )
+    def relayoutGraph(layout_name, elements, graph_id):
+        """Move the nodes of the current graph to a new server-side layout.
+
+        Keyword Arguments:
+        layout_name -- name of graph layout (str)
+        elements -- cytoscape graph elements
+        graph_id -- id of the stored graph (str)
+        """
+        if elements == None or layout_name == None:
+            raise PreventUpdate
+
+        # rebuilds connectivity from the graph so positions come from the same cache #
+        node_ids = [x["data"]["id"] for x in elements if "source" not in x["data"]]
+        conn_matrix = ConnectivityMatrix.fromEdges(node_ids, elementsToEdges(elements))
+        positions = graph_layouts.computeLayout(conn_matrix, layout_name)
+
+        # keeps the stored positions current for placing added neurons #
+        graph = graph_store.loadGraph(graph_id)
+        if graph != None:
+            graph_store.saveGraph(
+                {**graph, "layout_name": layout_name, "positions": positions},
+                graph_id,
+            )
+
+        return graph_layouts.applyLayout(elements, positions)
+
+    # defines callback that expands a clicked cluster into its neurons, or collapses a clicked neuron's cluster #
+    @app.callback(
+        Output("cytoscape", "elements", allow_duplicate=True),
+        Input("cytoscape", "tapNodeData"),
+        State("graph_id", "data"),
+        prevent_initial_call=True,
+    )
+    def toggleCluster(node_data, graph_id):
+        """Show the members of a clicked cluster, or regroup a clicked member's cluster.
+
+        Keyword Arguments:
+        node_data -- data of the clicked node (dict)
+        graph_id -- id of the stored graph (str)
+        """
+        graph = graph_store.loadGraph(graph_id)
+        if node_data == None or graph == None or graph["cluster_labels"] == None:
+            raise PreventUpdate
+
+        # expands clusters and collapses members of expanded clusters #
+        if "cluster" in node_data:
+            expanded = graph["expanded"] + [node_data["cluster"]]
+        else:
+            cluster = graph["cluster_labels"].get(node_data["id"], None)
+            if cluster == None or cluster == node_data["id"]:
+                raise PreventUpdate
+            expanded = [x for x in graph["expanded"] if x != cluster]
+
+        # rebuilds the shown graph and stores its new positions #
+        graph = {**graph, "expanded": expanded}
+        graph_readable_elements, graph["positions"] = graph_store.buildElements(graph)
+        graph_store.saveGraph(graph, graph_id)
+
+        return graph_readable_elements
+
+    # defines callback that adds neurons to the current graph, sending only the new elements #
+    @app.callback(
+        Output("cytoscape", "elements", allow_duplicate=True),
+        Output("summary_link_button", "href"),
+        Output("message_text", "value", allow_duplicate=True),
+        Output("message_text", "rows", allow_duplicate=True),
+        Input("expand_button", "n_clicks"),
+        State("expand_field", "value"),
+        State("graph_id", "data"),
+        prevent_initial_call=True,
+    )
+    def expandGraph(n_clicks, id_list, graph_id):
+        """Add neurons to the current graph by querying only their edges.
+
+        Keyword Arguments:
+        n_clicks -- unused trigger that counts how many times the add button has been pressed
+        id_list -- root or nucleus ids to add (str)
+        graph_id -- id of the stored graph (str)
+        """
+        if id_list == None or id_list == "":
+            raise PreventUpdate
+
+        # records start time #
+        start_time = time.time()
+
+        # gets the stored graph, which expires after a period of inactivity #
+        graph = graph_store.loadGraph(graph_id)
+        if graph == None:
+            return [
+                no_update,
+                no_update,
+                "Stored graph expired, please resubmit to add neurons.",
+                1,
+            ]
+
+        # converts string input to list of string ids, skipping ids already in the graph #
+        new_list, removed_list, outdated_list = inputToRootList(
+            id_list, config, graph["timestamp"]
+        )
+        new_list = [
+            x for x in dict.fromkeys(new_list) if x not in set(graph["root_list"])
+        ]
+        if len(new_list) == 0:
+            return [no_update, no_update, "No new IDs to add.", 1]
+
+        # queries only the edges that touch the new neurons #
+        new_edge_df, filter_message = getNewSynEdges(
+            new_list,
+            graph["root_list"],
+            graph["cleft_thresh"],
+            config,
+            graph["timestamp"],
+        )
+        root_list = graph["root_list"] + new_list
+
+        # grows the stored graph #
+        graph = {
+            **graph,
+            "root_list": root_list,
+            "edge_df": pd.concat([graph["edge_df"], new_edge_df], ignore_index=True),
+            "cell_types": {
+                **graph.get("cell_types", {}),
+                **graph_store.lookupCellTypes(new_list, config, graph["timestamp"]),
+            },
+        }
+
+        # generates url for summary app link #
+        summary_link = genSumLink(
+            root_list, config=config, timestamp=graph["timestamp"]
+        )
+
+        # rebuilds clustered graphs, where new neurons join as their own expanded clusters #
+        if graph["cluster_labels"] != None:
+            graph["cluster_labels"] = {
+                **graph["cluster_labels"],
+                **{x: x for x in new_list},
+            }
+            graph["expanded"] = graph["expanded"] + new_list
+            patched_elements, graph["positions"] = graph_store.buildElements(graph)
+            graph_store.saveGraph(graph, graph_id)
+
+        # otherwise sends only the new nodes and edges #
+        else:
+            # builds elements for new nodes and new edges above the threshold #
+            new_elements = [
+                x
+                for x in ConnectivityMatrix.fromEdges(root_list, new_edge_df)
+                .threshold(int(graph["conn_thresh"]))
+                .toElements(graph_store.nodeLabels(graph, new_list))
+                if "source" in x["data"] or x["data"]["id"] in set(new_list)
+            ]
+
+            # places new nodes near their neighbours without moving existing nodes #
+            new_positions = graph_store.placeNewNodes(
+                new_list, new_edge_df, graph["positions"]
+            )
+            new_elements = graph_layouts.applyLayout(new_elements, new_positions)
+
+            # stores the grown graph #
+            graph["positions"] = {**graph["positions"], **new_positions}
+            graph_store.saveGraph(graph, graph_id)
+
+            # appends the new elements to the graph in the browser #
+            patched_elements = Patch()
+            patched_elements.extend(new_elements)
+
+        # calculates total time #
+        total_time = time.time() - start_time
+
+        # sets return message text #
+        message = (
+            "Added "
+            + str(len(new_list))
+            + " neurons in "
+            + str(int(total_time))
+            + " seconds. "
+            + filter_message
+        )
+        message_rows = 1
+        # adds message if bad IDs are removed #
+        if len(removed_list) != 0:
+            message = message + "Bad IDs removed: " + str(removed_list)
+            message_rows += 1
+        # adds message if outdated IDs are removed #
+        if len(outdated_list) != 0:
+            message = message + "\nOutdated IDs removed: " + str(outdated_list)
+            message_rows += 1
+
+        return [patched_elements, summary_link, message, message_rows]
+
+    # defines callback that highlights reciprocal pairs, feed-forward loops, components, or a path #
+    @app.callback(
+        Output("cytoscape", "elements", allow_duplicate=True),
+        Output("message_text", "value", allow_duplicate=True),
+        Output("message_text", "rows", allow_duplicate=True),
+        Input("analysis_button", "n_clicks"),
+        State("analysis_dropdown", "value"),
+        State("path_source_field", "value"),
+        State("path_target_field", "value"),
+        State("cytoscape", "elements"),
+        State("graph_id", "data"),
+        prevent_initial_call=True,
+    )
+    def highlightAnalysis(n_clicks, analysis, source, target, elements, graph_id):
+        """Overlay the results of a graph analysis on the current graph.
+
+        Keyword Arguments:
+        n_clicks -- unused trigger that counts how many times the highlight button has been pressed
+        analysis -- one of analytics.ANALYSIS_OPTIONS, or "none" to clear highlights (str)
+        source -- root id the path starts from (str)
+        target -- root id the path ends at (str)
+        elements -- cytoscape graph elements
+        graph_id -- id of the stored graph (str)
+        """
+        if elements == None:
+            raise PreventUpdate
+
+        # clears highlights #
+        if analysis == None or analysis == "none":
+            return [analytics.highlightElements(elements, None, {}), "", 1]
+
+        # gets the stored graph, which expires after a period of inactivity #
+        graph = graph_store.loadGraph(graph_id)
+        if graph == None:
+            return [no_update, "Stored graph expired, please resubmit to analyze.", 1]
+
+        # finds the strongest path, or reuses the motifs and components found for this graph #
+        if analysis == "path":
+            source = str(source or "").strip()
+            target = str(target or "").strip()
+            result = analytics.pathAnalytics(graph, graph_id, source, target)
+            if result == None:
+                return [
+                    analytics.highlightElements(elements, None, graph),
+                    "No path from " + source + " to " + target + " in the graph.",
+                    1,
+                ]
+            message = (
+                "Strongest path has "
+                + str(len(result["edges"]))
+                + " steps: "
+                + " > ".join(result["nodes"])
+            )
+        else:
+            result = analytics.graphAnalytics(graph, graph_id)[analysis]
+            message = str(result["count"]) + " " + analytics.ANALYSIS_OPTIONS[
+                analysis
+            ].lower() + " found."
+            if analysis == "components" and result["count"] > 0:
+                message = message + " Largest has " + str(
+                    len(result["components"][0])
+                ) + " neurons."
 
+        return [analytics.highlightElements(elements, result, graph), message, 1]
@@ -0,0 +1,253 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from ..common import cell_types, lookup_utilities, synapse_utilities
+from .connectivity_matrix import ConnectivityMatrix
+from .utils import NT_COLUMNS, querySynapses
+
+# node count above which "auto" clusters by community #
+LOD_NODE_LIMIT = 200
+
+# ways of grouping nodes, with labels for the clustering dropdown #
+CLUSTER_OPTIONS = {
+    "auto": "Auto (communities above " + str(LOD_NODE_LIMIT) + " nodes)",
+    "none": "None",
+    "cell_type": "Cell type",
+    "neuropil": "Neuropil",
+    "community": "Community detection",
+}
+
+# most clusters shown, with the smallest merged into one beyond this #
+MAX_CLUSTERS = 40
+OTHER_CLUSTER = "other"
+
+# rounds of label propagation used to find communities #
+COMMUNITY_ITERATIONS = 30
+
+# prefix of cluster node ids, which can't collide with root ids #
+CLUSTER_PREFIX = "cluster:"
+
+
+def _capClusters(labels, max_clusters=MAX_CLUSTERS):
+    """Merge the smallest clusters into OTHER_CLUSTER so at most max_clusters remain.
+
+    Keyword Arguments:
+    labels -- cluster label of each node (array of str)
+    max_clusters -- most clusters to keep (int, default MAX_CLUSTERS)
+    """
+    counts = pd.Series(labels).value_counts()
+    if len(counts) <= max_clusters:
+        return labels
+    keep = counts.index[: max_clusters - 1]
+    return np.where(np.isin(labels, keep), labels, OTHER_CLUSTER)
+
+
+def cellTypeLabels(root_list, config={}, timestamp=None):
+    """Label each node with its most common cell type tag, "untyped" if it has none.
+
+    Keyword Arguments:
+    root_list -- node ids (list of str)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    """
+    # reads tags from the cell type index, querying directly if it can't be built #
+    try:
+        tags = cell_types.mainCellTypes(root_list, config, timestamp)
+        return np.array([tags[int(x)] for x in root_list], dtype=object)
+    except Exception:
+        pass
+
+    # sets client #
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+
+    # queries the tags of every node at once #
+    type_df = client.materialize.query_table(
+        cell_types.CELL_TYPE_TABLE,
+        filter_in_dict={"pt_root_id": [int(x) for x in root_list]},
+        timestamp=timestamp,
+    )
+
+    # keeps each node's most common tag, alphabetical on ties #
+    tags = cell_types.CellTypeIndex(type_df, None, timestamp).mainTypes(root_list)
+    return np.array([tags[int(x)] for x in root_list], dtype=object)
+
+
+def communityLabels(conn_matrix, iterations=COMMUNITY_ITERATIONS):
+    """Label each node with a community found by weighted label propagation.
+
+    Every node starts in its own community and repeatedly joins the community
+    with the most log-weighted connections among its neighbours and itself,
+    with all nodes updated at once by a sparse matrix product.
+
+    Keyword Arguments:
+    conn_matrix -- connectivity of the nodes (ConnectivityMatrix)
+    iterations -- most rounds of propagation (int, default COMMUNITY_ITERATIONS)
+    """
+    num_nodes = len(conn_matrix.root_list)
+    if num_nodes == 0:
+        return np.array([], dtype=object)
+
+    # symmetrizes log weights and adds a self-weight so labels settle instead of flipping #
+    weights = conn_matrix.matrix.astype(float)
+    weights.data = np.log1p(weights.data)
+    weights = (weights + weights.T).tocsr()
+    self_weight = weights.data.mean() if weights.nnz > 0 else 1.0
+    weights = (weights + scipy.sparse.identity(num_nodes) * self_weight).tocsr()
+
+    labels = np.arange(num_nodes)
+    for _ in range(iterations):
+        # sums neighbour weights per community and picks the heaviest, lowest label on ties #
+        one_hot = scipy.sparse.csr_matrix(
+            (np.ones(num_nodes), (np.arange(num_nodes), labels)),
+            shape=(num_nodes, num_nodes),
+        )
+        scores = (weights @ one_hot).tocsr()
+        scores.sort_indices()
+        new_labels = np.asarray(scores.argmax(axis=1)).ravel()
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    # numbers communities by size, largest first #
+    _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(counts), dtype=int)
+    rank[np.argsort(-counts, kind="stable")] = np.arange(len(counts))
+    return np.array(["community " + str(x + 1) for x in rank[inverse]], dtype=object)
+
+
+def neuropilLabels(root_list, config={}, timestamp=None):
+    """Label each node with the neuropil holding most of its synapses in the graph.
+
+    Keyword Arguments:
+    root_list -- node ids (list of str)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    """
+    int_roots = [int(x) for x in root_list]
+    syn_df, _ = querySynapses(int_roots, int_roots, config, timestamp)
+
+    # joins neuropils unless the synapses came from a store that already has them #
+    if "neuropil" not in syn_df.columns:
+        client = lookup_utilities.make_client(
+            config.get("datastack", None), config.get("server_address", None)
+        )
+        syn_df = synapse_utilities.joinNeuropils(client, syn_df, timestamp=timestamp)
+
+    # counts each node's synapses per neuropil from both sides and keeps the largest #
+    sides = pd.DataFrame(
+        {
+            "root": np.concatenate(
+                [syn_df["pre_pt_root_id"].to_numpy(), syn_df["post_pt_root_id"]]
+            ).astype(str),
+            "neuropil": np.concatenate([syn_df["neuropil"].to_numpy()] * 2),
+        }
+    )
+    top = (
+        sides.groupby(["root", "neuropil"])
+        .size()
+        .reset_index(name="count")
+        .sort_values(["root", "count", "neuropil"], ascending=[True, False, True])
+        .drop_duplicates(subset="root")
+    )
+    top = dict(zip(top["root"], top["neuropil"]))
+    return np.array([top.get(x, "no synapses") for x in root_list], dtype=object)
+
+
+def clusterLabels(mode, conn_matrix, config={}, timestamp=None):
+    """Get the cluster label of every node for a clustering mode, or None if unclustered.
+
+    Keyword Arguments:
+    mode -- one of CLUSTER_OPTIONS (str)
+    conn_matrix -- connectivity of the nodes (ConnectivityMatrix)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    """
+    root_list = conn_matrix.root_list
+    if mode == "auto":
+        mode = "community" if len(root_list) > LOD_NODE_LIMIT else "none"
+
+    if mode == "cell_type":
+        labels = cellTypeLabels(root_list, config, timestamp)
+    elif mode == "neuropil":
+        labels = neuropilLabels(root_list, config, timestamp)
+    elif mode == "community":
+        labels = communityLabels(conn_matrix)
+    else:
+        return None
+
+    return dict(zip(root_list, _capClusters(labels)))
+
+
+def clusterGraph(root_list, edge_df, cluster_labels, expanded=[]):
+    """Collapse nodes into clusters joined by super-edges with summed weights.
+
+    Nodes in expanded clusters stay as themselves. A super-edge's nt is the
+    highest of its connection-weighted mean scores, and its nt_confidence is
+    the share of its synapses on member edges with that nt. Returns a list of
+    [ConnectivityMatrix, labels, node_data] ready for toElements.
+
+    Keyword Arguments:
+    root_list -- node ids (list of str)
+    edge_df -- full edge table from getSynEdges (dataframe)
+    cluster_labels -- cluster label keyed by node id, as from clusterLabels (dict)
+    expanded -- clusters shown as their member nodes (list of str, default [])
+    """
+    # maps each node to a cluster node id, or to itself if its cluster is expanded #
+    node_map = {
+        x: x
+        if cluster_labels.get(x, OTHER_CLUSTER) in expanded
+        else CLUSTER_PREFIX + cluster_labels.get(x, OTHER_CLUSTER)
+        for x in root_list
+    }
+    node_ids = list(dict.fromkeys(node_map.values()))
+
+    # sums connections and connection-weighted nt scores per pair of graph nodes #
+    avg_columns = [x + "_avg" for x in NT_COLUMNS]
+    edge_df = edge_df.assign(
+        pre=edge_df["pre"].map(node_map),
+        post=edge_df["post"].map(node_map),
+        **{x: edge_df[x] * edge_df["connections"] for x in avg_columns},
+    )
+    super_df = edge_df.groupby(["pre", "post"], sort=False)[
+        ["connections"] + avg_columns
+    ].sum()
+    super_df[avg_columns] = super_df[avg_columns].div(super_df["connections"], axis=0)
+
+    # picks the top weighted score of each super-edge, alphabetical on ties #
+    alphabetical = np.argsort(NT_COLUMNS)
+    scores = super_df[avg_columns].to_numpy()
+    super_df["nt"] = np.array(NT_COLUMNS)[
+        alphabetical[np.argmax(scores[:, alphabetical], axis=1)]
+    ]
+
+    # counts the share of synapses on member edges that agree with that nt #
+    agree = edge_df.merge(
+        super_df["nt"].rename("super_nt").reset_index(), on=["pre", "post"]
+    )
+    agree = agree[agree["nt"] == agree["super_nt"]].groupby(["pre", "post"])[
+        "connections"
+    ].sum()
+    super_df["nt_confidence"] = (
+        agree.reindex(super_df.index, fill_value=0) / super_df["connections"]
+    )
+
+    super_df = super_df.reset_index()[
+        ["pre", "post", "connections", "nt", "nt_confidence"] + avg_columns
+    ]
+
+    # labels clusters by name and size, and marks them for styling and expanding #
+    sizes = pd.Series(node_map).value_counts()
+    labels = {}
+    node_data = {}
+    for node_id in node_ids:
+        if node_id.startswith(CLUSTER_PREFIX):
+            size = int(sizes[node_id])
+            labels[node_id] = node_id[len(CLUSTER_PREFIX) :] + " (" + str(size) + ")"
+            node_data[node_id] = {
+                "cluster": node_id[len(CLUSTER_PREFIX) :],
+                "node_size": float(min(20 + 6 * np.sqrt(size), 80)),
+            }
+
+    return [ConnectivityMatrix.fromEdges(node_ids, super_df), labels, node_data]
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+# widest edge drawn, and the log base used to scale synapse counts to widths #
+MAX_EDGE_WIDTH = 20
+EDGE_WIDTH_LOG_BASE = 1.5
+
+
+class ConnectivityMatrix:
+    """Sparse connectivity between a list of neurons.
+
+    Synapse counts are held in a CSR matrix whose rows are presynaptic and
+    columns postsynaptic positions in root_list, so memory grows with the
+    number of connected pairs rather than the square of the number of neurons.
+    Per-edge columns such as the dominant neurotransmitter are kept in a
+    dataframe aligned with the matrix's stored entries, and every operation
+    works on whole arrays of edges at once.
+    """
+
+    def __init__(self, root_list, matrix, edge_stats=None):
+        """Wrap a canonical CSR matrix and its per-edge stats.
+
+        Keyword Arguments:
+        root_list -- ids of the rows and columns (list of str)
+        matrix -- synapse counts, with sorted indices and no duplicates (csr matrix)
+        edge_stats -- per-edge columns in the order of matrix.data (dataframe, default None)
+        """
+        self.root_list = [str(x) for x in root_list]
+        self.matrix = matrix
+        if edge_stats is None:
+            edge_stats = pd.DataFrame(index=range(matrix.nnz))
+        self.edge_stats = edge_stats.reset_index(drop=True)
+
+    @classmethod
+    def fromEdges(cls, root_list, edge_df):
+        """Build a matrix from an edge table.
+
+        Keyword Arguments:
+        root_list -- ids of the rows and columns (list of str or ints)
+        edge_df -- edge table with "pre", "post", and "connections" columns,
+            as from utils.getSynEdges, whose other columns become edge stats (dataframe)
+        """
+        # drops repeated ids so each one is a single row and column #
+        root_list = list(dict.fromkeys(str(x) for x in root_list))
+        root_index = pd.Index(root_list)
+        num_roots = len(root_list)
+
+        # maps ids to positions, dropping edges whose ends aren't in root_list #
+        rows = root_index.get_indexer(edge_df["pre"].astype(str))
+        cols = root_index.get_indexer(edge_df["post"].astype(str))
+        keep = (rows >= 0) & (cols >= 0)
+        rows, cols = rows[keep], cols[keep]
+        edge_df = edge_df[keep]
+
+        # sorts edges row-major so the stats line up with the csr entries #
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+        edge_stats = edge_df.iloc[order].drop(columns=["pre", "post", "connections"])
+
+        matrix = scipy.sparse.csr_matrix(
+            (
+                edge_df["connections"].to_numpy()[order],
+                cols,
+                np.concatenate(
+                    [[0], np.cumsum(np.bincount(rows, minlength=num_roots))]
+                ),
+            ),
+            shape=(num_roots, num_roots),
+        )
+        return cls(root_list, matrix, edge_stats)
+
+    @property
+    def nnz(self):
+        """Number of connected pairs."""
+        return self.matrix.nnz
+
+    def coords(self):
+        """Get row and column positions of every stored entry, in storage order."""
+        rows = np.repeat(
+            np.arange(self.matrix.shape[0]), np.diff(self.matrix.indptr)
+        )
+        return rows, self.matrix.indices
+
+    def threshold(self, conn_thresh):
+        """Get a new matrix without pairs below a synapse count.
+
+        Keyword Arguments:
+        conn_thresh -- minimum synapses to keep a connection (float)
+        """
+        keep = self.matrix.data >= conn_thresh
+        rows, cols = self.coords()
+        rows, cols = rows[keep], cols[keep]
+        num_roots = len(self.root_list)
+
+        matrix = scipy.sparse.csr_matrix(
+            (
+                self.matrix.data[keep],
+                cols,
+                np.concatenate(
+                    [[0], np.cumsum(np.bincount(rows, minlength=num_roots))]
+                ),
+            ),
+            shape=self.matrix.shape,
+        )
+        return ConnectivityMatrix(self.root_list, matrix, self.edge_stats[keep])
+
+    def logWeights(self):
+        """Get edge widths scaled by the log of each synapse count, capped at MAX_EDGE_WIDTH."""
+        return np.minimum(
+            np.log(self.matrix.data) / np.log(EDGE_WIDTH_LOG_BASE), MAX_EDGE_WIDTH
+        )
+
+    def ntLabels(self):
+        """Get the dominant neurotransmitter of every edge, None if unknown."""
+        if "nt" in self.edge_stats.columns:
+            return self.edge_stats["nt"].to_numpy()
+        return np.full(self.nnz, None, dtype=object)
+
+    def toEdges(self):
+        """Convert back to an edge table like utils.getSynEdges returns."""
+        rows, cols = self.coords()
+        roots = np.array(self.root_list)
+        edge_df = pd.DataFrame(
+            {
+                "pre": roots[rows],
+                "post": roots[cols],
+                "connections": self.matrix.data,
+            }
+        )
+        return pd.concat([edge_df, self.edge_stats], axis=1)
+
+    def toElements(self, labels=None, node_data=None):
+        """Convert to cytoscape elements, walking only the stored entries.
+
+        Keyword Arguments:
+        labels -- node labels keyed by id, ids without one are labelled by id (dict, default None)
+        node_data -- extra node data fields keyed by id (dict of dicts, default None)
+        """
+        if labels is None:
+            labels = {}
+        if node_data is None:
+            node_data = {}
+
+        # adds each id as a node #
+        nodes = [
+            {"data": {"id": x, "label": labels.get(x, x), **node_data.get(x, {})}}
+            for x in self.root_list
+        ]
+
+        # adds the source, target, weight, and stats of each connection as an edge #
+        rows, cols = self.coords()
+        roots = np.array(self.root_list, dtype=object)
+        edge_data = pd.DataFrame(
+            {
+                "source": roots[rows],
+                "target": roots[cols],
+                "weight": self.matrix.data,
+                "nt": self.ntLabels(),
+                "adjusted_weight": self.logWeights(),
+            }
+        )
+        for column in self.edge_stats.columns:
+            if column not in edge_data.columns:
+                edge_data[column] = self.edge_stats[column].to_numpy()
+        edges = [{"data": x} for x in edge_data.to_dict("records")]
+
+        # combine the lists to feed into the graph constructor #
+        return nodes + edges
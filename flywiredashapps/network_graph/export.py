@@ -0,0 +1,185 @@
+import collections
+import io
+import zipfile
+import flask
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from . import graph_store
+from .connectivity_matrix import ConnectivityMatrix
+
+# rows of the edge table written per streamed chunk #
+EXPORT_CHUNK_ROWS = 100000
+
+# route, under the app's path prefix, that serves exports of stored graphs #
+EXPORT_ROUTE = "graph_export/<graph_id>/<file_format>"
+
+# download settings of each export format #
+EXPORT_FORMATS = {
+    "csv": {"mimetype": "text/csv", "label": "CSV"},
+    "parquet": {"mimetype": "application/vnd.apache.parquet", "label": "Parquet"},
+    "npz": {"mimetype": "application/zip", "label": "NPZ"},
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only stream that collects written bytes until they are drained."""
+
+    def __init__(self):
+        self._chunks = collections.deque()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        """Return and forget everything written since the last drain."""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def exportEdges(graph):
+    """Get the edge table of a stored graph at its connection threshold.
+
+    Keyword Arguments:
+    graph -- stored graph (dict)
+    """
+    edge_df = graph["edge_df"]
+    return edge_df[edge_df["connections"] >= int(graph["conn_thresh"])].reset_index(
+        drop=True
+    )
+
+
+def exportUrl(app, graph_id, file_format):
+    """Get the relative url of an export of a stored graph.
+
+    Keyword Arguments:
+    app -- the app itself
+    graph_id -- id of the stored graph (str)
+    file_format -- one of EXPORT_FORMATS (str)
+    """
+    return app.get_relative_path(
+        "/" + EXPORT_ROUTE.replace("<graph_id>", graph_id).replace(
+            "<file_format>", file_format
+        )
+    )
+
+
+def registerExportRoute(app):
+    """Add a flask route that streams exports of stored graphs.
+
+    Keyword Arguments:
+    app -- the app itself
+    """
+
+    @app.server.route(app.config.routes_pathname_prefix + EXPORT_ROUTE)
+    def exportGraph(graph_id, file_format):
+        """Stream the edges or adjacency matrix of a stored graph as a file download.
+
+        Keyword Arguments:
+        graph_id -- id of the stored graph (str)
+        file_format -- one of EXPORT_FORMATS (str)
+        """
+        if file_format not in EXPORT_FORMATS:
+            flask.abort(404)
+
+        # gets the graph state computed for the page, without requerying #
+        graph = graph_store.loadGraph(graph_id)
+        if graph == None:
+            flask.abort(404, "Graph expired, please resubmit.")
+
+        edge_df = exportEdges(graph)
+        if file_format == "csv":
+            chunks = streamCsv(edge_df)
+        elif file_format == "parquet":
+            chunks = streamParquet(edge_df)
+        else:
+            chunks = streamNpz(
+                ConnectivityMatrix.fromEdges(graph["root_list"], edge_df)
+            )
+
+        return flask.Response(
+            flask.stream_with_context(chunks),
+            mimetype=EXPORT_FORMATS[file_format]["mimetype"],
+            headers={
+                "Content-Disposition": "attachment; filename=graph_edges."
+                + file_format
+            },
+        )
+
+
+def streamCsv(edge_df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield an edge table as csv text, a chunk of rows at a time.
+
+    Keyword Arguments:
+    edge_df -- edge table (dataframe)
+    chunk_rows -- rows per chunk (int, default EXPORT_CHUNK_ROWS)
+    """
+    yield edge_df.iloc[:0].to_csv(index=False)
+    for start in range(0, len(edge_df), chunk_rows):
+        yield edge_df.iloc[start : start + chunk_rows].to_csv(
+            index=False, header=False
+        )
+
+
+def streamNpz(conn_matrix):
+    """Yield a sparse adjacency matrix as npz bytes, one array at a time.
+
+    The archive loads with scipy.sparse.load_npz, and also holds "root_ids"
+    (row and column ids) and "nt" (dominant neurotransmitter of each stored
+    entry, aligned with "data").
+
+    Keyword Arguments:
+    conn_matrix -- connectivity to export (ConnectivityMatrix)
+    """
+    matrix = conn_matrix.matrix
+    arrays = {
+        "indices": matrix.indices,
+        "indptr": matrix.indptr,
+        "format": np.array("csr"),
+        "shape": np.array(matrix.shape),
+        "data": matrix.data,
+        "root_ids": np.array(conn_matrix.root_list, dtype=np.int64),
+        "nt": np.array(conn_matrix.ntLabels(), dtype=str),
+    }
+
+    # writes a zip without seeking, so each member can be sent once written #
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for name, array in arrays.items():
+            with archive.open(name + ".npy", mode="w", force_zip64=True) as member:
+                np.lib.format.write_array(member, np.asanyarray(array))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def streamParquet(edge_df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield an edge table as parquet bytes, one row group at a time.
+
+    Keyword Arguments:
+    edge_df -- edge table (dataframe)
+    chunk_rows -- rows per row group (int, default EXPORT_CHUNK_ROWS)
+    """
+    sink = _ChunkSink()
+    schema = pa.Schema.from_pandas(edge_df, preserve_index=False)
+    with pq.ParquetWriter(sink, schema) as writer:
+        for start in range(0, len(edge_df), chunk_rows):
+            writer.write_table(
+                pa.Table.from_pandas(
+                    edge_df.iloc[start : start + chunk_rows],
+                    schema=schema,
+                    preserve_index=False,
+                )
+            )
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,262 @@
+import hashlib
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.sparse.linalg
+from ..common import synapse_cache
+
+# size in pixels of the box that node positions are scaled into #
+LAYOUT_WIDTH = 750
+LAYOUT_HEIGHT = 500
+LAYOUT_PADDING = 40
+
+# iterations of the force-directed layout, and nodes per block of repulsion math #
+SPRING_ITERATIONS = 100
+SPRING_BLOCK_SIZE = 500
+
+# largest graph whose spectral layout uses a dense eigensolver #
+DENSE_SPECTRAL_MAX = 1000
+
+# total size in bytes of cached layouts allowed per worker process #
+LAYOUT_CACHE_BYTES = 64 * 1024 ** 2
+
+# layouts by name, with labels for the layout dropdown #
+LAYOUT_OPTIONS = {
+    "circle": "Circle",
+    "spring": "Spring (force-directed)",
+    "hierarchical": "Hierarchical (feed-forward order)",
+    "spectral": "Spectral",
+}
+
+# cached positions keyed by layout name, node ids, and connectivity #
+layout_cache = synapse_cache.SynapseCache(byte_budget=LAYOUT_CACHE_BYTES)
+
+
+def _fitToBox(coords, keep_aspect=True):
+    """Scale positions to fill the layout box.
+
+    Keyword Arguments:
+    coords -- x,y positions, one row per node (n x 2 array)
+    keep_aspect -- scale both axes by the same factor so shapes aren't stretched (bool, default True)
+    """
+    if len(coords) == 0:
+        return coords
+
+    coords = coords - coords.min(axis=0)
+    span = coords.max(axis=0)
+
+    # scales each axis to the box, leaving flat axes centered #
+    inner = np.array(
+        [LAYOUT_WIDTH - 2 * LAYOUT_PADDING, LAYOUT_HEIGHT - 2 * LAYOUT_PADDING],
+        dtype=float,
+    )
+    scale = np.where(span > 0, inner / np.where(span > 0, span, 1), np.inf)
+    if keep_aspect == True:
+        scale = np.full(2, scale.min())
+    scale = np.where(np.isfinite(scale), scale, 0.0)
+
+    # centers the scaled positions in the box #
+    return coords * scale + (inner - span * scale) / 2 + LAYOUT_PADDING
+
+
+def _undirectedWeights(matrix):
+    """Get symmetric log-scaled edge weights, ignoring direction and self-pairs.
+
+    Keyword Arguments:
+    matrix -- synapse counts (csr matrix)
+    """
+    weights = matrix.astype(float)
+    weights.data = np.log1p(weights.data)
+    weights = weights + weights.T
+    weights.setdiag(0)
+    weights.eliminate_zeros()
+    return weights.tocsr()
+
+
+def circleLayout(matrix):
+    """Place nodes evenly around a circle in root list order.
+
+    Keyword Arguments:
+    matrix -- synapse counts (csr matrix)
+    """
+    num_nodes = matrix.shape[0]
+    angles = 2 * np.pi * np.arange(num_nodes) / max(num_nodes, 1)
+    return np.column_stack([np.cos(angles), np.sin(angles)])
+
+
+def springLayout(matrix, iterations=SPRING_ITERATIONS, seed=0):
+    """Place nodes with a Fruchterman-Reingold force-directed simulation.
+
+    Every pair of nodes repels and connected pairs attract in proportion to
+    their log synapse counts. Each iteration moves all nodes at once with
+    array operations, so the cost is quadratic in nodes but has no Python
+    loop over them.
+
+    Keyword Arguments:
+    matrix -- synapse counts (csr matrix)
+    iterations -- number of simulation steps (int, default SPRING_ITERATIONS)
+    seed -- seed of the random starting positions (int, default 0)
+    """
+    num_nodes = matrix.shape[0]
+    if num_nodes < 2:
+        return np.zeros((num_nodes, 2))
+
+    weights = _undirectedWeights(matrix).tocoo()
+    if weights.nnz > 0:
+        weights.data = weights.data / weights.data.max()
+
+    # starts from a seeded random spread so layouts are repeatable #
+    rng = np.random.default_rng(seed)
+    coords = rng.random((num_nodes, 2))
+    spacing = np.sqrt(1.0 / num_nodes)
+    step = 0.1
+
+    for _ in range(iterations):
+        # repels every pair of nodes, a block of rows at a time to bound memory #
+        force = np.empty_like(coords)
+        for start in range(0, num_nodes, SPRING_BLOCK_SIZE):
+            block = slice(start, start + SPRING_BLOCK_SIZE)
+            dx = coords[block, 0, None] - coords[None, :, 0]
+            dy = coords[block, 1, None] - coords[None, :, 1]
+            scale = spacing ** 2 / np.maximum(dx * dx + dy * dy, 1e-4)
+            force[block, 0] = (dx * scale).sum(axis=1)
+            force[block, 1] = (dy * scale).sum(axis=1)
+
+        # attracts connected pairs #
+        edge_delta = coords[weights.row] - coords[weights.col]
+        edge_distance = np.maximum(np.linalg.norm(edge_delta, axis=1), 0.01)
+        pull = edge_delta * (weights.data * edge_distance / spacing)[:, None]
+        np.subtract.at(force, weights.row, pull)
+
+        # moves each node by at most the current step, then cools #
+        length = np.maximum(np.linalg.norm(force, axis=1), 1e-9)
+        coords = coords + force * (np.minimum(length, step) / length)[:, None]
+        step = step * 0.95
+
+    return coords
+
+
+def hierarchicalLayout(matrix):
+    """Place nodes in rows by feed-forward order, sources at the top.
+
+    Strongly connected groups share a row, and each group sits one row below
+    the deepest group that feeds it, so recurrent loops don't break the order.
+
+    Keyword Arguments:
+    matrix -- synapse counts (csr matrix)
+    """
+    num_nodes = matrix.shape[0]
+    if num_nodes == 0:
+        return np.zeros((0, 2))
+
+    # condenses loops into single groups, leaving an acyclic graph of groups #
+    num_groups, groups = scipy.sparse.csgraph.connected_components(
+        matrix, directed=True, connection="strong"
+    )
+    matrix = matrix.tocoo()
+    between = groups[matrix.row] != groups[matrix.col]
+    group_pre = groups[matrix.row][between]
+    group_post = groups[matrix.col][between]
+
+    # pushes each group one row below every group feeding it until rows settle #
+    # the condensed graph has no loops, so this ends within its depth #
+    levels = np.zeros(num_groups, dtype=int)
+    for _ in range(num_groups):
+        new_levels = levels.copy()
+        np.maximum.at(new_levels, group_post, levels[group_pre] + 1)
+        if np.array_equal(new_levels, levels):
+            break
+        levels = new_levels
+
+    # spreads the nodes of each row evenly across the width #
+    node_levels = levels[groups]
+    order = np.lexsort((np.arange(num_nodes), node_levels))
+    row_sizes = np.bincount(node_levels)
+    row_starts = np.concatenate([[0], np.cumsum(row_sizes)[:-1]])
+    slots = np.empty(num_nodes)
+    slots[order] = np.arange(num_nodes) - row_starts[node_levels[order]]
+    x = (slots + 0.5) / row_sizes[node_levels]
+    return np.column_stack([x, node_levels])
+
+
+def spectralLayout(matrix):
+    """Place nodes by the two smallest nontrivial eigenvectors of the graph Laplacian.
+
+    Keyword Arguments:
+    matrix -- synapse counts (csr matrix)
+    """
+    num_nodes = matrix.shape[0]
+    if num_nodes < 3:
+        return circleLayout(matrix)
+
+    laplacian = scipy.sparse.csgraph.laplacian(
+        _undirectedWeights(matrix), normed=True
+    )
+
+    # solves small graphs exactly and large ones with a shift-inverted sparse solver #
+    if num_nodes <= DENSE_SPECTRAL_MAX:
+        values, vectors = np.linalg.eigh(laplacian.toarray())
+    else:
+        values, vectors = scipy.sparse.linalg.eigsh(
+            laplacian, k=3, sigma=-1e-3, which="LM"
+        )
+    return vectors[:, np.argsort(values)[1:3]]
+
+
+# layout functions by name #
+LAYOUTS = {
+    "circle": circleLayout,
+    "spring": springLayout,
+    "hierarchical": hierarchicalLayout,
+    "spectral": spectralLayout,
+}
+
+
+# layouts stretched to fill the box rather than keeping their shape #
+STRETCHED_LAYOUTS = ["hierarchical"]
+
+
+def computeLayout(conn_matrix, name="circle"):
+    """Get cached pixel positions of every node, keyed by node id.
+
+    Positions are cached by layout name, node ids, and the matrix contents,
+    so the same root set at the same thresholds is only laid out once.
+
+    Keyword Arguments:
+    conn_matrix -- connectivity to lay out (ConnectivityMatrix)
+    name -- one of LAYOUTS (str, default "circle")
+    """
+    if name not in LAYOUTS:
+        raise ValueError("Unknown layout " + str(name) + ".")
+
+    # hashes the connectivity so different thresholds get different entries #
+    matrix = conn_matrix.matrix
+    digest = hashlib.sha256()
+    for array in [matrix.indptr, matrix.indices, matrix.data]:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    key = ("layout", name, tuple(conn_matrix.root_list), digest.hexdigest())
+
+    def compute():
+        coords = _fitToBox(
+            LAYOUTS[name](matrix), keep_aspect=name not in STRETCHED_LAYOUTS
+        )
+        return {
+            x: {"x": float(y[0]), "y": float(y[1])}
+            for x, y in zip(conn_matrix.root_list, coords)
+        }
+
+    return layout_cache.getOrCompute(key, compute)
+
+
+def applyLayout(elements, positions):
+    """Set preset positions on the nodes of a list of cytoscape elements.
+
+    Keyword Arguments:
+    elements -- cytoscape elements (list of dicts)
+    positions -- pixel positions keyed by node id, as from computeLayout (dict)
+    """
+    for element in elements:
+        node_id = element["data"].get("id", None)
+        if "source" not in element["data"] and node_id in positions:
+            element["position"] = positions[node_id]
+    return elements
@@ -0,0 +1,176 @@
+import uuid
+import numpy as np
+import pandas as pd
+from ..common import cell_types, shared_store, synapse_cache
+from . import clustering, graph_layouts
+from .connectivity_matrix import ConnectivityMatrix
+
+# seconds an idle graph is kept for incremental expansion #
+GRAPH_TTL = 3600
+
+# total size in bytes of stored graphs on disk #
+GRAPH_STORE_BYTES = 1024 ** 3
+
+# pixel distance between a new node and the neighbours it is placed among #
+NEW_NODE_OFFSET = 30
+
+# stored graphs keyed by auth token scope and graph id, shared by every worker process #
+# so later callbacks and exports find a graph whichever worker they reach #
+graph_cache = shared_store.SharedStore(
+    "graphs", ttl=GRAPH_TTL, byte_budget=GRAPH_STORE_BYTES
+)
+
+
+def buildElements(graph):
+    """Lay out the shown view of a stored graph, return as [elements, positions].
+
+    Unclustered graphs show every node. Clustered graphs show a node per
+    cluster, except for expanded clusters whose members are shown, so the
+    number of elements stays bounded however many neurons there are.
+
+    Keyword Arguments:
+    graph -- stored graph (dict)
+    """
+    if graph.get("cluster_labels", None) is None:
+        conn_matrix = ConnectivityMatrix.fromEdges(
+            graph["root_list"], graph["edge_df"]
+        )
+        labels, node_data = {}, {}
+    else:
+        conn_matrix, labels, node_data = clustering.clusterGraph(
+            graph["root_list"],
+            graph["edge_df"],
+            graph["cluster_labels"],
+            graph.get("expanded", []),
+        )
+
+    # labels shown neurons with their cell types #
+    labels = {**nodeLabels(graph, conn_matrix.root_list), **labels}
+
+    # drops weak connections and places the nodes on the server #
+    conn_matrix = conn_matrix.threshold(int(graph["conn_thresh"]))
+    positions = graph_layouts.computeLayout(
+        conn_matrix, graph.get("layout_name", "circle")
+    )
+    elements = graph_layouts.applyLayout(
+        conn_matrix.toElements(labels, node_data), positions
+    )
+    return [elements, positions]
+
+
+def loadGraph(graph_id):
+    """Get a stored graph, or None if it expired or belongs to another user.
+
+    Reading a graph restarts its GRAPH_TTL, so graphs in use don't expire.
+
+    Keyword Arguments:
+    graph_id -- id from saveGraph (str)
+    """
+    hit, graph = graph_cache.get(("graph", synapse_cache.tokenScope(), graph_id))
+    if hit == False:
+        return None
+    return graph
+
+
+def lookupCellTypes(root_list, config={}, timestamp=None):
+    """Get the most common cell type of each node keyed by id, {} if they can't be looked up.
+
+    Keyword Arguments:
+    root_list -- node ids (list of str)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    """
+    try:
+        types = cell_types.mainCellTypes(root_list, config, timestamp)
+    except Exception:
+        return {}
+    return {str(x): y for x, y in types.items() if y != cell_types.UNTYPED}
+
+
+def nodeLabels(graph, root_list):
+    """Label typed nodes with their id and cell type on separate lines.
+
+    Keyword Arguments:
+    graph -- stored graph (dict)
+    root_list -- ids of the nodes to label (list of str)
+    """
+    types = graph.get("cell_types", {})
+    return {x: x + "\n" + types[x] for x in root_list if x in types}
+
+
+def placeNewNodes(new_roots, edge_df, positions):
+    """Place new nodes near the existing nodes they connect to.
+
+    Each new node goes at the mean position of its existing neighbours,
+    nudged outward so it doesn't cover them. Nodes without existing
+    neighbours are spread along the bottom of the graph. Existing nodes
+    keep their positions, so only the new nodes need to be sent.
+
+    Keyword Arguments:
+    new_roots -- ids of new nodes (list of str)
+    edge_df -- edges touching the new nodes (dataframe)
+    positions -- pixel positions of existing nodes keyed by id (dict)
+    """
+    if len(positions) > 0:
+        known = np.array([[x["x"], x["y"]] for x in positions.values()])
+        center = known.mean(axis=0)
+        bottom = known[:, 1].max() + NEW_NODE_OFFSET
+    else:
+        center = np.zeros(2)
+        bottom = 0.0
+
+    # lists every (new node, existing neighbour) pair from either edge direction #
+    pairs = pd.concat(
+        [
+            edge_df[["pre", "post"]].set_axis(["node", "neighbour"], axis=1),
+            edge_df[["post", "pre"]].set_axis(["node", "neighbour"], axis=1),
+        ],
+        ignore_index=True,
+    )
+    pairs = pairs[
+        pairs["node"].isin(new_roots) & pairs["neighbour"].isin(list(positions))
+    ]
+    pairs = pairs.assign(
+        x=[positions[x]["x"] for x in pairs["neighbour"]],
+        y=[positions[x]["y"] for x in pairs["neighbour"]],
+    )
+    means = pairs.groupby("node")[["x", "y"]].mean()
+
+    new_positions = {}
+    unplaced = 0
+    for root_id in new_roots:
+        if root_id in means.index:
+            point = means.loc[root_id].to_numpy()
+            direction = point - center
+            length = np.linalg.norm(direction)
+            if length > 0:
+                point = point + direction / length * NEW_NODE_OFFSET
+            else:
+                point = point + np.array([NEW_NODE_OFFSET, 0.0])
+        else:
+            point = np.array([center[0] + unplaced * NEW_NODE_OFFSET, bottom])
+            unplaced += 1
+        new_positions[root_id] = {"x": float(point[0]), "y": float(point[1])}
+
+    return new_positions
+
+
+def saveGraph(graph, graph_id=None):
+    """Store a graph for later expansion and return its id.
+
+    A graph is a dict with "root_list" (list of str), "edge_df" (full edge
+    table from getSynEdges, before the connection threshold), "cleft_thresh",
+    "conn_thresh", "timestamp", "layout_name", "positions" (pixel positions
+    keyed by shown node id), "cluster_labels" (cluster keyed by node id, or
+    None if unclustered), "expanded" (clusters shown as their members), and
+    optionally "cell_types" (cell type keyed by node id, from lookupCellTypes)
+    and "analytics" (cached results from analytics.graphAnalytics).
+
+    Keyword Arguments:
+    graph -- graph to store (dict)
+    graph_id -- id to store it under, a new one if None (str, default None)
+    """
+    if graph_id is None:
+        graph_id = uuid.uuid4().hex
+    graph_cache.put(("graph", synapse_cache.tokenScope(), graph_id), graph)
+    return graph_id
@@ -4,6 +4,8 @@ from dash import html
 import dash_bootstrap_components as dbc
 import flask
 from ..common.dash_url_helper import create_component_kwargs
+from .clustering import CLUSTER_OPTIONS
+from .graph_layouts import LAYOUT_OPTIONS
 
 
 # sets app title #
@@ -143,6 +145,147 @@ def page_layout(state={}):
                     ],
                     style={"margin-left": "5px", "margin-top": "5px",},
                 ),
+                # defines neighborhood expansion div #
+                html.Div(
+                    children=[
+                        # defines hops message #
+                        dcc.Textarea(
+                            id="hops_message_text",
+                            value="Hops to strongest partners (0-3):",
+                            style={
+                                "width": "240px",
+                                "resize": "none",
+                                "display": "inline-block",
+                                "vertical-align": "top",
+                            },
+                            rows=1,
+                            disabled=True,
+                        ),
+                        # defines input field for number of hops #
+                        dcc.Input(
+                            **create_component_kwargs(
+                                state,
+                                id_inner="hops_field",
+                                type="number",
+                                value=0,
+                                min=0,
+                                max=3,
+                                style={
+                                    "display": "inline-block",
+                                    "width": "45px",
+                                    "vertical-align": "top",
+                                },
+                            )
+                        ),
+                        # defines top partners message #
+                        dcc.Textarea(
+                            id="top_k_message_text",
+                            value="Top:",
+                            style={
+                                "width": "85px",
+                                "resize": "none",
+                                "display": "inline-block",
+                                "vertical-align": "top",
+                            },
+                            rows=1,
+                            disabled=True,
+                        ),
+                        # defines input field for partners added per id per hop #
+                        dcc.Input(
+                            **create_component_kwargs(
+                                state,
+                                id_inner="top_k_field",
+                                type="number",
+                                value=5,
+                                min=1,
+                                style={
+                                    "display": "inline-block",
+                                    "width": "45px",
+                                    "vertical-align": "top",
+                                },
+                            )
+                        ),
+                    ],
+                    style={"margin-left": "5px", "margin-top": "5px",},
+                ),
+                # defines graph layout div #
+                html.Div(
+                    children=[
+                        # defines graph layout message #
+                        dcc.Textarea(
+                            id="graph_layout_message_text",
+                            value="Graph layout:",
+                            style={
+                                "width": "130px",
+                                "resize": "none",
+                                "display": "inline-block",
+                                "vertical-align": "top",
+                            },
+                            rows=1,
+                            disabled=True,
+                        ),
+                        # defines graph layout dropdown #
+                        html.Div(
+                            dcc.Dropdown(
+                                **create_component_kwargs(
+                                    state,
+                                    id_inner="graph_layout_dropdown",
+                                    options=[
+                                        {"label": y, "value": x}
+                                        for x, y in LAYOUT_OPTIONS.items()
+                                    ],
+                                    value="circle",
+                                    clearable=False,
+                                )
+                            ),
+                            style={
+                                "width": "290px",
+                                "display": "inline-block",
+                                "vertical-align": "top",
+                            },
+                        ),
+                    ],
+                    style={"margin-left": "5px", "margin-top": "5px",},
+                ),
+                # defines clustering div #
+                html.Div(
+                    children=[
+                        # defines clustering message #
+                        dcc.Textarea(
+                            id="cluster_message_text",
+                            value="Group nodes by:",
+                            style={
+                                "width": "130px",
+                                "resize": "none",
+                                "display": "inline-block",
+                                "vertical-align": "top",
+                            },
+                            rows=1,
+                            disabled=True,
+                        ),
+                        # defines clustering dropdown #
+                        html.Div(
+                            dcc.Dropdown(
+                                **create_component_kwargs(
+                                    state,
+                                    id_inner="cluster_dropdown",
+                                    options=[
+                                        {"label": y, "value": x}
+                                        for x, y in CLUSTER_OPTIONS.items()
+                                    ],
+                                    value="auto",
+                                    clearable=False,
+                                )
+                            ),
+                            style={
+                                "width": "290px",
+                                "display": "inline-block",
+                                "vertical-align": "top",
+                            },
+                        ),
+                    ],
+                    style={"margin-left": "5px", "margin-top": "5px",},
+                ),
                 # defines timestamp div #
                 html.Div(
                     children=[
@@ -0,0 +1,176 @@
+import math
+import numpy as np
+import pandas as pd
+from ..common import concurrency, lookup_utilities, synapse_store, synapse_utilities
+
+# default most partners added per node per hop #
+DEFAULT_TOP_K = 5
+
+# most hops allowed from the seeds #
+MAX_HOPS = 3
+
+# default hard caps on graph size, overridable with config["khop_max_nodes"] and config["khop_max_synapses"] #
+KHOP_MAX_NODES = 300
+KHOP_MAX_SYNAPSES = 2000000
+
+# frontier ids per partner query, so each hop is a few large queries rather than one per id #
+HOP_BATCH_SIZE = 50
+
+
+def _queryPartnerSynapses(batch, column, cap, config, timestamp):
+    """Get synapses of a batch of ids on one side, return as [syn_df, truncated].
+
+    Keyword Arguments:
+    batch -- ids to query (list of ints)
+    column -- side the ids are on, "pre_pt_root_id" or "post_pt_root_id" (str)
+    cap -- most synapses to pull (int)
+    config -- config settings (dict)
+    timestamp -- utc timestamp (datetime object)
+    """
+
+    # reads from the local synapse store if it covers this timestamp #
+    store = synapse_store.getStore(config.get("datastack", None), timestamp=timestamp)
+    if store is not None:
+        if column == "pre_pt_root_id":
+            syn_df = store.query(pre_roots=batch)
+        else:
+            syn_df = store.query(post_roots=batch)
+        return [syn_df.iloc[:cap], len(syn_df) > cap]
+
+    # sets client #
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+
+    # pages only as far as the cap allows #
+    page_size = min(synapse_utilities.SYNAPSE_PAGE_SIZE, cap)
+    syn_df = synapse_utilities.queryAllPages(
+        client,
+        "synapses_nt_v1",
+        page_size=page_size,
+        max_pages=max(1, math.ceil(cap / page_size)),
+        filter_in_dict={column: batch},
+        timestamp=timestamp,
+    )
+    return [syn_df, syn_df.attrs["truncated"]]
+
+
+def expandNeighborhood(
+    seed_roots,
+    hops,
+    cleft_thresh,
+    config={},
+    timestamp=None,
+    top_k=DEFAULT_TOP_K,
+):
+    """Grow a list of seed ids by their strongest partners, hop by hop.
+
+    Each hop queries the upstream and downstream synapses of the newest ids
+    in concurrent batches, counts synapses per partner, and adds each id's
+    top_k upstream and top_k downstream partners that aren't already in the
+    graph, strongest first. Expansion stops early once the graph reaches
+    config["khop_max_nodes"] ids or the queried synapses reach
+    config["khop_max_synapses"]. Returns [root_list, message].
+
+    Keyword Arguments:
+    seed_roots -- ids to start from (list of str)
+    hops -- number of hops to take, capped at MAX_HOPS (int)
+    cleft_thresh -- drop synapses with cleft scores below this value (float)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    top_k -- most partners added per id per direction per hop (int, default DEFAULT_TOP_K)
+    """
+    max_nodes = config.get("khop_max_nodes", KHOP_MAX_NODES)
+    max_synapses = config.get("khop_max_synapses", KHOP_MAX_SYNAPSES)
+    timeout = config.get("query_timeout", concurrency.DEFAULT_TIMEOUT)
+
+    nodes = list(dict.fromkeys(int(x) for x in seed_roots))
+    node_set = set(nodes)
+    frontier = list(nodes)
+    synapse_total = 0
+    capped = []
+
+    for _ in range(min(int(hops), MAX_HOPS)):
+        if len(frontier) == 0:
+            break
+
+        # splits each query's share of the remaining synapse budget across the batches #
+        batches = [
+            frontier[i : i + HOP_BATCH_SIZE]
+            for i in range(0, len(frontier), HOP_BATCH_SIZE)
+        ]
+        cap = max(1, (max_synapses - synapse_total) // (2 * len(batches)))
+
+        # queries upstream and downstream partners of every batch at once #
+        tasks = {}
+        for n, batch in enumerate(batches):
+            for column in ["pre_pt_root_id", "post_pt_root_id"]:
+                tasks[(n, column)] = (
+                    lambda batch=batch, column=column: _queryPartnerSynapses(
+                        batch, column, cap, config, timestamp
+                    )
+                )
+        results = concurrency.runConcurrently(tasks, timeout=timeout)
+
+        # counts synapses between each frontier id and each outside partner #
+        counts = []
+        for (n, column), (syn_df, truncated) in results.items():
+            synapse_total += len(syn_df)
+            if truncated == True:
+                capped.append("synapses")
+            syn_df = syn_df[syn_df["cleft_score"] >= float(cleft_thresh)]
+            partner_column = (
+                "post_pt_root_id" if column == "pre_pt_root_id" else "pre_pt_root_id"
+            )
+            pairs = pd.DataFrame(
+                {
+                    "node": syn_df[column].to_numpy(),
+                    "partner": syn_df[partner_column].to_numpy(),
+                }
+            )
+            pairs = pairs[(pairs["partner"] != 0) & (pairs["node"] != pairs["partner"])]
+            pair_counts = pairs.value_counts().reset_index(name="count")
+            pair_counts["direction"] = column
+            counts.append(pair_counts)
+
+        # keeps each id's top partners per direction, strongest across the hop first #
+        counts = pd.concat(counts, ignore_index=True)
+        counts = counts[~counts["partner"].isin(node_set)]
+        counts = counts.sort_values(
+            ["node", "direction", "count", "partner"],
+            ascending=[True, True, False, True],
+        )
+        top = counts.groupby(["node", "direction"]).head(int(top_k))
+        top = top.sort_values(["count", "partner"], ascending=[False, True])
+        new_roots = list(dict.fromkeys(top["partner"].astype(np.int64).tolist()))
+
+        # enforces the node cap #
+        room = max_nodes - len(nodes)
+        if len(new_roots) > room:
+            new_roots = new_roots[: max(room, 0)]
+            capped.append("nodes")
+
+        nodes.extend(new_roots)
+        node_set.update(new_roots)
+        frontier = new_roots
+        if synapse_total >= max_synapses:
+            capped.append("synapses")
+
+        # stops once a cap is reached #
+        if len(capped) > 0:
+            break
+
+    # builds message describing the expansion #
+    message = (
+        "Expanded "
+        + str(len(seed_roots))
+        + " seed IDs to "
+        + str(len(nodes))
+        + " IDs. "
+    )
+    if "nodes" in capped:
+        message = message + "!Stopped at " + str(max_nodes) + " IDs! "
+    if "synapses" in capped:
+        message = message + "!Stopped at " + str(max_synapses) + " queried synapses! "
+
+    return [[str(x) for x in nodes], message]
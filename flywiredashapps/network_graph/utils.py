@@ -1,7 +1,166 @@
-from ..common import lookup_utilities
+from ..common import (
+    concurrency,
+    id_resolution,
+    lookup_utilities,
+    synapse_store,
+    synapse_utilities,
+)
 import pandas as pd
+import numpy as np
 import datetime
-import math
+from .connectivity_matrix import ConnectivityMatrix
+
+# neurotransmitter score columns of the synapse table #
+NT_COLUMNS = ["gaba", "ach", "glut", "oct", "ser", "da"]
+
+# per-edge neurotransmitter stats from getSynEdges carried into graph elements #
+EDGE_STAT_COLUMNS = ["nt_confidence"] + [x + "_avg" for x in NT_COLUMNS]
+
+
+def _edgeTable(pair_df, counts, root_index, truncated=False):
+    """Turn per-pair totals into an edge table, return as [edge_df, message].
+
+    Keyword Arguments:
+    pair_df -- per-pair totals from _foldSynapses (dataframe)
+    counts -- synapses read, kept after the cleft threshold, and kept after autapses (list of ints)
+    root_index -- ids that set the order of edges (pandas index)
+    truncated -- whether the synapse query was capped (bool, default False)
+    """
+    raw_num, cleft_num, aut_num = [int(x) for x in counts]
+
+    # constructs feedback message using previous counts #
+    output_message = (
+        str(raw_num - cleft_num)
+        + " synapses below threshold and "
+        + str(cleft_num - aut_num)
+        + " autapses were removed for a total of "
+        + str(raw_num - aut_num)
+        + " bad synapses culled. \n"
+    )
+
+    # adds message if the query stopped before every page was pulled #
+    if truncated == True:
+        output_message = (
+            "!Query capped at " + str(raw_num) + " entries!\n" + output_message
+        )
+
+    edge_codes = pair_df.index.to_numpy(dtype=np.int64)
+    num_roots = max(len(root_index), 1)
+    nt_counts = pair_df[["n_" + x for x in NT_COLUMNS]].to_numpy(dtype=np.int64)
+    connections = nt_counts.sum(axis=1)
+
+    # takes the most common neurotransmitter of each pair, alphabetical on ties #
+    alphabetical = np.argsort(NT_COLUMNS)
+    mode_codes = alphabetical[np.argmax(nt_counts[:, alphabetical], axis=1)]
+    confidence = nt_counts[np.arange(len(edge_codes)), mode_codes] / np.maximum(
+        connections, 1
+    )
+
+    edge_df = pd.DataFrame(
+        {
+            "pre": root_index[edge_codes // num_roots].astype(str),
+            "post": root_index[edge_codes % num_roots].astype(str),
+            "connections": connections,
+            "nt": np.array(NT_COLUMNS)[mode_codes],
+            "nt_confidence": confidence,
+        }
+    )
+
+    # averages each neurotransmitter score over the synapses of each pair #
+    for nt in NT_COLUMNS:
+        edge_df[nt + "_avg"] = pair_df[nt + "_sum"].to_numpy() / np.maximum(
+            connections, 1
+        )
+
+    return [edge_df, output_message]
+
+
+def _foldSynapses(syn_pages, root_index, cleft_thresh):
+    """Cull pages of synapses and sum them into per-pair totals one page at a time.
+
+    Returns [pair_df, counts, truncated], where pair_df is indexed by pair
+    code (pre position * number of ids + post position, so sorted codes
+    follow node order) with an "n_<nt>" synapse count and "<nt>_sum" score
+    total for each of NT_COLUMNS, counts holds the synapses read, kept after
+    the cleft threshold, and kept after removing autapses, and truncated is
+    read from the pages once they are exhausted.
+
+    Keyword Arguments:
+    syn_pages -- pages of synapses between ids in root_index (iterable of dataframes)
+    root_index -- ids that set the order of edges (pandas index)
+    cleft_thresh -- drop synapses with cleft scores below this value (float)
+    """
+    num_roots = len(root_index)
+    pair_df = _sumPairs([])
+    counts = np.zeros(3, dtype=np.int64)
+
+    for syn_df in syn_pages:
+        counts[0] += len(syn_df)
+
+        # removes synapses below cleft threshold, then autapses #
+        syn_df = syn_df[syn_df["cleft_score"] >= float(cleft_thresh)]
+        counts[1] += len(syn_df)
+        syn_df = syn_df[syn_df["pre_pt_root_id"] != syn_df["post_pt_root_id"]]
+        counts[2] += len(syn_df)
+        if len(syn_df) == 0:
+            continue
+
+        # labels each synapse with its highest-scoring neurotransmitter #
+        nt_scores = syn_df[NT_COLUMNS].to_numpy(dtype=float)
+        nt_codes = np.argmax(nt_scores, axis=1)
+
+        # codes each synapse by pair from root list positions #
+        pair_codes = root_index.get_indexer(
+            syn_df["pre_pt_root_id"]
+        ) * num_roots + root_index.get_indexer(syn_df["post_pt_root_id"])
+        edge_codes, pair_index = np.unique(pair_codes, return_inverse=True)
+        num_edges = len(edge_codes)
+
+        # counts synapses per pair and neurotransmitter with one bincount #
+        nt_counts = np.bincount(
+            pair_index * len(NT_COLUMNS) + nt_codes,
+            minlength=num_edges * len(NT_COLUMNS),
+        ).reshape(num_edges, len(NT_COLUMNS))
+
+        page_df = pd.DataFrame(
+            nt_counts, index=edge_codes, columns=["n_" + x for x in NT_COLUMNS]
+        )
+        for n, nt in enumerate(NT_COLUMNS):
+            page_df[nt + "_sum"] = np.bincount(
+                pair_index, weights=nt_scores[:, n], minlength=num_edges
+            )
+
+        # adds this page's totals so only one row per pair is kept between pages #
+        pair_df = _sumPairs([pair_df, page_df])
+
+    return [pair_df, counts, getattr(syn_pages, "truncated", False)]
+
+
+def _rootIndex(root_list):
+    """Index unique ids in order, for coding synapses by pair.
+
+    Keyword Arguments:
+    root_list -- ids (list of strings or ints)
+    """
+    return pd.Index(pd.unique(np.array([int(x) for x in root_list], dtype=np.int64)))
+
+
+def _sumPairs(pair_dfs):
+    """Add per-pair totals from _foldSynapses, sorted by pair code.
+
+    Keyword Arguments:
+    pair_dfs -- per-pair totals (list of dataframes)
+    """
+    columns = ["n_" + x for x in NT_COLUMNS] + [x + "_sum" for x in NT_COLUMNS]
+    pair_dfs = [x for x in pair_dfs if len(x) > 0]
+    if len(pair_dfs) == 0:
+        empty_df = pd.DataFrame(
+            {x: np.zeros(0, dtype=np.int64 if x[:2] == "n_" else float) for x in columns}
+        )
+        return empty_df.set_axis(pd.Index([], dtype=np.int64), axis=0)
+    if len(pair_dfs) == 1:
+        return pair_dfs[0].sort_index()
+    return pd.concat(pair_dfs).groupby(level=0).sum()
 
 
 def checkFreshness(root_id, config, timestamp):
@@ -24,61 +183,36 @@ def checkFreshness(root_id, config, timestamp):
     return answer
 
 
-# defines function to convert raw connectivity information from dict of dicts to network graph readable format #
-def dictToElements(input_data, conn_thresh):
-    """Convert raw connectivity information into network graph readable format.
-    
+def elementsToEdges(elements):
+    """Convert graph elements back into an edge table for download.
+
     Keyword Arguments:
-    input_data -- raw connectivity data (dict of dicts where first key is upstream, second key is downstream, value is number of connections e.g. {'id1':{'id2':65,'id3':0},'id2'{'id1':4,'id3':57},'id3'{'id1':0,'id2':5},})
-    conn_thresh -- minimum synapses to show connection (float)
+    elements -- cytoscape elements of a graph (list of dicts)
     """
-    # makes blank lists to populate with nodes and edges #
-    nodes = []
-    edges = []
-
-    # for each key in the input dict... #
-    for x in list(input_data.keys()):
-        # add that key as a node #
-        nodes.append({"data": {"id": str(x), "label": str(x)}})
-        # for each key in the input dict other than the x key... #
-        for y in list(input_data[x].keys()):
-            # ...not including edges with 0 connections... #
-            if input_data[x][y]["connections"] >= int(conn_thresh):
-                # add the source, target, and weight of the connection as an edge #
-                edges.append(
-                    {
-                        "data": {
-                            "source": str(x),
-                            "target": str(y),
-                            "weight": input_data[x][y]["connections"],
-                            "nt": input_data[x][y]["nt"],
-                            "adjusted_weight": min(
-                                math.log((input_data[x][y]["connections"]), 1.5), 20,
-                            ),
-                        }
-                    }
-                )
-            else:
-                pass
+    edge_df = pd.DataFrame(
+        [x["data"] for x in elements if "source" in x["data"]],
+        columns=["source", "target", "weight", "nt"] + EDGE_STAT_COLUMNS,
+    )
 
-    # combine the lists to feed into the graph constructor #
-    directed_weighted_elements = nodes + edges
+    # renames columns to match the edge table from getSynEdges #
+    return edge_df.rename(
+        columns={"source": "pre", "target": "post", "weight": "connections"}
+    )
 
-    return directed_weighted_elements
 
 def genSumLink(id_list, timestamp=None, config={},):
     """Create summary app link using ID list.
         
         Keyword arguments:
         id_list -- input root IDs (list of str)
-        timestamp -- utc timestamp as datetime or unix (str, default None)
+        timestamp -- utc timestamp as datetime or unix (str or datetime object, default None)
         confige -- config settings (dict, default {})
         """
 
     # sets timestamp to current time if no input or converts string input to datetime #
     if timestamp == None:
         timestamp = datetime.datetime.utcnow().replace(microsecond=0)
-    else:
+    elif type(timestamp) == str:
         timestamp = strToDatetime(timestamp)
 
     # gets base url for summary app from config #
@@ -98,103 +232,92 @@ def genSumLink(id_list, timestamp=None, config={},):
 
     return out_url
 
-def getSynDoD(root_list, cleft_thresh, config={}, timestamp=None):
-    """Get number of synapses between each pair of ids, return as dict-of-dicts.
-    
+
+def getNewSynEdges(new_roots, old_roots, cleft_thresh, config={}, timestamp=None):
+    """Get edges that touch new ids when adding them to an existing graph.
+
+    Only synapses from the new ids to every id, and from the old ids to the
+    new ids, are queried, so the cost grows with the new edges rather than
+    the whole graph. Returns [edge_df, message] like getSynEdges, with edges
+    ordered by position in old_roots followed by new_roots.
+
     Keyword Arguments:
-    root_list -- ids to check (list of strings or ints)
+    new_roots -- ids being added, none of them in old_roots (list of strings or ints)
+    old_roots -- ids already in the graph (list of strings or ints)
     cleft_thresh -- drop synapses with cleft scores below this value (float)
-    timestamp -- utc timestamp (datetime object, default None)
     config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
     """
-
-
-    # converts list items to integers if not already #
-    if type(root_list[0]) != int:
-        root_list = [int(x) for x in root_list]
-
-    # sets client #
-    client = lookup_utilities.make_client(
-        config.get("datastack", None), config.get("server_address", None)
-    )
-
-    # creates synapse df using root list for pre and post partner ids #
-    syn_df = client.materialize.query_table(
-        "synapses_nt_v1",
-        filter_in_dict={"pre_pt_root_id": root_list, "post_pt_root_id": root_list,},
-        timestamp=timestamp,
+    new_roots = [int(x) for x in new_roots]
+    old_roots = [int(x) for x in old_roots]
+    all_roots = old_roots + new_roots
+
+    # folds outgoing edges of new ids and incoming edges from old ids at once #
+    root_index = _rootIndex(all_roots)
+    tasks = {
+        "new_pre": lambda: _foldSynapses(
+            synapsePages(new_roots, all_roots, config, timestamp),
+            root_index,
+            cleft_thresh,
+        )
+    }
+    if len(old_roots) > 0:
+        tasks["new_post"] = lambda: _foldSynapses(
+            synapsePages(old_roots, new_roots, config, timestamp),
+            root_index,
+            cleft_thresh,
+        )
+    results = concurrency.runConcurrently(
+        tasks, timeout=config.get("query_timeout", concurrency.DEFAULT_TIMEOUT)
     )
 
-    # calculates initial number of synapses by counting legth of df #
-    raw_num = len(syn_df)
+    # combines the totals of the two disjoint sets of synapses #
+    pair_df = _sumPairs([x[0] for x in results.values()])
+    counts = np.sum([x[1] for x in results.values()], axis=0)
+    truncated = any(x[2] for x in results.values())
 
-    # removes synapses below cleft threshold #
-    syn_df = syn_df[syn_df["cleft_score"] >= float(cleft_thresh)].reset_index(drop=True)
+    return _edgeTable(pair_df, counts, root_index, truncated)
 
-    # counts synapses remaining after filtering out those below cleft score threshold #
-    cleft_num = len(syn_df)
 
-    # removes autapses #
-    syn_df = syn_df[syn_df["pre_pt_root_id"] != syn_df["post_pt_root_id"]].reset_index(
-        drop=True
-    )
+def getSynEdges(root_list, cleft_thresh, config={}, timestamp=None):
+    """Get synapse counts and dominant neurotransmitter for each connected pair of ids.
 
-    # counts synapses remaining after filtering out autapses #
-    aut_num = len(syn_df)
-
-    # constructs feedback message using previous counts #
-    output_message = (
-        str(raw_num - cleft_num)
-        + " synapses below threshold and "
-        + str(cleft_num - aut_num)
-        + " autapses were removed for a total of "
-        + str(raw_num - aut_num)
-        + " bad synapses culled. \n"
-    )
+    Returns a list of [edge_df, message], where edge_df is a sparse (COO)
+    edge table with one row per connected ordered pair and columns "pre",
+    "post" (str ids), "connections" (int), "nt" (str), "nt_confidence"
+    (float), and "<nt>_avg" (float) for each of NT_COLUMNS, ordered by the
+    position of pre and then post in root_list. A pair's nt is the most common
+    highest-scoring neurotransmitter of its synapses, its nt_confidence is the
+    fraction of its synapses that agree, and each <nt>_avg is the mean score.
 
-    # creates list of all pre-post pairs as combined strings #
-    count_list = [
-        str(syn_df.loc[x, "pre_pt_root_id"]) + str(syn_df.loc[x, "post_pt_root_id"])
-        for x in syn_df.index
-    ]
-
-    # creates nested dict where first keys are all root IDs (keyXs), all values are dicts #
-    # the keys of these dicts are all the root ids (keyYs) except keyX (no self-pairing) #
-    # the values for these dicts are the number of times their keyX-keyY pair occurs in count_list #
-    outgoing_connections = {
-        str(x): {
-            str(y): {"connections": count_list.count(str(x) + str(y))}
-            for y in root_list
-            if y != x
-        }
-        for x in root_list
-    }
+    Keyword Arguments:
+    root_list -- ids to check (list of strings or ints)
+    cleft_thresh -- drop synapses with cleft scores below this value (float)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    """
 
-    # makes a new nt df from the nt columns of syn df #
-    nt_df = syn_df[["gaba", "ach", "glut", "oct", "ser", "da"]].copy()
+    # converts list items to integers if not already #
+    if type(root_list[0]) != int:
+        root_list = [int(x) for x in root_list]
 
-    # gets the max value in each row and assigns these to a df column #
-    nt_df["max"] = nt_df.idxmax(axis=1)
+    # folds synapses between ids in root list into edges page by page #
+    return synToEdges(
+        synapsePages(root_list, root_list, config, timestamp), root_list, cleft_thresh
+    )
 
-    # adds the pre and post id columns #
-    nt_df["pre"] = syn_df["pre_pt_root_id"]
-    nt_df["post"] = syn_df["post_pt_root_id"]
 
-    # sets neurotransmitter info #
-    for x in outgoing_connections:
-        for y in outgoing_connections[x]:
-            # masks df to only show rows with this directional pair #
-            pair_df = nt_df[(nt_df.pre == int(x)) & (nt_df.post == int(y))]
-            # if there are any matches... #
-            if len(pair_df) > 0:
-                # ...counts the most common max neurotransmitter and sets as nt value #
-                outgoing_connections[x][y]["nt"] = pair_df["max"].mode()[0]
-            # if there aren't any matches... #
-            else:
-                # ...sets the nt value to None #
-                outgoing_connections[x][y]["nt"] = None
+def getSynMatrix(root_list, cleft_thresh, config={}, timestamp=None):
+    """Get sparse connectivity between ids, return as [ConnectivityMatrix, message].
 
-    return [outgoing_connections, output_message]
+    Keyword Arguments:
+    root_list -- ids to check (list of strings or ints)
+    cleft_thresh -- drop synapses with cleft scores below this value (float)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    """
+    edge_df, output_message = getSynEdges(root_list, cleft_thresh, config, timestamp)
+    return [ConnectivityMatrix.fromEdges(root_list, edge_df), output_message]
 
 
 def inputToRootList(input_str, config={}, timestamp=None):
@@ -207,44 +330,11 @@ def inputToRootList(input_str, config={}, timestamp=None):
     """
 
     # splits input_str into list and strips spaces, brackets, and quotes #
-    input_list = [x.strip() for x in str(input_str).split(",")]
-    input_list = [x.strip("[") for x in input_list]
-    input_list = [x.strip("]") for x in input_list]
-    input_list = [x.strip("'") for x in input_list]
-    input_list = [x.strip('"') for x in input_list]
-
-    # creates blank lists for output and removed ids #
-    root_list = []
-    removed_entries = []
-
-    # populates lists based on root/nuc/bad id status
-    for i in input_list:
-        if len(i) == 18:
-            root_list.append(i)
-        elif len(i) == 7:
-            root_for_nuc = nucToRoot(i, config, timestamp)
-            if root_for_nuc != None:
-                root_list.append(root_for_nuc)
-            else:
-                removed_entries.append(i)
-        else:
-            removed_entries.append(i)
-
-    # creates blank lists to split outdated and fresh roots into #
-    outdated_entries = []
-    fresh_entries = []
-
-    for i in root_list:
-        try:
-            fresh = checkFreshness(i, config, timestamp)
-            if fresh == True:
-                fresh_entries.append(i)
-            elif fresh == False:
-                outdated_entries.append(i)
-        except:
-            removed_entries.append(i)
+    input_list = id_resolution.splitInput(input_str)
+
+    # converts nucleus ids and checks freshness in bulk, removing bad ids #
+    return id_resolution.resolveIds(input_list, config, timestamp)
 
-    return [fresh_entries, removed_entries, outdated_entries]
 
 def nucToRoot(nuc_id, config={}, timestamp=None):
     """Convert nucleus id to root id.
@@ -273,6 +363,21 @@ def nucToRoot(nuc_id, config={}, timestamp=None):
 
     return root_id
 
+
+def querySynapses(pre_roots, post_roots, config={}, timestamp=None):
+    """Get synapses between two lists of ids, return as [syn_df, truncated].
+
+    Keyword Arguments:
+    pre_roots -- upstream ids (list of ints)
+    post_roots -- downstream ids (list of ints)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    """
+    pages = synapsePages(pre_roots, post_roots, config, timestamp)
+    syn_df = pd.concat(list(pages), ignore_index=True)
+    return [syn_df, getattr(pages, "truncated", False)]
+
+
 def strToDatetime(string_timestamp):
     """Convert string timestamp to datetime object.
     
@@ -302,6 +407,62 @@ def strToDatetime(string_timestamp):
 
     return out_stamp
 
+
+def synapsePages(pre_roots, post_roots, config={}, timestamp=None):
+    """Get synapses between two lists of ids as an iterable of pages.
+
+    Pages come from the local synapse store as a single page when it covers
+    the timestamp, and otherwise from a synapse_utilities.PagedQuery whose
+    truncated attribute is set once it has been read.
+
+    Keyword Arguments:
+    pre_roots -- upstream ids (list of ints)
+    post_roots -- downstream ids (list of ints)
+    config -- config settings (dict, default {})
+    timestamp -- utc timestamp (datetime object, default None)
+    """
+
+    # reads from the local synapse store if it covers this timestamp #
+    store = synapse_store.getStore(config.get("datastack", None), timestamp=timestamp)
+    if store is not None:
+        return [store.query(pre_roots=pre_roots, post_roots=post_roots)]
+
+    # sets client #
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+
+    # otherwise pages past the server's per-query cap so dense networks aren't truncated #
+    return synapse_utilities.PagedQuery(
+        client,
+        "synapses_nt_v1",
+        filter_in_dict={"pre_pt_root_id": pre_roots, "post_pt_root_id": post_roots},
+        timestamp=timestamp,
+    )
+
+
+def synToEdges(syn_pages, root_list, cleft_thresh, truncated=False):
+    """Cull synapses and count them into an edge table, return as [edge_df, message].
+
+    Pages are folded into per-pair totals one at a time, so memory grows with
+    the number of edges rather than the number of synapses. See getSynEdges
+    for the columns of edge_df.
+
+    Keyword Arguments:
+    syn_pages -- synapses between ids in root_list (dataframe or iterable of dataframes)
+    root_list -- ids that set the order of edges (list of ints)
+    cleft_thresh -- drop synapses with cleft scores below this value (float)
+    truncated -- whether the synapse query was capped (bool, default False)
+    """
+    if isinstance(syn_pages, pd.DataFrame):
+        syn_pages = [syn_pages]
+    root_index = _rootIndex(root_list)
+    pair_df, counts, pages_truncated = _foldSynapses(
+        syn_pages, root_index, cleft_thresh
+    )
+    return _edgeTable(pair_df, counts, root_index, truncated or pages_truncated)
+
+
 def unixToDatetime(stamp):
     """Convert unix timestamp to datetime object.
     
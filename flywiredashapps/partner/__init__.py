@@ -3,6 +3,7 @@ from .callbacks import register_callbacks
 from .layout import title, page_layout, app_layout
 from ..common.external_stylesheets import external_stylesheets
 from ..common.dash_url_helper import setup
+from ..common import data_sources, synapse_store
 
 
 def create_app(name=__name__, config={}, **kwargs):
@@ -29,6 +30,9 @@ def create_app(name=__name__, config={}, **kwargs):
     # adds page layout to app #
     setup(app, page_layout=page_layout)
 
+    # selects the data source and opens the local synapse store if configured #
+    data_sources.configure(config)
+    synapse_store.configure(config)
     # adds callbacks to app #
     register_callbacks(app, config)
 
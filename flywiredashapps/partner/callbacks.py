@@ -2,6 +2,7 @@ import dash_bootstrap_components as dbc
 from dash import dcc, html, Input, Output, State, no_update
 from dash.exceptions import PreventUpdate
 from .utils import *
+from ..common import time_utilities
 import pandas as pd
 
 
@@ -47,10 +48,13 @@ def register_callbacks(app, config=None):
             pass
 
         # sets timestamp to current time if no input or converts string input to datetime #
+        # current time is snapped to a shared timestamp once the root ids are known #
         if timestamp == None or timestamp == "":
             timestamp = getTime()
+            snap_timestamp = True
         else:
             timestamp = strToDatetime(timestamp)
+            snap_timestamp = False
 
         # handles bad input (which results in a None output from strToDatetime) #
         if timestamp == None:
@@ -186,6 +190,10 @@ def register_callbacks(app, config=None):
         else:
             pass
 
+        # lets default "now" queries share cached results if the roots are unchanged #
+        if snap_timestamp == True:
+            timestamp = time_utilities.snapForRoots([id_a, id_b], config, now=timestamp)
+
         # makes nuc dfs #
         nuc_a_df = getNuc(id_a, config, timestamp)
         nuc_b_df = getNuc(id_b, config, timestamp)
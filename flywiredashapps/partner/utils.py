@@ -1,4 +1,4 @@
-from ..common import lookup_utilities
+from ..common import lookup_utilities, synapse_utilities
 import datetime
 import calendar
 import json
@@ -7,7 +7,6 @@ import numpy as np
 from nglui.statebuilder import *
 import plotly.express as px
 import plotly.graph_objects as go
-from functools import lru_cache
 
 
 def buildPartnerLink(id_a, id_b, cleft, nuc, config={}, timestamp=None):
@@ -201,7 +200,6 @@ def getNuc(root_id, config={}, timestamp=None):
     return out_df.astype(str)
 
 
-@lru_cache(maxsize=None)
 def getSyn(
     pre_root=0,
     post_root=0,
@@ -210,7 +208,7 @@ def getSyn(
     server_address=None,
     timestamp=None,
 ):
-    """Create a cached table of synapses for a given root id.
+    """Create a table of synapses for a given root id from the cached raw query.
 
     Keyword arguments:
     pre_root -- single int-format root id number for upstream neuron (default 0)
@@ -221,163 +219,17 @@ def getSyn(
     timestamp -- utc timestamp (datetime object, default None)
     """
 
-    # sets client #
-    client = lookup_utilities.make_client(datastack_name, server_address)
-
-    # TEMPORARILY UNUSED JOIN QUERIES #
-    # if post_root == 0:
-    #     # creates df that includes neuropil regions using root id #
-    #     syn_df = client.materialize.join_query(
-    #         [["synapses_nt_v1", "id"], ["fly_synapses_neuropil", "id"],],
-    #         filter_in_dict={"synapses_nt_v1": {"pre_pt_root_id": [pre_root]}},
-    #         suffixes=["syn", "nuc"],
-    #         # materialization_version=mat_vers,
-    #         timestamp=timestamp,
-    #     )
-    # elif pre_root == 0:
-    #     # creates df that includes neuropil regions using root id #
-    #     syn_df = client.materialize.join_query(
-    #         [["synapses_nt_v1", "id"], ["fly_synapses_neuropil", "id"],],
-    #         filter_in_dict={"synapses_nt_v1": {"post_pt_root_id": [post_root]}},
-    #         suffixes=["syn", "nuc"],
-    #         # materialization_version=mat_vers,
-    #         timestamp=timestamp,
-    #     )
-    # else:
-    #     # creates df that includes neuropil regions using root id #
-    #     syn_df = client.materialize.join_query(
-    #         [["synapses_nt_v1", "id"], ["fly_synapses_neuropil", "id"],],
-    #         filter_in_dict={
-    #             "synapses_nt_v1": {
-    #                 "pre_pt_root_id": [pre_root],
-    #                 "post_pt_root_id": [post_root],
-    #             }
-    #         },
-    #         suffixes=["syn", "nuc"],
-    #         # materialization_version=mat_vers,
-    #         timestamp=timestamp,
-    #     )
-
-    # handles downstream queries #
-    if post_root == 0:
-        # gets df of synapses #
-        raw_syn_df = client.materialize.query_table(
-            "synapses_nt_v1",
-            filter_in_dict={"pre_pt_root_id": [pre_root]},
-            timestamp=timestamp,
-        )
-        # gets df of neuropil info using synapse ids from previous df #
-        np_df = client.materialize.query_table(
-            "fly_synapses_neuropil",
-            # filters using array of syn ids from raw_syn_df #
-            filter_in_dict={"id": np.array(raw_syn_df["id"])},
-            timestamp=timestamp,
-            merge_reference=False,
-        )
-        # merges both dfs together #
-        syn_df = pd.merge(
-            raw_syn_df,
-            np_df,
-            left_on="id",
-            right_on="target_id",
-            how="inner",
-            suffixes=["syn", "np"],
-        )
-    # handles upstream queries #
-    elif pre_root == 0:
-        # gets df of synapses #
-        raw_syn_df = client.materialize.query_table(
-            "synapses_nt_v1",
-            filter_in_dict={"post_pt_root_id": [post_root]},
-            timestamp=timestamp,
-        )
-        # gets df of neuropil info using synapse ids from previous df #
-        np_df = client.materialize.query_table(
-            "fly_synapses_neuropil",
-            # filters using array of syn ids from raw_syn_df #
-            filter_in_dict={"id": np.array(raw_syn_df["id"])},
-            timestamp=timestamp,
-            merge_reference=False,
-        )
-        # merges both dfs together #
-        syn_df = pd.merge(
-            raw_syn_df,
-            np_df,
-            left_on="id",
-            right_on="target_id",
-            how="inner",
-            suffixes=["syn", "np"],
-        )
-    # handles id pair queries #
-    else:
-        # gets df of synapses #
-        raw_syn_df = client.materialize.query_table(
-            "synapses_nt_v1",
-            filter_in_dict={
-                "pre_pt_root_id": [int(pre_root)],
-                "post_pt_root_id": [int(post_root)],
-            },
-            timestamp=timestamp,
-        )
-        # gets df of neuropil info using synapse ids from previous df #
-        np_df = client.materialize.query_table(
-            "fly_synapses_neuropil",
-            # filters using array of syn ids from raw_syn_df #
-            filter_in_dict={"id": np.array(raw_syn_df["id"])},
-            timestamp=timestamp,
-            merge_reference=False,
-        )
-        # merges both dfs together #
-        syn_df = pd.merge(
-            raw_syn_df,
-            np_df,
-            left_on="id",
-            right_on="target_id",
-            how="inner",
-            suffixes=["syn", "np"],
-        )
-
-    # calculates initial number of synapses by counting legth of df #
-    raw_num = len(syn_df)
-
-    # removes synapses below cleft threshold #
-    syn_df = syn_df[syn_df["cleft_score"] >= float(cleft_thresh)].reset_index(drop=True)
-
-    # counts synapses remaining after filtering out those below cleft score threshold #
-    cleft_num = len(syn_df)
-
-    # removes autapses #
-    syn_df = syn_df[syn_df["pre_pt_root_id"] != syn_df["post_pt_root_id"]].reset_index(
-        drop=True
-    )
-
-    # counts synapses remaining after filtering out autapses #
-    aut_num = len(syn_df)
-
-    # removes 0-roots #
-    syn_df = syn_df[syn_df["pre_pt_root_id"] != 0].reset_index(drop=True)
-    syn_df = syn_df[syn_df["post_pt_root_id"] != 0].reset_index(drop=True)
-
-    # counts synapses remaining after filtering out zero-roots #
-    zeroot_num = len(syn_df)
-
-    # constructs feedback message using previous counts #
-    output_message = (
-        str(raw_num - cleft_num)
-        + " synapses below threshold, "
-        + str(cleft_num - aut_num)
-        + " autapses, and "
-        + str(aut_num - zeroot_num)
-        + " synapses on segments with ID '0' were removed for a total of "
-        + str(raw_num - zeroot_num)
-        + " bad synapses culled. \n"
+    # gets unfiltered synapses, cached independently of cleft threshold #
+    raw_syn_df = synapse_utilities.getRawSyn(
+        pre_root=int(pre_root),
+        post_root=int(post_root),
+        datastack_name=datastack_name,
+        server_address=server_address,
+        timestamp=timestamp,
     )
 
-    # adds explanatory message if server caps the query #
-    if raw_num == 200000:
-        output_message = "!Query capped at 200K entires!\n" + output_message
-
-    return [syn_df, output_message]
+    # removes bad synapses and returns list with [df, message] #
+    return synapse_utilities.cullSyn(raw_syn_df, cleft_thresh)
 
 def getResolution():
     # TEMPORARILY DISABLED DUE TO SLOW LOAD TIME #
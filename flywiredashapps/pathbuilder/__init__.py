@@ -3,6 +3,7 @@ from .callbacks import register_callbacks
 from .layout import title, page_layout, app_layout
 from ..common.external_stylesheets import external_stylesheets
 from ..common.dash_url_helper import setup
+from ..common import data_sources, synapse_store
 import flask
 
 
@@ -13,5 +14,7 @@ def create_app(name=__name__, config={}, **kwargs):
     app.title = title
     app.layout = app_layout
     setup(app, page_layout=page_layout)
+    data_sources.configure(config)
+    synapse_store.configure(config)
     register_callbacks(app, config)
     return app
@@ -27,7 +27,7 @@ def register_callbacks(app, config=None):
         # sets start time #
         start_time = time.time()
 
-        chain = buildChain(id, thresh, config={})
+        chain = buildChain(id, thresh, config=config)
 
         # sets end time #
         total_time = time.time() - start_time
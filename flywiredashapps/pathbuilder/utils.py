@@ -7,7 +7,12 @@ import plotly.graph_objects as go
 import json
 import time
 from nglui.statebuilder import *
-from ..common import lookup_utilities
+from ..common import (
+    lookup_utilities,
+    materialization,
+    synapse_store,
+    synapse_utilities,
+)
 
 
 def checkFreshness(root_id, config={}):
@@ -42,40 +47,55 @@ def getStrongest(root_id, syn_thresh, downstream, config={}):
         config.get("datastack", None), config.get("server_address", None)
     )
 
-    # gets current materialization version #
-    mat_vers = max(client.materialize.get_versions())
+    # gets current materialization version from the shared cache #
+    mat_vers = materialization.getLatestVersion(config)
 
-    # queries synapse table using root id and direction#
+    # reads from the local synapse store if it holds this version #
+    store = synapse_store.getStore(
+        config.get("datastack", None), materialization_version=mat_vers
+    )
+
+    # picks the side holding the root id and the side counted as partners #
     if downstream == True:
-        syn_df = client.materialize.query_table(
-            "synapses_nt_v1",
-            filter_in_dict={"pre_pt_root_id": [root_id]},
-            materialization_version=mat_vers,
-        )
-        root_count_var = "post_pt_root_id"
+        root_var, root_count_var = "pre_pt_root_id", "post_pt_root_id"
     elif downstream == False:
-        # queries synapse table using root id #
-        syn_df = client.materialize.query_table(
+        root_var, root_count_var = "post_pt_root_id", "pre_pt_root_id"
+
+    # queries synapse table using root id and direction, paging past the server cap #
+    if store is not None:
+        if downstream == True:
+            syn_pages = [store.query(pre_roots=[int(root_id)])]
+        else:
+            syn_pages = [store.query(post_roots=[int(root_id)])]
+    else:
+        syn_pages = synapse_utilities.PagedQuery(
+            client,
             "synapses_nt_v1",
-            filter_in_dict={"post_pt_root_id": [root_id]},
+            filter_in_dict={root_var: [root_id]},
             materialization_version=mat_vers,
         )
-        root_count_var = "pre_pt_root_id"
 
-    # removes synapses below cleft threshold #
-    syn_df = syn_df[syn_df["cleft_score"] >= 50].reset_index(drop=True)
+    # counts synapses per partner one page at a time #
+    partner_counts = pd.Series(dtype=np.int64)
+    for syn_df in syn_pages:
+        # removes synapses below cleft threshold #
+        syn_df = syn_df[syn_df["cleft_score"] >= 50]
 
-    # removes autapses #
-    syn_df = syn_df[syn_df["pre_pt_root_id"] != syn_df["post_pt_root_id"]].reset_index(
-        drop=True
-    )
+        # removes autapses #
+        syn_df = syn_df[syn_df["pre_pt_root_id"] != syn_df["post_pt_root_id"]]
 
-    # removes 0-roots #
-    syn_df = syn_df[syn_df["pre_pt_root_id"] != 0].reset_index(drop=True)
-    syn_df = syn_df[syn_df["post_pt_root_id"] != 0].reset_index(drop=True)
+        # removes 0-roots #
+        syn_df = syn_df[syn_df["pre_pt_root_id"] != 0]
+        syn_df = syn_df[syn_df["post_pt_root_id"] != 0]
 
-    root_mode = syn_df[root_count_var].mode()
-    root_count = syn_df[root_count_var].value_counts()[root_mode]
+        partner_counts = partner_counts.add(
+            syn_df[root_count_var].value_counts(), fill_value=0
+        ).astype(np.int64)
+
+    root_mode = pd.Series(
+        np.sort(partner_counts.index[partner_counts == partner_counts.max()])
+    )
+    root_count = partner_counts[root_mode]
 
     # print(syn_df.head())
     print(root_mode[0])
@@ -104,13 +124,13 @@ def buildChain(root_id, syn_thresh, config={}):
         set(upstream_chain)
     ):
         upstream_chain.append(
-            getStrongest(upstream_chain[-1], syn_thresh, False, config={})
+            getStrongest(upstream_chain[-1], syn_thresh, False, config=config)
         )
     while downstream_chain[-1] != False and len(downstream_chain) == len(
         set(downstream_chain)
     ):
         upstream_chain.append(
-            getStrongest(downstream_chain[-1], syn_thresh, True, config={})
+            getStrongest(downstream_chain[-1], syn_thresh, True, config=config)
         )
 
     # removes last value (always False or duplicate) #
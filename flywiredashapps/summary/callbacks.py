@@ -1,9 +1,10 @@
-import time
 import dash_bootstrap_components as dbc
-from dash import dcc, html, Input, Output, State, no_update
+from dash import dcc, html, ctx, Input, Output, State, no_update
 from itertools import compress
 from dash.exceptions import PreventUpdate
 from .utils import *
+from . import jobs
+from ..common.data_sources import CoordinateLookupError
 
 
 def register_callbacks(app, config=None):
@@ -23,24 +24,30 @@ def register_callbacks(app, config=None):
         Output("message_text", "value"),
         Output("message_text", "rows"),
         Output("submit_loader", "children"),
+        Output("summary_job_id", "data"),
+        Output("summary_poll", "disabled"),
+        Output("table", "page_current"),
+        Output("table", "selected_rows"),
         Input("submit_button", "n_clicks"),
         State({"type": "url_helper", "id_inner": "input_field"}, "value",),
+        State("summary_job_id", "data"),
     )
-    def update_output(n_clicks, id_list):
+    def update_output(n_clicks, id_list, old_job_id):
         """Update app based on input.
+
+        Starts looking up the table in the background, with rows filled in by
+        pollSummary as each batch finishes.
         
         Keyword arguments:
         n_clicks -- unused trigger that tracks number of times the submit button has been pressed
         id_list -- list of roots, nucs, and/or coords for input (str)
+        old_job_id -- id of the previous summary job, stopped if still running (str)
         """
 
         # prevents firing if no ids are submitted #
         if id_list == None:
             raise PreventUpdate
 
-        # records start time #
-        start_time = time.time()
-
         # removes quotes from input #
         try:
             id_list = str(id_list).replace('"', "")
@@ -194,90 +201,204 @@ def register_callbacks(app, config=None):
             dcc.Download(id="summary_download"),
         ]
 
-        # generates root list from input list #
-        root_list = inputToRootList(id_list, config)
-
-        # enforces 20-item limit on input
-        if len(root_list) > 20:
+        # generates root list from input list, reporting coordinates that can't be looked up #
+        try:
+            root_list = inputToRootList(id_list, config)
+        except CoordinateLookupError as e:
             return [
                 no_update,
                 no_update,
                 no_update,
                 no_update,
-                "Please limit each query to a maximum of 20 items.",
+                str(e),
                 1,
                 "",
-            ]
-        else:
-            # removes duplicates #
-            root_set = set(root_list)
-            output_df = rootListToDataFrame(list(root_set), config)
-
-            # creates column list based on dataframe columns #
-            column_list = [{"name": i, "id": i} for i in output_df.columns]
-
-            # converts df to dict #
-            data_dict = output_df.to_dict("records")
-
-            # logs end time and calculates run time #
-            end_time = time.time()
-            elapsed_time = str(round(end_time - start_time))
-
-            # builds message using time information #
-            message_text = "Query completed in " + elapsed_time + " seconds."
-            mess_rows = 1
-
-            # adds message if any duplicates were removed #
-            dupes = len(root_list) - len(root_set)
-            if dupes == 1:
-                message_text = (
-                    message_text + " " + str(dupes) + " duplicate entry removed."
-                )
-                mess_rows = 2
-            if dupes > 1:
-                message_text = (
-                    message_text + " " + str(dupes) + " duplicate entries removed."
-                )
-                mess_rows = 2
-
-            # creates list of dicts for each row in data_dicts #
-            # each dict has a single id-key pair of the column name paired with another dict #
-            # each of these dicts is {"value" : string value of that row, "type": "markdown"} #
-            # this allows for markdown syntax to make the ids in the table into refeeder links #
-            tooltip_data = [
-                {
-                    column: {"value": str(value), "type": "markdown"}
-                    for column, value in row.items()
-                }
-                for row in data_dict
+                no_update,
+                no_update,
+                no_update,
+                no_update,
             ]
 
+        # enforces item limit on input #
+        max_ids = config.get("summary_max_ids", SUMMARY_MAX_IDS)
+        if len(root_list) > max_ids:
             return [
-                post_div,
-                column_list,
-                data_dict,
-                tooltip_data,
-                message_text,
-                mess_rows,
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                "Please limit each query to a maximum of " + str(max_ids) + " items.",
+                1,
                 "",
+                no_update,
+                no_update,
+                no_update,
+                no_update,
             ]
 
+        # removes duplicates, keeping input order #
+        unique_list = list(dict.fromkeys(root_list))
+
+        # builds message noting any duplicates that were removed #
+        dupes = len(root_list) - len(unique_list)
+        note = ""
+        if dupes == 1:
+            note = str(dupes) + " duplicate entry removed."
+        if dupes > 1:
+            note = str(dupes) + " duplicate entries removed."
+
+        # stops the previous query and starts looking up the new one in the background #
+        if old_job_id != None:
+            jobs.cancelJob(old_job_id)
+        job_id = jobs.startJob(unique_list, config, note=note)
+
+        # creates column list from summary table columns #
+        column_list = [{"name": i, "id": i} for i in SUMMARY_COLUMNS]
+
+        return [
+            post_div,
+            column_list,
+            [],
+            [],
+            "Looking up " + str(len(unique_list)) + " IDs...",
+            1,
+            "",
+            job_id,
+            False,
+            0,
+            [],
+        ]
+
+    # defines callback that fills the table with a page of the summary job's rows #
+    @app.callback(
+        Output("table", "data", allow_duplicate=True),
+        Output("table", "tooltip_data", allow_duplicate=True),
+        Output("table", "page_count"),
+        Output("table", "selected_rows", allow_duplicate=True),
+        Output("message_text", "value", allow_duplicate=True),
+        Output("message_text", "rows", allow_duplicate=True),
+        Output("summary_poll", "disabled", allow_duplicate=True),
+        Input("summary_poll", "n_intervals"),
+        Input("table", "page_current"),
+        Input("table", "page_size"),
+        Input("table", "sort_by"),
+        Input("table", "filter_query"),
+        State("summary_job_id", "data"),
+        prevent_initial_call=True,
+    )
+    def pollSummary(
+        n_intervals, page_current, page_size, sort_by, filter_query, job_id
+    ):
+        """Show the current page of the summary table while it is looked up.
+
+        Pages, sorting, and filtering are applied on the server so only the
+        shown rows are sent to the browser.
+
+        Keyword arguments:
+        n_intervals -- unused trigger that counts polls of the running job
+        page_current -- index of the shown page (int)
+        page_size -- rows per page (int)
+        sort_by -- column ids and directions to sort by (list of dicts)
+        filter_query -- filter query from the table's filter row (str)
+        job_id -- id of the summary job (str)
+        """
+        if job_id == None:
+            raise PreventUpdate
+
+        # reads a snapshot of the job, so its state and rows always match #
+        job = jobs.getJob(job_id)
+        page = None
+        if job != None:
+            page = jobs.jobPage(job, page_current, page_size, sort_by, filter_query)
+        if page == None:
+            return [
+                no_update,
+                no_update,
+                no_update,
+                no_update,
+                "Query expired, please resubmit.",
+                1,
+                True,
+            ]
+        finished = job["finished"]
+        data_dict, page_count, row_count = page
+
+        # creates list of dicts for each row in data_dicts #
+        # each dict has a single id-key pair of the column name paired with another dict #
+        # each of these dicts is {"value" : string value of that row, "type": "markdown"} #
+        # this allows for markdown syntax to make the ids in the table into refeeder links #
+        tooltip_data = [
+            {
+                column: {"value": str(value), "type": "markdown"}
+                for column, value in row.items()
+            }
+            for row in data_dict
+        ]
+
+        # builds message using progress or time information #
+        if finished == False:
+            message_text = (
+                "Looked up "
+                + str(job["done"])
+                + " of "
+                + str(job["total"])
+                + " IDs..."
+            )
+        elif job["error"] != None:
+            message_text = "Query stopped early: " + job["error"]
+        else:
+            message_text = (
+                "Query completed in " + str(round(job["elapsed"])) + " seconds."
+            )
+        mess_rows = 1
+
+        # adds message if any duplicates were removed #
+        if finished == True and job["note"] != "":
+            message_text = message_text + " " + job["note"]
+            mess_rows = 2
+
+        # adds count of rows matching the filter #
+        if filter_query != None and filter_query != "":
+            message_text = message_text + "\n" + str(row_count) + " rows match filter."
+            mess_rows += 1
+
+        # clears selections when the shown rows change, since they index into the page #
+        if ctx.triggered_id == "summary_poll":
+            selected_rows = no_update
+        else:
+            selected_rows = []
+
+        return [
+            data_dict,
+            tooltip_data,
+            page_count,
+            selected_rows,
+            message_text,
+            mess_rows,
+            finished,
+        ]
+
     # defines callback to download summary table as csv on button press #
     @app.callback(
         Output("summary_download", "data"),
         Input("summary_download_button", "n_clicks"),
-        State("table", "data"),
+        State("summary_job_id", "data"),
         prevent_initial_call=True,
     )
-    def downloadSummary(n_clicks, table_data):
+    def downloadSummary(n_clicks, job_id):
         """Download table as csv file.
 
         Keyword Arguments:
         n_clicks -- unused trigger that counts how many times the download button has been pressed
-        table_data -- table data
+        job_id -- id of the summary job (str)
         """
-        # convert table data to dataframe #
-        summary_df = pd.DataFrame(table_data)
+        # gets every row looked up so far, not just the shown page #
+        job = jobs.getJob(job_id)
+        if job == None:
+            raise PreventUpdate
+        summary_df = jobs.jobTable(job)
+        if summary_df is None:
+            raise PreventUpdate
 
         # converts nucleus coord strings to actual list while preserving non-list strings #
         replacement_col = []
@@ -349,7 +470,7 @@ def register_callbacks(app, config=None):
     # defines callback that clears table selections #
     @app.callback(
         Output("table", "active_cell",),
-        Output("table", "selected_rows",),
+        Output("table", "selected_rows", allow_duplicate=True),
         Input("clear_button", "n_clicks",),
         prevent_initial_call=True,
     )
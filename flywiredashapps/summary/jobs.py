@@ -0,0 +1,302 @@
+import contextlib
+import threading
+import time
+import uuid
+import flask
+import numpy as np
+import pandas as pd
+from ..common import shared_store, synapse_cache
+from .utils import SUMMARY_COLUMNS, rootListToDataFrame
+
+# ids looked up per batch, so rows appear while the rest are still loading #
+JOB_BATCH_SIZE = 200
+
+# seconds a job's table is kept after it was last read #
+JOB_TTL = 3600
+
+# total size in bytes of stored jobs on disk #
+JOB_STORE_BYTES = 256 * 1024 ** 2
+
+# milliseconds between polls of a running job #
+JOB_POLL_INTERVAL = 1000
+
+# rows per page of the summary table #
+SUMMARY_PAGE_SIZE = 50
+
+# filter operators of the table's filter row, longest first so "<=" isn't read as "<" #
+FILTER_OPERATORS = [
+    ["ge", ">="],
+    ["le", "<="],
+    ["lt", "<"],
+    ["gt", ">"],
+    ["ne", "!="],
+    ["eq", "="],
+    ["contains"],
+    ["datestartswith"],
+]
+
+# jobs and their rows, shared by every worker process so polls and downloads #
+# find a job whichever worker started it. A job's small progress record is #
+# kept under ("job", id) and each batch of rows under ("job_batch", id, n), #
+# so batches are written once and pages only read the batches they show #
+job_store = shared_store.SharedStore(
+    "summary_jobs", ttl=JOB_TTL, byte_budget=JOB_STORE_BYTES
+)
+
+
+def _parseFilter(filter_part):
+    """Split one clause of a table filter query, return as [column, operator, value, ignore_case].
+
+    Keyword Arguments:
+    filter_part -- clause such as "{Splits} > 2" or "{Editors} contains 14" (str)
+    """
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            # allows the case-sensitivity prefixes of newer dash versions #
+            for prefix in ["", "i", "s"]:
+                token = " " + prefix + operator + " "
+                if token not in filter_part:
+                    continue
+                name_part, value_part = filter_part.split(token, 1)
+                name = name_part[name_part.find("{") + 1 : name_part.rfind("}")]
+                value = value_part.strip()
+                if len(value) > 1 and value[0] == value[-1] and value[0] in "'\"`":
+                    value = value[1:-1]
+                return [name, operator_type[0], value, prefix == "i"]
+    return [None, None, None, False]
+
+
+def _readBatches(job, batch_nums):
+    """Read some of a job's batches as one table, None if any of them expired.
+
+    Keyword Arguments:
+    job -- job from getJob (dict)
+    batch_nums -- numbers of the batches to read, in order (list of ints)
+    """
+    batch_list = []
+    for batch_num in batch_nums:
+        hit, batch_df = job_store.get(("job_batch", job["id"], batch_num))
+        if hit == False:
+            return None
+        batch_list.append(batch_df)
+    if len(batch_list) == 0:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+    return pd.concat(batch_list, ignore_index=True)
+
+
+def _runJob(job_id, job, config, app, auth_token):
+    """Look up a job's ids batch by batch, storing each batch's rows as it finishes.
+
+    Runs in its own thread, inside an app context carrying the submitting
+    user's auth token so lookups are made as that user. Only this thread
+    writes the job, and it stops after the current batch once cancelJob has
+    been called from any worker.
+
+    Keyword Arguments:
+    job_id -- id of the job (str)
+    job -- job to run, from startJob (dict)
+    config -- config settings (dict)
+    app -- flask app the job was started from, or None outside of a request
+    auth_token -- auth token of the user who started the job (str)
+    """
+    context = app.app_context() if app is not None else contextlib.nullcontext()
+    with context:
+        if app is not None:
+            flask.g.auth_token = auth_token
+        try:
+            root_list = job["root_list"]
+            for start in range(0, len(root_list), JOB_BATCH_SIZE):
+                if job_store.has(("job_cancel", job_id)) == True:
+                    break
+                batch = root_list[start : start + JOB_BATCH_SIZE]
+                batch_df = rootListToDataFrame(batch, config)
+
+                # stores the batch before the record that points to it #
+                job_store.put(("job_batch", job_id, len(job["batch_rows"])), batch_df)
+                job["batch_rows"].append(len(batch_df))
+                job["done"] += len(batch)
+                job_store.put(("job", job_id), job)
+        except Exception as e:
+            job["error"] = str(e)
+        finally:
+            job["finished"] = True
+            job["elapsed"] = time.time() - job["started"]
+            job_store.put(("job", job_id), job)
+
+
+def _sortKey(column):
+    """Sort numbers by value and everything else as text, for sort_values.
+
+    Keyword Arguments:
+    column -- table column (series)
+    """
+    numbers = pd.to_numeric(column, errors="coerce")
+    if numbers.notna().any():
+        return numbers
+    return column.astype(str)
+
+
+def cancelJob(job_id):
+    """Stop a job after its current batch, whichever worker is running it.
+
+    Keyword Arguments:
+    job_id -- id from startJob (str)
+    """
+    if getJob(job_id) != None:
+        job_store.put(("job_cancel", job_id), True)
+
+
+def filterTable(table_df, filter_query):
+    """Keep the rows of a table matching a filter query from the table's filter row.
+
+    Keyword Arguments:
+    table_df -- summary table (dataframe)
+    filter_query -- clauses joined by " && " (str)
+    """
+    if filter_query == None or filter_query == "":
+        return table_df
+
+    for filter_part in filter_query.split(" && "):
+        name, operator, value, ignore_case = _parseFilter(filter_part)
+        if name not in table_df.columns:
+            continue
+        column = table_df[name]
+
+        if operator in ["contains", "datestartswith"]:
+            text = column.astype(str)
+            if operator == "contains":
+                mask = text.str.contains(value, case=not ignore_case, regex=False)
+            else:
+                mask = text.str.startswith(value)
+        else:
+            # compares as numbers when the value is one, otherwise as text #
+            number = pd.to_numeric(pd.Series([value]), errors="coerce")[0]
+            if pd.notna(number):
+                column, value = pd.to_numeric(column, errors="coerce"), number
+            else:
+                column = column.astype(str)
+            mask = {
+                "eq": lambda: column == value,
+                "ne": lambda: column != value,
+                "lt": lambda: column < value,
+                "le": lambda: column <= value,
+                "gt": lambda: column > value,
+                "ge": lambda: column >= value,
+            }[operator]()
+
+        table_df = table_df[mask.fillna(False).astype(bool)]
+
+    return table_df
+
+
+def getJob(job_id):
+    """Get a snapshot of a job, or None if it expired or belongs to another user.
+
+    Keyword Arguments:
+    job_id -- id from startJob (str)
+    """
+    if job_id == None:
+        return None
+    hit, job = job_store.get(("job", job_id))
+    if hit == False or job["scope"] != synapse_cache.tokenScope():
+        return None
+    return job
+
+
+def jobPage(
+    job, page_current=0, page_size=SUMMARY_PAGE_SIZE, sort_by=[], filter_query=""
+):
+    """Filter and sort the finished rows of a job, return a page as [records, page_count, row_count].
+
+    Unsorted, unfiltered pages only read the batches they show. Returns None
+    if any batch the page needs has expired.
+
+    Keyword Arguments:
+    job -- job from getJob (dict)
+    page_current -- index of the page to return (int, default 0)
+    page_size -- rows per page (int, default SUMMARY_PAGE_SIZE)
+    sort_by -- column ids and directions from the table (list of dicts, default [])
+    filter_query -- filter query from the table (str, default "")
+    """
+    page_size = max(int(page_size or SUMMARY_PAGE_SIZE), 1)
+    page_current = int(page_current or 0)
+    start = page_current * page_size
+
+    if (sort_by == None or len(sort_by) == 0) and (
+        filter_query == None or filter_query == ""
+    ):
+        # finds the batches holding the page's rows from their row counts #
+        batch_ends = np.cumsum(job["batch_rows"])
+        row_count = int(batch_ends[-1]) if len(batch_ends) > 0 else 0
+        first = int(np.searchsorted(batch_ends, start, side="right"))
+        last = int(np.searchsorted(batch_ends, start + page_size - 1, side="right"))
+        last = min(last, len(batch_ends) - 1)
+        table_df = _readBatches(job, list(range(first, last + 1)))
+        if table_df is None:
+            return None
+        offset = int(batch_ends[first - 1]) if first > 0 else 0
+        page_df = table_df.iloc[start - offset : start - offset + page_size]
+    else:
+        table_df = jobTable(job)
+        if table_df is None:
+            return None
+        table_df = filterTable(table_df, filter_query)
+
+        if sort_by != None and len(sort_by) > 0:
+            table_df = table_df.sort_values(
+                [x["column_id"] for x in sort_by],
+                ascending=[x["direction"] == "asc" for x in sort_by],
+                key=_sortKey,
+                kind="stable",
+            )
+        row_count = len(table_df)
+        page_df = table_df.iloc[start : start + page_size]
+
+    page_count = max(-(-row_count // page_size), 1)
+    return [page_df.to_dict("records"), page_count, row_count]
+
+
+def jobTable(job):
+    """Get every row a job has finished so far as one table, None if any batch expired.
+
+    Keyword Arguments:
+    job -- job from getJob (dict)
+    """
+    return _readBatches(job, list(range(len(job["batch_rows"]))))
+
+
+def startJob(root_list, config={}, note=""):
+    """Start looking up a summary table in the background and return the job's id.
+
+    Keyword Arguments:
+    root_list -- input root ids (list of ints)
+    config -- config settings (dict, default {})
+    note -- text added to the message once the job finishes (str, default "")
+    """
+    # carries the user's app and auth token into the job's thread #
+    try:
+        app = flask.current_app._get_current_object()
+        auth_token = flask.g.get("auth_token", None)
+    except RuntimeError:
+        app, auth_token = None, None
+
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id,
+        "scope": synapse_cache.tokenScope(),
+        "root_list": list(root_list),
+        "batch_rows": [],
+        "done": 0,
+        "total": len(root_list),
+        "note": note,
+        "error": None,
+        "finished": False,
+        "started": time.time(),
+        "elapsed": None,
+    }
+    job_store.put(("job", job_id), job)
+
+    threading.Thread(
+        target=_runJob, args=(job_id, job, config, app, auth_token), daemon=True
+    ).start()
+    return job_id
@@ -4,6 +4,8 @@ from dash import html
 import dash_bootstrap_components as dbc
 import flask
 from ..common.dash_url_helper import create_component_kwargs
+from .jobs import JOB_POLL_INTERVAL, SUMMARY_PAGE_SIZE
+from .utils import SUMMARY_MAX_IDS
 
 # sets app title #
 title = "Fly Neuron Summary"
@@ -27,9 +29,9 @@ def page_layout(state={}):
             dbc.Textarea(
                 id="message_text",
                 value="Input Root IDs, Nuc IDs, or coords in 4,4,40nm\n"
-                "ID queries are limited to 20 entries.\n"
+                "ID queries are limited to " + str(SUMMARY_MAX_IDS) + " entries.\n"
                 "Coordinate lookups must be done one at a time.\n"
-                "Lookup takes ~2-3 seconds per entry.",
+                "Large queries may take a minute or more.",
                 style={
                     "width": "420px",
                     "resize": "none",
@@ -103,9 +105,23 @@ def page_layout(state={}):
                     fill_width=False,
                     tooltip_data=[],
                     tooltip_duration=None,
+                    # pages, sorts, and filters on the server so only one page is sent #
+                    page_action="custom",
+                    page_current=0,
+                    page_size=SUMMARY_PAGE_SIZE,
+                    sort_action="custom",
+                    sort_mode="multi",
+                    sort_by=[],
+                    filter_action="custom",
+                    filter_query="",
                 ),
                 style={"margin-left": "5px", "margin-right": "5px"},
             ),
+            # defines id of the running summary job and the timer that polls it #
+            dcc.Store(id="summary_job_id", data=None),
+            dcc.Interval(
+                id="summary_poll", interval=JOB_POLL_INTERVAL, disabled=True
+            ),
             # creates div for post submission components #
             html.Div(children=[], id="post_submit_div"),
         ]
@@ -1,10 +1,87 @@
-from ..common import lookup_utilities
+from ..common import (
+    cell_types,
+    change_logs,
+    id_resolution,
+    lookup_utilities,
+    materialization,
+)
 import json
-import cloudvolume
 import pandas as pd
 import numpy as np
 from nglui.statebuilder import *
 
+# most ids accepted per summary query, overridable with config["summary_max_ids"] #
+SUMMARY_MAX_IDS = 2000
+
+# columns of the summary table #
+SUMMARY_COLUMNS = [
+    "Root ID",
+    "Nuc ID",
+    "Nucleus Coordinates",
+    "Splits",
+    "Merges",
+    "Total Edits",
+    "Editors",
+    "Cell Identification",
+    "Current",
+]
+
+
+def _queryByRoot(table, root_list, mat_vers, config={}):
+    """Query a table for many root ids at once, return as [table_df, failed_ids].
+
+    If the combined query fails, each root is queried alone so one bad id
+    doesn't fail the rest, and roots that still fail are returned separately.
+    Every root fails without a query if the version has no such table.
+
+    Keyword arguments:
+    table -- name of table with a pt_root_id column (str)
+    root_list -- root ids (list of ints)
+    mat_vers -- materialization version to query (int)
+    config -- config settings (dict, default {})
+    """
+
+    # skips the queries when the version lacks the table, since each would fail #
+    try:
+        table_list = materialization.getTables(config, mat_vers)
+    except Exception:
+        table_list = None
+    if table_list != None and table not in table_list:
+        return [pd.DataFrame(columns=["pt_root_id"]), set(root_list)]
+
+    # sets client #
+    client = lookup_utilities.make_client(
+        config.get("datastack", None), config.get("server_address", None)
+    )
+
+    try:
+        table_df = client.materialize.query_table(
+            table,
+            filter_in_dict={"pt_root_id": root_list},
+            materialization_version=mat_vers,
+        )
+        return [table_df, set()]
+    except Exception:
+        pass
+
+    # falls back to one query per root #
+    table_list = []
+    failed_ids = set()
+    for root_id in root_list:
+        try:
+            table_list.append(
+                client.materialize.query_table(
+                    table,
+                    filter_in_dict={"pt_root_id": [root_id]},
+                    materialization_version=mat_vers,
+                )
+            )
+        except Exception:
+            failed_ids.add(root_id)
+    if len(table_list) == 0:
+        return [pd.DataFrame(columns=["pt_root_id"]), failed_ids]
+    return [pd.concat(table_list, ignore_index=True), failed_ids]
+
 
 def colorPick(num_of_segs):
     """Generate list of colors in hex spaced evenly around a color wheel.
@@ -172,14 +249,8 @@ def coordsToRoot(coords, config={}):
         config.get("datastack", None), config.get("server_address", None)
     )
 
-    # sets cloud volume #
-    cv = cloudvolume.CloudVolume(
-        "graphene://https://prod.flywire-daf.com/segmentation/1.0/fly_v31",
-        use_https=True,
-    )
-
-    # determines resolution of volume #
-    res = cv.resolution
+    # determines resolution of volume from the data source's segmentation #
+    res = client.get_resolution()
 
     # converts coordinates using volume resolution #
     cv_xyz = [
@@ -189,7 +260,7 @@ def coordsToRoot(coords, config={}):
     ]
 
     # sets point by passing converted coords to 'download_point' method #
-    point = int(cv.download_point(cv_xyz, size=1,))
+    point = int(client.download_point(cv_xyz, size=1,))
 
     # looks up sv's associated root id, converts to string #
     root_result = int(client.chunkedgraph.get_root_id(supervoxel_id=point))
@@ -197,44 +268,68 @@ def coordsToRoot(coords, config={}):
     return root_result
 
 
-def getNuc(root_id, res, config={}):
-    """Build a dataframe of nucleus table data in string format.
+def getEditStats(root_list, config={}):
+    """Count splits, merges, and editors of each root from its change log.
+
+    Change logs are summarized once per root and cached, see
+    change_logs.getEditSummaries. Roots without edits, or whose log can't be
+    fetched, get zero edits and "n/a" editors. Returns a dataframe with
+    "Root ID" and the edit columns of the summary table, all as strings.
 
     Keyword arguments:
-    root_id -- root or nucleus id (listed str)
-    res -- x,y,z resolution of volume in nm/voxel, e.g. [16,16,40] (list of ints)
+    root_list -- root ids (list of ints)
     config -- config settings (dict, default {})
     """
 
-    # sets client #
-    client = lookup_utilities.make_client(
-        config.get("datastack", None), config.get("server_address", None)
+    # gets cached summaries, fetching uncached logs concurrently #
+    summaries = change_logs.getEditSummaries(root_list, config)
+    summaries = [summaries[int(x)] for x in root_list]
+
+    return pd.DataFrame(
+        {
+            "Root ID": [str(x) for x in root_list],
+            "Splits": [str(x["splits"]) if x else "0" for x in summaries],
+            "Merges": [str(x["merges"]) if x else "0" for x in summaries],
+            "Total Edits": [str(x["total_edits"]) if x else "0" for x in summaries],
+            "Editors": [
+                ", ".join(x["editors"]) if x and len(x["editors"]) > 0 else "n/a"
+                for x in summaries
+            ],
+        }
     )
 
-    # gets current materialization version #
-    mat_vers = max(client.materialize.get_versions())
 
-    # queries nucleus table using root id #
-    nuc_df = client.materialize.query_table(
-        "nuclei_v1",
-        filter_in_dict={"pt_root_id": [root_id]},
-        materialization_version=mat_vers,
-    )
+def getNucs(root_list, res, mat_vers, config={}):
+    """Build a dataframe of nucleus table data in string format for many roots.
+
+    Roots with several nuclei get a row per nucleus, and roots without one
+    are left out. Returns [nuc_df, failed_ids].
+
+    Keyword arguments:
+    root_list -- root ids (list of ints)
+    res -- x,y,z resolution of volume in nm/voxel, e.g. [16,16,40] (list of ints)
+    mat_vers -- materialization version to query (int)
+    config -- config settings (dict, default {})
+    """
 
-    # converts nucleus coordinates from nm to 4x4x40 resolution #
-    nuc_df["pt_position"] = [nmToRes(i,res) for i in nuc_df["pt_position"]]
-    # nuc_df["pt_position"] = [nmToNG(i) for i in nuc_df["pt_position"]] ORIGINAL
+    # queries nucleus table for every root at once #
+    nuc_df, failed_ids = _queryByRoot("nuclei_v1", root_list, mat_vers, config)
 
-    # creates output df using root, nuc id, and coords to keep aligned #
+    # creates output df using root, nuc id, and coords converted to volume resolution #
     out_df = pd.DataFrame(
         {
-            "Root ID": list(nuc_df["pt_root_id"]),
-            "Nuc ID": list(nuc_df["id"]),
-            "Nucleus Coordinates": list(nuc_df["pt_position"]),
+            "Root ID": nuc_df["pt_root_id"].astype(str).to_numpy(),
+            "Nuc ID": nuc_df["id"].astype(str).to_numpy()
+            if "id" in nuc_df.columns
+            else [],
+            "Nucleus Coordinates": [
+                str(nmToRes(i, res)) for i in nuc_df.get("pt_position", [])
+            ],
         }
     )
 
-    return out_df.astype(str)
+    return [out_df, failed_ids]
+
 
 def getResolution():
     # TEMPORARILY DISABLED DUE TO SLOW LOAD TIME #
@@ -252,42 +347,45 @@ def getResolution():
     # return res
     return [16, 16, 40]
 
-def getTypes(root_id, config={}):
-    """Query cell type table and return str-format list of unique values.
+def getTypes(root_list, mat_vers, config={}):
+    """Query cell type table for many roots and return str-format unique tags of each.
+
+    Returns [type_dict, failed_ids], with tags keyed by int root id and "n/a"
+    for roots without tags.
 
     Keyword arguments:
-    root_id -- root or nucleus id formatted (listed str)
+    root_list -- root ids (list of ints)
+    mat_vers -- materialization version to query (int)
     config -- config settings (dict, default {})
     """
 
-    # sets client using config #
-    client = lookup_utilities.make_client(
-        config.get("datastack", None), config.get("server_address", None)
-    )
-
-    # gets current materialization version #
-    mat_vers = max(client.materialize.get_versions())
+    # reads tags from the cell type index when it is at the same version #
+    try:
+        index = cell_types.getIndex(config)
+    except Exception:
+        index = None
+    if index is not None and index.version == mat_vers:
+        tags = index.tags(root_list)
+        type_dict = {
+            x: str(y)[1:-1] if len(y) > 0 else "n/a" for x, y in tags.items()
+        }
+        return [type_dict, set()]
 
-    # queries cell type table using root id #
-    type_df = client.materialize.query_table(
-        "neuron_information_v2",
-        filter_in_dict={"pt_root_id": [root_id]},
-        materialization_version=mat_vers,
+    # queries cell type table for every root at once #
+    type_df, failed_ids = _queryByRoot(
+        cell_types.CELL_TYPE_TABLE, root_list, mat_vers, config
     )
 
-    # makes series of uniuqe values and converts to list #
-    tags = type_df["tag"].unique().tolist()
-
-    # converts list to string and removes brackets #
-    tags = str(tags)[1:-1]
+    # keeps unique tags of each root in query order, without brackets #
+    type_dict = {int(x): "n/a" for x in root_list}
+    if len(type_df) > 0:
+        tags = type_df.drop_duplicates(subset=["pt_root_id", "tag"]).groupby(
+            "pt_root_id", sort=False
+        )["tag"]
+        for root_id, tag_series in tags:
+            type_dict[int(root_id)] = str(tag_series.tolist())[1:-1]
 
-    # handles neurons with no tags #
-    if tags == "":
-        tags = "n/a"
-    else:
-        pass
-
-    return tags
+    return [type_dict, failed_ids]
 
 
 def inputToRootList(input_str, config={}):
@@ -309,7 +407,16 @@ def inputToRootList(input_str, config={}):
     
     # if ids are nucs #
     elif all([len(i) == 7 for i in input_list]):
-        root_list = [nucToRoot(int(i), config) for i in input_list]
+        # converts every nucleus at the latest version at once, keeping unfound ids as bad ids #
+        nuc_roots = id_resolution.nucsToRoots(
+            input_list,
+            config,
+            materialization_version=materialization.getLatestVersion(config),
+        )
+        root_list = [
+            int(i) if nuc_roots[int(i)] is None else nuc_roots[int(i)]
+            for i in input_list
+        ]
     
     # if id is coordinates #
     elif len(input_list) % 3 == 0:
@@ -363,7 +470,7 @@ def nucToRoot(nuc_id, config={}):
     )
 
     # sets materilaization version #
-    mat_vers = max(client.materialize.get_versions())
+    mat_vers = materialization.getLatestVersion(config)
 
     # queries nucleus table #
     nuc_df = client.materialize.query_table(
@@ -410,103 +517,62 @@ def portUrl(input_ids, app_choice, config={}):
 def rootListToDataFrame(root_list, config={}):
     """Use root ids to produce output dataframe.
 
+    Nucleus, cell type, and freshness lookups are made once for the whole
+    list and change logs are fetched concurrently, so the table is built
+    column by column instead of row by row. Ids that can't be looked up get
+    a row of "BAD ID" values.
+
     Keyword arguments:
     root list -- input root ids (list of ints)
     config -- config settings (dict, default {})
     """
 
-    # sets client #
-    client = lookup_utilities.make_client(
-        config.get("datastack", None), config.get("server_address", None)
-    )
-    
-    # creates blank output dataframe #
-    output_df = pd.DataFrame(
-        columns=[
-            "Root ID",
-            "Nuc ID",
-            "Nucleus Coordinates",
-            "Splits",
-            "Merges",
-            "Total Edits",
-            "Editors",
-            "Cell Identification",
-            "Current",
-        ]
-    )
-    
     # gets resolution of volume (important for nucleus coordinates)
     res = getResolution()
-    
-    import time
 
-    # generates df row and adds to output df for each root id #
-    for i in root_list:
+    # checks freshness of every id at once, None for ids that can't be checked #
+    freshness_dict = id_resolution.checkFreshnessBulk(
+        [i for i in root_list if str(i).isnumeric()], config
+    )
+    # looks up each id once, however many times it was entered #
+    good_list = list(
+        dict.fromkeys(
+            int(i)
+            for i in root_list
+            if str(i).isnumeric() and freshness_dict.get(int(i), None) is not None
+        )
+    )
+
+    # looks up nuclei, cell types, and edits of every good id #
+    if len(good_list) > 0:
+        mat_vers = materialization.getLatestVersion(config)
+        nuc_df, nuc_failed = getNucs(good_list, res, mat_vers, config)
+        type_dict, type_failed = getTypes(good_list, mat_vers, config)
+        edit_df = getEditStats(good_list, config)
+        good_list = [i for i in good_list if i not in nuc_failed | type_failed]
+    else:
+        nuc_df = pd.DataFrame(columns=["Root ID", "Nuc ID", "Nucleus Coordinates"])
+        type_dict = {}
+        edit_df = pd.DataFrame(columns=["Root ID"])
+
+    # keeps a row per input position in input order, with a row per nucleus #
+    # and n/a for segments without nuclei #
+    order_df = pd.DataFrame(
+        {"Root ID": [str(i) for i in root_list], "order": range(len(root_list))}
+    )
+    good_df = order_df[order_df["Root ID"].isin([str(i) for i in good_list])]
+    good_df = good_df.merge(nuc_df, on="Root ID", how="left").fillna("n/a")
+    good_df = good_df.merge(edit_df, on="Root ID", how="left")
+    good_df["Cell Identification"] = [
+        type_dict[int(i)] for i in good_df["Root ID"]
+    ]
+    good_df["Current"] = [freshness_dict[int(i)] for i in good_df["Root ID"]]
 
-        # try to form df, otherwise default to bad id behavior #
-        try:
-            # sets freshness to T/F to check for outdated ids #
-            freshness = checkFreshness(i, config)
-            
-            # tries to make df using changelog #
-            try:
-                change_df = pd.DataFrame(
-                    client.chunkedgraph.get_tabular_change_log(i)[i]
-                )
-                edits_dict = change_df["is_merge"].value_counts().to_dict()
-                if True not in edits_dict:
-                    edits_dict[True] = 0
-                if False not in edits_dict:
-                    edits_dict[False] = 0
-                proofreader_list = np.unique(change_df["user_id"])
-                proofreaders = ", ".join([str(i) for i in proofreader_list])
-
-            # handles cases with no edits #
-            except:
-                change_df = pd.DataFrame()
-                edits_dict = {True: 0, False: 0}
-                proofreaders = "n/a"
-
-            # gets nucleus information #
-            row_df = getNuc(i, res, config)
-
-            # handles segments without nuclei #
-            if row_df.empty:
-                row_df = pd.DataFrame(
-                    {"Root ID": i, "Nuc ID": "n/a", "Nucleus Coordinates": "n/a",},
-                    index=[0],
-                ).astype(str)
-
-            # queries cell type table to get all tags for each id #
-            types = getTypes(i, config)
-
-            # builds df columns #
-            row_df["Splits"] = str(edits_dict[False])
-            row_df["Merges"] = str(edits_dict[True])
-            row_df["Total Edits"] = str(len(change_df))
-            row_df["Editors"] = proofreaders
-            row_df["Cell Identification"] = types
-            row_df["Current"] = freshness[0]
-
-
-        # handles bad ids #
-        except:
-            row_df = pd.DataFrame(
-                {
-                    "Root ID": i,
-                    "Nuc ID": "BAD ID",
-                    "Nucleus Coordinates": "BAD ID",
-                    "Splits": "BAD ID",
-                    "Merges": "BAD ID",
-                    "Total Edits": "BAD ID",
-                    "Editors": "BAD ID",
-                    "Cell Identification": "BAD ID",
-                    "Current": "BAD ID",
-                },
-                index=[0],
-            ).astype(str)
-
-        # adds row to output df for the results of each id #
-        output_df = pd.concat([output_df, row_df])    
-
-    return output_df
+    # fills every column of bad ids with "BAD ID" #
+    bad_df = order_df[~order_df["Root ID"].isin(good_df["Root ID"])]
+    bad_df = bad_df.assign(**{x: "BAD ID" for x in SUMMARY_COLUMNS[1:]})
+
+    output_df = pd.concat([good_df, bad_df], ignore_index=True)
+    output_df = output_df.sort_values("order", kind="stable")
+
+    return output_df[SUMMARY_COLUMNS].reset_index(drop=True)